@@ -0,0 +1,3 @@
+"""
+性能测试脚本，在项目根目录下以 python -m benchmarks.xxx 的方式运行
+"""
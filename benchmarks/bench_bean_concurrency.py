@@ -0,0 +1,116 @@
+"""
+多个工作线程同时读写豆子数据库时的吞吐量，以及有写入时读操作的耗时
+
+示例：
+    python -m benchmarks.bench_bean_concurrency
+    python -m benchmarks.bench_bean_concurrency --workers 1,2,4,8 --users 100000 --seconds 3
+"""
+import argparse
+import os
+import random
+import threading
+import time
+from benchmarks.common import save_results
+from benchmarks.run_benchmarks import BENCH_DIRECTORY, populate
+from utils import bean_actions
+from utils.bean_actions import BeanManager
+
+
+def run_workers(num_workers, seconds, operation):
+    """
+    启动 num_workers 个线程在 seconds 秒内不断调用 operation，返回每秒完成的操作数
+
+    Args:
+        num_workers (int): 线程数。
+        seconds (float): 运行时长（秒）。
+        operation (callable): 被测操作，参数为线程内的 random.Random。
+    """
+    counts = [0] * num_workers
+    start_event = threading.Event()
+    stop_time = [0.0]
+
+    def worker(index):
+        rng = random.Random(index)
+        start_event.wait()
+        count = 0
+        while time.perf_counter() < stop_time[0]:
+            operation(rng)
+            count += 1
+        counts[index] = count
+
+    threads = [threading.Thread(target=worker, args=(i,)) for i in range(num_workers)]
+    for thread in threads:
+        thread.start()
+    start = time.perf_counter()
+    stop_time[0] = start + seconds
+    start_event.set()
+    for thread in threads:
+        thread.join()
+    return sum(counts) / (time.perf_counter() - start)
+
+
+def read_latency_under_writes(bean_manager, num_users, seconds):
+    """
+    一个线程持续写入时，另一个线程读取豆子数量的平均和最大耗时（微秒）
+    """
+    stop = threading.Event()
+
+    def writer():
+        rng = random.Random(0)
+        while not stop.is_set():
+            bean_manager.add_beans(f'user_{rng.randrange(num_users)}', 1)
+
+    thread = threading.Thread(target=writer)
+    thread.start()
+    rng = random.Random(1)
+    timings = []
+    deadline = time.perf_counter() + seconds
+    while time.perf_counter() < deadline:
+        start = time.perf_counter()
+        bean_manager.get_bean_count(f'user_{rng.randrange(num_users)}')
+        timings.append(time.perf_counter() - start)
+    stop.set()
+    thread.join()
+    return {'mean_us': sum(timings) / len(timings) * 1e6, 'max_us': max(timings) * 1e6}
+
+
+def main():
+    """
+    按线程数运行读、写和混合负载并输出结果
+    """
+    parser = argparse.ArgumentParser(description='BeanManager 并发吞吐量测试')
+    parser.add_argument('--workers', default='1,2,4,8', help='逗号分隔的线程数')
+    parser.add_argument('--users', type=int, default=100000, help='数据库中的用户数')
+    parser.add_argument('--seconds', type=float, default=2.0, help='每项测试的时长（秒）')
+    parser.add_argument('--output', help='结果保存路径，默认保存到 benchmarks/results')
+    args = parser.parse_args()
+
+    bean_actions.DB_PATH = os.path.join(BENCH_DIRECTORY, 'beans.db')
+    db_path = os.path.join(BENCH_DIRECTORY, f'beans_concurrency_{args.users}.db')
+    bean_manager = populate(db_path, args.users)
+    num_users = args.users
+
+    operations = {
+        'read': lambda rng: bean_manager.get_bean_count(f'user_{rng.randrange(num_users)}'),
+        'write': lambda rng: bean_manager.add_beans(f'user_{rng.randrange(num_users)}', 1),
+        # 九成读一成写，接近实际的命令组合
+        'mixed': lambda rng: (bean_manager.add_beans(f'user_{rng.randrange(num_users)}', 1)
+                              if rng.random() < 0.1 else
+                              bean_manager.get_bean_count(f'user_{rng.randrange(num_users)}')),
+    }
+    results = {}
+    for name, operation in operations.items():
+        for num_workers in (int(value) for value in args.workers.split(',')):
+            ops_per_sec = run_workers(num_workers, args.seconds, operation)
+            results[f'{name}[{num_workers}]'] = {'workers': num_workers, 'ops_per_sec': ops_per_sec}
+            print(f"{name:<6} {num_workers} 线程：{ops_per_sec:10.0f} 次/秒")
+    results['read_under_writes'] = read_latency_under_writes(bean_manager, num_users, args.seconds)
+    print("写入时读取：平均 {mean_us:.1f}us，最大 {max_us:.1f}us".format(**results['read_under_writes']))
+    bean_manager.close_connection()
+
+    path = save_results('bean_concurrency', results, args.output)
+    print(f"结果已保存到 {path}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,83 @@
+"""
+不同存储后端（单个 SQLite 文件、分片 SQLite、内存）的读写吞吐量和排行榜查询耗时对比
+
+示例：
+    python -m benchmarks.bench_bean_store
+    python -m benchmarks.bench_bean_store --backends sqlite,sharded --shards 8 --workers 1,8 --group-commit
+"""
+import argparse
+import os
+import random
+import time
+from benchmarks.bench_bean_concurrency import run_workers
+from benchmarks.bench_group_commit import run_bets
+from benchmarks.common import measure, save_results
+from benchmarks.run_benchmarks import BENCH_DIRECTORY, populate
+from utils import bean_actions
+
+
+def bench_backend(backend, num_users, workers, seconds, number):
+    """
+    测试一个存储后端，返回 {测试名称: 结果}
+    """
+    bean_actions.BACKEND = backend
+    db_path = os.path.join(BENCH_DIRECTORY, f'beans_store_{backend}_{num_users}.db')
+    bean_manager = populate(db_path, num_users)
+    store = bean_manager.store
+    users = [f'user_{random.randrange(num_users)}' for _ in range(number)]
+    results = {}
+    for num_workers in workers:
+        result = run_bets(bean_manager, num_users, num_workers, seconds)
+        results[f'write[{backend},{num_workers}]'] = result
+        # 直接读存储后端，不经过 BeanManager 的缓存
+        ops_per_sec = run_workers(num_workers, seconds,
+                                  lambda rng: store.get_balance(f'user_{rng.randrange(num_users)}'))
+        results[f'read[{backend},{num_workers}]'] = {'workers': num_workers, 'ops_per_sec': ops_per_sec}
+        print(f"{backend:<8} {num_workers:>2} 线程：写 {result['ops_per_sec']:8.0f} 次/秒"
+              f"（p99 {result['p99_us']:8.1f}us），读 {ops_per_sec:8.0f} 次/秒")
+    results[f'get_balance[{backend}]'] = measure(lambda i: store.get_balance(users[i % number]), number)
+    results[f'get_top_users[{backend}]'] = measure(lambda i: bean_manager.get_top_users(10), min(number, 20),
+                                                   warmup=1)
+    # 第一次查询名次时加载排名索引
+    start = time.perf_counter()
+    bean_manager.get_user_total()
+    results[f'load_rank_index[{backend}]'] = {'seconds': time.perf_counter() - start}
+    last_user = bean_manager.get_users_by_rank(num_users // 2, 1)[0]
+    results[f'get_top_users_after[{backend}]'] = measure(
+        lambda i: bean_manager.get_top_users(10, after=(last_user[1], last_user[2])), number)
+    for name in (f'get_balance[{backend}]', f'get_top_users[{backend}]', f'get_top_users_after[{backend}]'):
+        print(f"{name}: 平均 {results[name]['mean_us']:.1f}us，p99 {results[name]['p99_us']:.1f}us")
+    print(f"load_rank_index[{backend}]: {results[f'load_rank_index[{backend}]']['seconds']:.3f}s")
+    bean_manager.close_connection()
+    return results
+
+
+def main():
+    """
+    依次测试每个存储后端并输出结果
+    """
+    parser = argparse.ArgumentParser(description='豆子存储后端性能对比')
+    parser.add_argument('--backends', default=','.join(bean_actions.BACKENDS), help='逗号分隔的存储后端')
+    parser.add_argument('--shards', type=int, default=bean_actions.NUM_SHARDS, help='分片后端的分片数量')
+    parser.add_argument('--workers', default='1,8', help='逗号分隔的线程数')
+    parser.add_argument('--users', type=int, default=100000, help='每个后端中的用户数')
+    parser.add_argument('--seconds', type=float, default=2.0, help='每项吞吐量测试的时长（秒）')
+    parser.add_argument('--number', type=int, default=1000, help='每项耗时测试的调用次数')
+    parser.add_argument('--group-commit', action='store_true', help='SQLite 后端使用组提交')
+    parser.add_argument('--output', help='结果保存路径，默认保存到 benchmarks/results')
+    args = parser.parse_args()
+
+    os.makedirs(BENCH_DIRECTORY, exist_ok=True)
+    bean_actions.NUM_SHARDS = args.shards
+    bean_actions.GROUP_COMMIT = args.group_commit
+    workers = [int(value) for value in args.workers.split(',')]
+    results = {}
+    for backend in args.backends.split(','):
+        results.update(bench_backend(backend, args.users, workers, args.seconds, args.number))
+
+    path = save_results('bean_store', results, args.output)
+    print(f"结果已保存到 {path}")
+
+
+if __name__ == '__main__':
+    main()
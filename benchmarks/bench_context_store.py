@@ -0,0 +1,97 @@
+"""
+聊天上下文存储的每轮对话耗时，以及快照的大小和保存、读取耗时
+
+示例：
+    python -m benchmarks.bench_context_store
+    python -m benchmarks.bench_context_store --users 100000 --turns 10
+"""
+import argparse
+import os
+import random
+import tempfile
+import time
+from benchmarks.common import measure, save_results
+from utils.context_store import ContextStore
+
+MAX_WINDOWS = 5
+
+
+def list_context_turn(user_contexts, username, user_message, ai_reply, max_users):
+    """
+    原来的做法：字典按创建顺序淘汰用户，每轮对话切片复制列表
+    """
+    if username not in user_contexts:
+        if len(user_contexts) >= max_users:
+            del user_contexts[next(iter(user_contexts))]
+        user_contexts[username] = []
+    user_context = user_contexts[username]
+    user_context.append({'role': 'user', 'content': user_message})
+    if len(user_context) > MAX_WINDOWS * 2:
+        user_context = user_context[-MAX_WINDOWS * 2:]
+    user_contexts[username] = user_context
+    messages = list(user_context)
+    user_context.append({'role': 'assistant', 'content': ai_reply})
+    if len(user_context) > MAX_WINDOWS * 2:
+        user_context = user_context[-MAX_WINDOWS * 2:]
+    user_contexts[username] = user_context
+    return messages
+
+
+def store_turn(store, username, user_message, ai_reply):
+    store.add_message(username, 'user', user_message)
+    messages = store.get_messages(username)
+    store.add_message(username, 'assistant', ai_reply)
+    return messages
+
+
+def main():
+    """
+    填充上下文后测试每轮对话的耗时和快照
+    """
+    parser = argparse.ArgumentParser(description='聊天上下文存储性能测试')
+    parser.add_argument('--users', type=int, default=10000, help='用户数')
+    parser.add_argument('--turns', type=int, default=5, help='每个用户填充的对话轮数')
+    parser.add_argument('--number', type=int, default=10000, help='每项耗时测试的调用次数')
+    parser.add_argument('--output', help='结果保存路径，默认保存到 benchmarks/results')
+    args = parser.parse_args()
+
+    rng = random.Random(0)
+    user_message = '今天天气怎么样？' * 4
+    ai_reply = '今天天气晴朗，适合出门散步。' * 8
+    user_contexts = {}
+    store = ContextStore(max_messages=MAX_WINDOWS * 2, max_bytes=1 << 40)
+    for _ in range(args.turns):
+        for index in range(args.users):
+            list_context_turn(user_contexts, f'user_{index}', user_message, ai_reply, args.users)
+            store_turn(store, f'user_{index}', user_message, ai_reply)
+    users = [f'user_{rng.randrange(args.users)}' for _ in range(args.number)]
+
+    results = {
+        'turn[list]': measure(lambda i: list_context_turn(user_contexts, users[i % args.number], user_message,
+                                                          ai_reply, args.users), args.number),
+        'turn[store]': measure(lambda i: store_turn(store, users[i % args.number], user_message, ai_reply),
+                               args.number),
+    }
+    for name in ('turn[list]', 'turn[store]'):
+        print(f"{name}: 平均 {results[name]['mean_us']:.1f}us，p99 {results[name]['p99_us']:.1f}us")
+
+    path = os.path.join(tempfile.gettempdir(), 'bench_chat_contexts.bin')
+    start = time.perf_counter()
+    size = store.save(path)
+    save_seconds = time.perf_counter() - start
+    start = time.perf_counter()
+    loaded = ContextStore(max_messages=MAX_WINDOWS * 2, max_bytes=1 << 40)
+    loaded.load(path)
+    load_seconds = time.perf_counter() - start
+    os.remove(path)
+    results['snapshot'] = {'users': args.users, 'estimated_bytes': store.size, 'file_bytes': size,
+                           'save_seconds': save_seconds, 'load_seconds': load_seconds}
+    print(f"快照：{args.users} 个用户，内存估算 {store.size / 1024 / 1024:.1f}MB，文件 {size / 1024:.1f}KB，"
+          f"保存 {save_seconds:.3f}s，读取 {load_seconds:.3f}s")
+
+    path = save_results('context_store', results, args.output)
+    print(f"结果已保存到 {path}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,95 @@
+"""
+高频下注时逐次提交与组提交的写入吞吐量和单次耗时对比
+
+示例：
+    python -m benchmarks.bench_group_commit
+    python -m benchmarks.bench_group_commit --workers 1,8,32 --seconds 3
+"""
+import argparse
+import os
+import random
+import threading
+import time
+from benchmarks.common import save_results
+from benchmarks.run_benchmarks import BENCH_DIRECTORY, populate
+from utils import bean_actions
+
+
+def run_bets(bean_manager, num_users, num_workers, seconds, wait=True):
+    """
+    num_workers 个线程模拟下注和结算，每局扣除押注后返还奖金
+
+    wait 为 False 时不等待提交完成（只在组提交模式下有区别），结束时等待所有写操作提交。
+
+    Returns:
+        dict: 每秒写操作数和单次写操作耗时的 p50、p99（微秒）。
+    """
+    timings = [[] for _ in range(num_workers)]
+    start_event = threading.Event()
+    stop_time = [0.0]
+
+    def worker(index):
+        rng = random.Random(index)
+        futures = []
+        start_event.wait()
+        while time.perf_counter() < stop_time[0]:
+            username = f'user_{rng.randrange(num_users)}'
+            for amount in (-100, 200):
+                start = time.perf_counter()
+                result = bean_manager.add_beans(username, amount, wait=wait)
+                timings[index].append(time.perf_counter() - start)
+                if not wait:
+                    futures.append(result)
+        for future in futures:
+            future.result()
+
+    threads = [threading.Thread(target=worker, args=(i,)) for i in range(num_workers)]
+    for thread in threads:
+        thread.start()
+    start = time.perf_counter()
+    stop_time[0] = start + seconds
+    start_event.set()
+    for thread in threads:
+        thread.join()
+    elapsed = time.perf_counter() - start
+    all_timings = sorted(timing for worker_timings in timings for timing in worker_timings)
+    return {
+        'ops_per_sec': len(all_timings) / elapsed,
+        'p50_us': all_timings[len(all_timings) // 2] * 1e6,
+        'p99_us': all_timings[min(len(all_timings) - 1, int(len(all_timings) * 0.99))] * 1e6,
+    }
+
+
+def main():
+    """
+    在不同同步级别和线程数下分别测试逐次提交和组提交
+    """
+    parser = argparse.ArgumentParser(description='组提交性能测试')
+    parser.add_argument('--workers', default='1,8,32', help='逗号分隔的线程数')
+    parser.add_argument('--users', type=int, default=10000, help='数据库中的用户数')
+    parser.add_argument('--seconds', type=float, default=2.0, help='每项测试的时长（秒）')
+    parser.add_argument('--synchronous', default='NORMAL,FULL', help='逗号分隔的磁盘同步级别')
+    parser.add_argument('--output', help='结果保存路径，默认保存到 benchmarks/results')
+    args = parser.parse_args()
+
+    db_path = os.path.join(BENCH_DIRECTORY, f'beans_group_commit_{args.users}.db')
+    results = {}
+    for synchronous in args.synchronous.split(','):
+        bean_actions.SYNCHRONOUS = synchronous
+        # 逐次提交、组提交并等待提交完成、组提交不等待（写后即返回）
+        for mode, group_commit, wait in (('per_op', False, True), ('group', True, True), ('behind', True, False)):
+            bean_actions.GROUP_COMMIT = group_commit
+            bean_manager = populate(db_path, args.users)
+            for num_workers in (int(value) for value in args.workers.split(',')):
+                result = run_bets(bean_manager, args.users, num_workers, args.seconds, wait)
+                results[f'{mode}[{synchronous},{num_workers}]'] = result
+                print(f"{mode:<6} {synchronous:<6} {num_workers:>2} 线程：{result['ops_per_sec']:8.0f} 次/秒，"
+                      f"p50 {result['p50_us']:8.1f}us，p99 {result['p99_us']:8.1f}us")
+            bean_manager.close_connection()
+
+    path = save_results('group_commit', results, args.output)
+    print(f"结果已保存到 {path}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,50 @@
+"""
+对比群消息中获取自己昵称并去除 @ 信息的耗时：
+每条消息调用 itchat.search_friends() 与使用缓存的 SelfProfile
+"""
+import timeit
+import itchat
+from utils.self_profile import SelfProfile
+
+# 与网页微信登录后返回的自己的账号信息结构相同
+MY_PROFILE = {
+    'UserName': '@0f3a6d5c8e1b4b3f9d2a7c6e5b4a3f2e1d0c9b8a7f6e5d4c3b2a1f0e9d8c7b6a',
+    'NickName': '豆子机器人',
+    'HeadImgUrl': '/cgi-bin/mmwebwx-bin/webwxgeticon?seq=123456789&username=@0f3a6d&skey=@crypt_abc',
+    'ContactFlag': 0, 'MemberCount': 0, 'MemberList': [], 'RemarkName': '', 'HideInputBarFlag': 0,
+    'Sex': 0, 'Signature': '每周记得来领豆子', 'VerifyFlag': 0, 'OwnerUin': 0, 'PYInitial': 'DZJQR',
+    'PYQuanPin': 'douzijiqiren', 'RemarkPYInitial': '', 'RemarkPYQuanPin': '', 'StarFriend': 0,
+    'AppAccountFlag': 0, 'Statues': 0, 'AttrStatus': 0, 'Province': '', 'City': '', 'Alias': '',
+    'SnsFlag': 17, 'UniFriend': 0, 'DisplayName': '', 'ChatRoomId': 0, 'KeyWord': '',
+    'EncryChatRoomId': '', 'IsOwner': 0, 'WebWxPluginSwitch': 0, 'HeadImgFlag': 1,
+}
+CONTENT = '@豆子机器人 下注 闲 押1000'
+NUMBER = 100000
+
+
+def legacy_strip():
+    """
+    旧实现：每条消息查询一次自己的昵称
+    """
+    my_nickname = itchat.search_friends()['NickName']
+    return CONTENT.replace(f'@{my_nickname}', '').strip()
+
+
+def main():
+    """
+    运行测试并输出每条消息的平均耗时
+    """
+    itchat.originInstance.storageClass.memberList.append(MY_PROFILE)
+    profile = SelfProfile()
+    profile.refresh(itchat.search_friends())
+
+    assert legacy_strip() == profile.strip_mention(CONTENT) == '下注 闲 押1000'
+    legacy_time = timeit.timeit(legacy_strip, number=NUMBER)
+    cached_time = timeit.timeit(lambda: profile.strip_mention(CONTENT), number=NUMBER)
+    print(f"search_friends + replace：{legacy_time / NUMBER * 1e6:.2f} us/条")
+    print(f"SelfProfile.strip_mention：{cached_time / NUMBER * 1e6:.2f} us/条")
+    print(f"加速 {legacy_time / cached_time:.1f} 倍")
+
+
+if __name__ == '__main__':
+    main()
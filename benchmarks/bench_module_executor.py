@@ -0,0 +1,107 @@
+"""
+不同执行方式下计算型模块的吞吐量，以及模块卡住时超时回复和恢复的耗时
+
+示例：
+    python -m benchmarks.bench_module_executor
+    python -m benchmarks.bench_module_executor --workers 1,5 --work 200000 --seconds 3
+"""
+import argparse
+import os
+import shutil
+import tempfile
+import time
+from benchmarks.bench_bean_concurrency import run_workers
+from benchmarks.common import save_results
+from utils.module_executor import ModuleExecutor
+from utils.scan_module import ModuleScanner
+
+# 生成的功能模块，process_messages 做 work 次循环模拟计算，内容为“卡住”时睡眠模拟卡住的调用
+MODULE_TEMPLATE = '''import time
+
+
+class FunctionModule:
+    _instance = None
+    _command_sign = ["{policy}"]
+    is_active = True
+    execution_policy = "{policy}"
+    timeout = {timeout}
+    fallback_reply = "超时"
+
+    def __new__(cls):
+        if cls._instance is None:
+            cls._instance = super(FunctionModule, cls).__new__(cls)
+        return cls._instance
+
+    def get_command_sign(self):
+        return self._command_sign
+
+    def process_messages(self, sender_nickname, content):
+        if content == "卡住":
+            time.sleep(3600)
+        total = 0
+        for i in range({work}):
+            total += i * i
+        return str(total)
+
+    @staticmethod
+    def get_simple_description():
+        return "计算"
+'''
+
+POLICIES = ('inline', 'thread', 'process')
+
+
+def main():
+    """
+    分别测试三种执行方式的吞吐量，以及 thread 和 process 方式卡住后的恢复
+    """
+    parser = argparse.ArgumentParser(description='功能模块执行方式测试')
+    parser.add_argument('--workers', default='1,5', help='逗号分隔的并发调用线程数，机器人默认 5 个工作线程')
+    parser.add_argument('--work', type=int, default=100000, help='每次调用的循环次数')
+    parser.add_argument('--seconds', type=float, default=2.0, help='每项吞吐量测试的时长（秒）')
+    parser.add_argument('--timeout', type=float, default=0.5, help='模块调用的期限（秒）')
+    parser.add_argument('--output', help='结果保存路径，默认保存到 benchmarks/results')
+    args = parser.parse_args()
+
+    directory = tempfile.mkdtemp(prefix='wechatbot_executor_')
+    modules_path = os.path.join(directory, 'module')
+    os.makedirs(modules_path)
+    for policy in POLICIES:
+        with open(os.path.join(modules_path, f'{policy}.py'), 'w', encoding='utf-8') as f:
+            f.write(MODULE_TEMPLATE.format(policy=policy, timeout=args.timeout, work=args.work))
+    workers = [int(value) for value in args.workers.split(',')]
+    executor = ModuleExecutor(process_workers=max(workers))
+    results = {}
+    try:
+        modules, _ = ModuleScanner(modules_path, os.path.join(directory, 'data')).scan()
+        for policy in POLICIES:
+            module = modules[policy]
+            # 预热，process 方式等待子进程导入模块
+            executor.call(module, 'process_messages', 'bench', '计算')
+            for num_workers in workers:
+                calls_per_sec = run_workers(num_workers, args.seconds,
+                                            lambda _: executor.call(module, 'process_messages', 'bench', '计算'))
+                results[f'throughput[{policy},{num_workers}]'] = {'workers': num_workers,
+                                                                  'calls_per_sec': calls_per_sec}
+                print(f"{policy:<8} {num_workers:>2} 线程：{calls_per_sec:8.1f} 次/秒")
+        for policy in ('thread', 'process'):
+            module = modules[policy]
+            start = time.perf_counter()
+            reply = executor.call(module, 'process_messages', 'bench', '卡住')
+            fallback_seconds = time.perf_counter() - start
+            start = time.perf_counter()
+            executor.call(module, 'process_messages', 'bench', '计算')
+            recover_seconds = time.perf_counter() - start
+            results[f'hang[{policy}]'] = {'reply': reply, 'fallback_seconds': fallback_seconds,
+                                          'next_call_seconds': recover_seconds}
+            print(f"{policy:<8} 卡住：{fallback_seconds:.3f}s 后回复“{reply}”，之后的调用耗时 {recover_seconds:.3f}s")
+    finally:
+        executor.close()
+        shutil.rmtree(directory)
+
+    path = save_results('module_executor', results, args.output)
+    print(f"结果已保存到 {path}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,97 @@
+"""
+功能模块数量增加时启动扫描的耗时：没有模块清单（第一次启动）和有模块清单（之后的重启）两种情况
+
+示例：
+    python -m benchmarks.bench_startup
+    python -m benchmarks.bench_startup --modules 10,100,1000 --import-ms 5
+"""
+import argparse
+import os
+import shutil
+import tempfile
+import time
+from benchmarks.common import save_results
+from utils.scan_module import get_command_module_dict
+
+# 生成的功能模块，导入时睡眠 import_ms 毫秒模拟导入依赖库的耗时
+MODULE_TEMPLATE = '''import time
+time.sleep({import_seconds})
+
+
+class FunctionModule:
+    _instance = None
+    _command_sign = ["命令{index}", "command{index}"]
+    is_active = True
+
+    def __new__(cls):
+        if cls._instance is None:
+            cls._instance = super(FunctionModule, cls).__new__(cls)
+        return cls._instance
+
+    def get_command_sign(self):
+        return self._command_sign
+
+    def process_messages(self, sender_nickname, content):
+        return "模块{index}"
+
+    @staticmethod
+    def get_simple_description():
+        return "生成的模块{index}"
+
+    @staticmethod
+    def get_detail_description():
+        return "生成的模块{index}"
+'''
+
+
+def generate_modules(directory, count, import_ms):
+    """
+    在 directory 下生成 count 个功能模块
+    """
+    os.makedirs(directory)
+    for index in range(count):
+        with open(os.path.join(directory, f'generated_{index}.py'), 'w', encoding='utf-8') as f:
+            f.write(MODULE_TEMPLATE.format(index=index, import_seconds=import_ms / 1000))
+
+
+def timed_scan(modules_path, data_dir):
+    start = time.perf_counter()
+    command_module_dict = get_command_module_dict(modules_path, data_dir)
+    return time.perf_counter() - start, command_module_dict
+
+
+def main():
+    """
+    按模块数量分别测试第一次启动、重启和第一次使用模块的耗时
+    """
+    parser = argparse.ArgumentParser(description='模块扫描启动耗时测试')
+    parser.add_argument('--modules', default='10,100,500', help='逗号分隔的模块数量')
+    parser.add_argument('--import-ms', type=float, default=2.0, help='每个模块导入时的模拟耗时（毫秒）')
+    parser.add_argument('--output', help='结果保存路径，默认保存到 benchmarks/results')
+    args = parser.parse_args()
+
+    results = {}
+    for count in (int(value) for value in args.modules.split(',')):
+        directory = tempfile.mkdtemp(prefix='wechatbot_startup_')
+        try:
+            modules_path = os.path.join(directory, 'module')
+            data_dir = os.path.join(directory, 'data')
+            generate_modules(modules_path, count, args.import_ms)
+            cold, _ = timed_scan(modules_path, data_dir)
+            warm, command_module_dict = timed_scan(modules_path, data_dir)
+            start = time.perf_counter()
+            command_module_dict['命令0'].process_messages('bench', '命令0')
+            first_use = time.perf_counter() - start
+        finally:
+            shutil.rmtree(directory)
+        results[f'scan[{count}]'] = {'modules': count, 'cold_ms': cold * 1000, 'warm_ms': warm * 1000,
+                                     'first_use_ms': first_use * 1000}
+        print(f"{count:>5} 个模块：第一次启动 {cold * 1000:9.1f}ms，重启 {warm * 1000:7.1f}ms，"
+              f"第一次使用模块 {first_use * 1000:5.1f}ms")
+
+    path = save_results('startup', results, args.output)
+    print(f"结果已保存到 {path}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,100 @@
+"""
+性能测试的公共方法：计时、保存和对比结果
+"""
+import json
+import os
+import platform
+import subprocess
+import time
+
+RESULTS_DIRECTORY = os.path.join('.', 'benchmarks', 'results')
+
+
+def measure(func, number=1000, warmup=10):
+    """
+    重复调用 func 并统计每次调用的耗时
+
+    Args:
+        func (callable): 被测函数，参数为本次调用的序号。
+        number (int): 调用次数。
+        warmup (int): 正式计时前的预热次数。
+
+    Returns:
+        dict: 调用次数、平均值、p50、p99、最大值（微秒）和每秒调用次数。
+    """
+    for index in range(warmup):
+        func(index)
+    timings = []
+    for index in range(number):
+        start = time.perf_counter()
+        func(index)
+        timings.append(time.perf_counter() - start)
+    timings.sort()
+    total = sum(timings)
+    return {
+        'number': number,
+        'mean_us': total / number * 1e6,
+        'p50_us': timings[number // 2] * 1e6,
+        'p99_us': timings[min(number - 1, int(number * 0.99))] * 1e6,
+        'max_us': timings[-1] * 1e6,
+        'ops_per_sec': number / total if total > 0 else 0.0,
+    }
+
+
+def get_commit():
+    """
+    返回当前 git 提交的短哈希，获取失败时返回 unknown
+    """
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True,
+                              text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return 'unknown'
+
+
+def save_results(suite, results, output_path=None):
+    """
+    把测试结果和运行环境保存为 JSON，默认保存到 benchmarks/results/<测试名>-<提交>.json
+
+    Returns:
+        str: 保存的文件路径。
+    """
+    commit = get_commit()
+    if output_path is None:
+        os.makedirs(RESULTS_DIRECTORY, exist_ok=True)
+        output_path = os.path.join(RESULTS_DIRECTORY, f'{suite}-{commit}.json')
+    data = {
+        'suite': suite,
+        'commit': commit,
+        'time': time.strftime('%Y-%m-%d %H:%M:%S'),
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'results': results,
+    }
+    with open(output_path, 'w', encoding='utf-8') as f:
+        json.dump(data, f, ensure_ascii=False, indent=4)
+    return output_path
+
+
+def compare_results(baseline_path, results, threshold=0.1):
+    """
+    与之前保存的结果对比平均耗时，输出变化超过阈值的测试项
+
+    Args:
+        baseline_path (str): 之前保存的 JSON 文件。
+        results (dict): 本次的测试结果。
+        threshold (float): 变化比例超过该值时标记为变快或变慢。
+    """
+    with open(baseline_path, 'r', encoding='utf-8') as f:
+        baseline = json.load(f)['results']
+    for name, result in results.items():
+        if name not in baseline or not baseline[name].get('mean_us'):
+            continue
+        ratio = result['mean_us'] / baseline[name]['mean_us']
+        if ratio > 1 + threshold:
+            mark = '变慢'
+        elif ratio < 1 - threshold:
+            mark = '变快'
+        else:
+            mark = '持平'
+        print(f"{name}: {baseline[name]['mean_us']:.1f}us -> {result['mean_us']:.1f}us ({ratio:.2f}x {mark})")
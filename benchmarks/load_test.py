@@ -0,0 +1,74 @@
+"""
+使用模拟微信对机器人进行离线压测，输出吞吐量和端到端延迟
+
+示例：
+    python -m benchmarks.load_test --dispatch-mode async --rate 500 --duration 20
+    python -m benchmarks.load_test --mix '查豆子=1,聊天 你好=1' --mock-llm-latency 2
+"""
+import argparse
+import json
+import os
+import tempfile
+from benchmarks.mock_openai import start_mock_server
+from main import WeChatBot
+from utils import bean_actions
+from utils.wechat_simulator import SimulatedTransport, DEFAULT_COMMAND_MIX
+
+
+def parse_command_mix(text):
+    """
+    解析“查豆子=3,随机数=1”格式的命令组合
+    """
+    if not text:
+        return dict(DEFAULT_COMMAND_MIX)
+    command_mix = {}
+    for item in text.split(','):
+        command, _, weight = item.rpartition('=')
+        command_mix[command] = float(weight)
+    return command_mix
+
+
+def main():
+    """
+    解析参数并运行压测
+    """
+    parser = argparse.ArgumentParser(description='模拟微信压测')
+    parser.add_argument('--dispatch-mode', choices=['thread', 'async'], default='thread')
+    parser.add_argument('--friends', type=int, default=1000, help='虚拟好友数量')
+    parser.add_argument('--groups', type=int, default=100, help='虚拟群数量')
+    parser.add_argument('--members', type=int, default=50, help='每个群的成员数量')
+    parser.add_argument('--group-ratio', type=float, default=0.5, help='群消息比例')
+    parser.add_argument('--rate', type=float, default=200, help='每秒消息数')
+    parser.add_argument('--duration', type=float, default=10, help='发送时长（秒）')
+    parser.add_argument('--mix', default='', help="命令组合，如'查豆子=3,聊天 你好=1'")
+    parser.add_argument('--seed', type=int, default=0, help='随机数种子，相同种子产生相同的负载')
+    parser.add_argument('--db-path', default=os.path.join(tempfile.gettempdir(), 'load_test_beans.db'),
+                        help='压测使用的豆子数据库，避免污染正式数据')
+    parser.add_argument('--mock-llm-latency', type=float,
+                        help='聊天模块连接本地模拟接口，每个请求的延迟（秒），不设置时使用真实接口')
+    parser.add_argument('--mock-llm-jitter', type=float, default=0.0, help='模拟接口的随机延迟上限（秒）')
+    args = parser.parse_args()
+
+    # 在创建 BeanManager 之前替换数据库路径
+    bean_actions.DB_PATH = args.db_path
+    mock_server = None
+    if args.mock_llm_latency is not None:
+        # 需要在聊天模块创建客户端之前设置
+        mock_server = start_mock_server(latency=args.mock_llm_latency, jitter=args.mock_llm_jitter)
+        os.environ['OPENAI_BASE_URL'] = mock_server.base_url
+
+    transport = SimulatedTransport(num_friends=args.friends, num_groups=args.groups,
+                                   members_per_group=args.members, group_ratio=args.group_ratio,
+                                   rate=args.rate, duration=args.duration,
+                                   command_mix=parse_command_mix(args.mix), seed=args.seed)
+    bot = WeChatBot(dispatch_mode=args.dispatch_mode, transport=transport)
+    bot.run()
+    report = transport.report()
+    report['dispatch_mode'] = args.dispatch_mode
+    if mock_server is not None:
+        report['mock_llm'] = mock_server.stats()
+    print(json.dumps(report, ensure_ascii=False, indent=4))
+
+
+if __name__ == '__main__':
+    main()
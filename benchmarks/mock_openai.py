@@ -0,0 +1,152 @@
+"""
+本地模拟的 OpenAI 兼容聊天接口，延迟可配置，用于在没有真实接口的情况下测试聊天模块
+
+示例：
+    python -m benchmarks.mock_openai --port 8900 --latency 2 --jitter 0.5
+    OPENAI_BASE_URL=http://127.0.0.1:8900/v1 python main.py
+"""
+import argparse
+import itertools
+import json
+import random
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+
+class MockOpenAIHandler(BaseHTTPRequestHandler):
+    """
+    处理 POST /v1/chat/completions，等待设定的延迟后回复最后一条用户消息
+    """
+    # 支持长连接，客户端的连接池可以复用连接
+    protocol_version = 'HTTP/1.1'
+
+    def do_POST(self):
+        body = self.rfile.read(int(self.headers.get('Content-Length', 0)))
+        if self.path.rstrip('/') != '/v1/chat/completions':
+            self._send_json(404, {'error': {'message': f'unknown path {self.path}', 'type': 'invalid_request_error'}})
+            return
+        request = json.loads(body)
+        with self.server.track_request():
+            time.sleep(self.server.latency + random.uniform(0, self.server.jitter))
+        user_messages = [message['content'] for message in request['messages'] if message['role'] == 'user']
+        self._send_json(200, {
+            'id': f'chatcmpl-mock-{next(self.server.ids)}',
+            'object': 'chat.completion',
+            'created': int(time.time()),
+            'model': request.get('model', 'mock'),
+            'choices': [{
+                'index': 0,
+                'message': {'role': 'assistant', 'content': f"收到：{user_messages[-1] if user_messages else ''}"},
+                'finish_reason': 'stop',
+            }],
+            'usage': {'prompt_tokens': 0, 'completion_tokens': 0, 'total_tokens': 0},
+        })
+
+    def _send_json(self, status, data):
+        payload = json.dumps(data, ensure_ascii=False).encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(payload)))
+        self.end_headers()
+        try:
+            self.wfile.write(payload)
+        except (BrokenPipeError, ConnectionResetError):
+            # 客户端超时后取消了请求
+            self.close_connection = True
+
+    def log_message(self, format, *args):
+        pass
+
+
+class _RequestTracker:
+    def __init__(self, server):
+        self.server = server
+
+    def __enter__(self):
+        with self.server.lock:
+            self.server.requests += 1
+            self.server.active += 1
+            self.server.max_active = max(self.server.max_active, self.server.active)
+
+    def __exit__(self, *exc_info):
+        with self.server.lock:
+            self.server.active -= 1
+
+
+class MockOpenAIServer(ThreadingHTTPServer):
+    """
+    模拟接口服务，记录请求数、连接数和最大并发请求数
+    """
+    daemon_threads = True
+
+    def __init__(self, address, latency=0.5, jitter=0.0):
+        """
+        Args:
+            address (tuple): 监听地址 (host, port)，端口为 0 时随机选择。
+            latency (float): 每个请求的固定延迟（秒）。
+            jitter (float): 在固定延迟上增加的随机延迟上限（秒）。
+        """
+        super().__init__(address, MockOpenAIHandler)
+        self.latency = latency
+        self.jitter = jitter
+        self.ids = itertools.count(1)
+        self.lock = threading.Lock()
+        self.requests = 0
+        self.connections = 0
+        self.active = 0
+        self.max_active = 0
+
+    @property
+    def base_url(self):
+        host, port = self.server_address[:2]
+        return f'http://{host}:{port}/v1'
+
+    def track_request(self):
+        return _RequestTracker(self)
+
+    def process_request(self, request, client_address):
+        # 每个连接调用一次，连接数远小于请求数说明客户端复用了连接
+        with self.lock:
+            self.connections += 1
+        super().process_request(request, client_address)
+
+    def stats(self):
+        with self.lock:
+            return {'requests': self.requests, 'connections': self.connections, 'max_active': self.max_active}
+
+
+def start_mock_server(port=0, latency=0.5, jitter=0.0, host='127.0.0.1'):
+    """
+    在后台线程中启动模拟接口，返回 MockOpenAIServer，base_url 为接口地址
+    """
+    server = MockOpenAIServer((host, port), latency=latency, jitter=jitter)
+    thread = threading.Thread(target=server.serve_forever, name='MockOpenAI')
+    thread.daemon = True
+    thread.start()
+    return server
+
+
+def main():
+    """
+    启动模拟接口，直到 Ctrl+C
+    """
+    parser = argparse.ArgumentParser(description='模拟 OpenAI 兼容的聊天接口')
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8900)
+    parser.add_argument('--latency', type=float, default=0.5, help='每个请求的固定延迟（秒）')
+    parser.add_argument('--jitter', type=float, default=0.0, help='随机延迟上限（秒）')
+    args = parser.parse_args()
+    server = MockOpenAIServer((args.host, args.port), latency=args.latency, jitter=args.jitter)
+    print(f"模拟接口地址：{server.base_url}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        print(json.dumps(server.stats(), ensure_ascii=False))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,138 @@
+"""
+模块和 BeanManager 热点路径的性能测试，结果保存为 JSON 以便在不同提交之间对比
+
+示例：
+    python -m benchmarks.run_benchmarks
+    python -m benchmarks.run_benchmarks --sizes 1000,100000 --compare benchmarks/results/core-abc1234.json
+"""
+import argparse
+import datetime
+import os
+import random
+import tempfile
+from benchmarks.common import measure, save_results, compare_results
+from main import WeChatBot
+from utils import bean_actions
+from utils.bean_actions import BeanManager
+from utils.scan_module import get_command_module_dict
+from utils.wechat_simulator import SimulatedTransport
+
+BENCH_DIRECTORY = os.path.join(tempfile.gettempdir(), 'wechatbot_bench')
+
+
+def populate(db_path, num_users):
+    """
+    创建一个包含 num_users 个用户的豆子数据库
+    """
+    # 分片后端的数据保存在 <文件名>.shard<i><扩展名> 中
+    root, extension = os.path.splitext(db_path)
+    for path in [db_path] + [f'{root}.shard{i}{extension}' for i in range(bean_actions.NUM_SHARDS)]:
+        if os.path.exists(path):
+            os.remove(path)
+    bean_manager = BeanManager(db_path)
+    last_collect_time = int((datetime.datetime.now() - datetime.timedelta(weeks=2)).timestamp())
+    bean_manager.import_users((f'user_{i}', last_collect_time, random.randint(0, 1000000)) for i in range(num_users))
+    return bean_manager
+
+
+def bench_bean_manager(sizes, number):
+    """
+    不同用户规模下 BeanManager 各操作的耗时
+    """
+    results = {}
+    for num_users in sizes:
+        print(f"准备 {num_users} 个用户的数据库...")
+        bean_manager = populate(os.path.join(BENCH_DIRECTORY, f'beans_{num_users}.db'), num_users)
+        users = [f'user_{random.randrange(num_users)}' for _ in range(number)]
+        results[f'collect_beans[{num_users}]'] = measure(
+            lambda i: bean_manager.collect_beans(users[i % number]), number)
+        results[f'add_beans[{num_users}]'] = measure(
+            lambda i: bean_manager.add_beans(users[i % number], 1), number)
+        results[f'get_bean_count[{num_users}]'] = measure(
+            lambda i: bean_manager.get_bean_count(users[i % number]), number)
+        results[f'get_top_users[{num_users}]'] = measure(
+            lambda i: bean_manager.get_top_users(10), min(number, 20), warmup=1)
+        # 第一次查询名次时加载排名索引，预热中完成
+        results[f'get_user_rank[{num_users}]'] = measure(
+            lambda i: bean_manager.get_user_rank(users[i % number]), number, warmup=1)
+        results[f'get_users_by_rank[{num_users}]'] = measure(
+            lambda i: bean_manager.get_users_by_rank(random.randrange(1, num_users), 10), number)
+        last_user = bean_manager.get_users_by_rank(num_users // 2, 1)[0]
+        results[f'get_top_users_after[{num_users}]'] = measure(
+            lambda i: bean_manager.get_top_users(10, after=last_user[1:]), number)
+        bean_manager.close_connection()
+    return results
+
+
+def bench_generate_reply(bot, number):
+    """
+    每个已注册命令经过 generate_reply 的耗时，跳过需要网络请求的模块
+    """
+    results = {}
+    for command_sign, module_instance in bot.module_mapping.items():
+        if getattr(module_instance, 'is_blocking', False):
+            continue
+        results[f'generate_reply[{command_sign}]'] = measure(
+            lambda i, sign=command_sign: bot.generate_reply(f'bench_{i % 100}', sign), number)
+    return results
+
+
+def bench_game_rounds(bot, number):
+    """
+    完整的百家乐和21点对局（开局、下注、结算）的耗时
+    """
+    player = 'bench_player'
+    BeanManager().add_beans(player, 10 ** 12)
+
+    def baccarat_round(_):
+        bot.generate_reply(player, '百家乐')
+        bot.generate_reply(player, '下注 闲 押10')
+
+    def blackjack_round(_):
+        bot.generate_reply(player, '21点 押10')
+        bot.generate_reply(player, '停牌')
+
+    return {
+        'baccarat_round': measure(baccarat_round, number),
+        'blackjack_round': measure(blackjack_round, number),
+    }
+
+
+def bench_startup(number):
+    """
+    扫描并加载所有功能模块的耗时
+    """
+    return {'get_command_module_dict': measure(lambda _: get_command_module_dict(), number, warmup=1)}
+
+
+def main():
+    """
+    解析参数并运行所有测试
+    """
+    parser = argparse.ArgumentParser(description='热点路径性能测试')
+    parser.add_argument('--sizes', default='1000,100000,1000000', help='BeanManager 测试的用户规模')
+    parser.add_argument('--number', type=int, default=1000, help='每项测试的调用次数')
+    parser.add_argument('--output', default=None, help='结果文件路径')
+    parser.add_argument('--compare', default=None, help='与之前保存的结果文件对比')
+    args = parser.parse_args()
+
+    os.makedirs(BENCH_DIRECTORY, exist_ok=True)
+    # 模块使用的默认数据库替换为临时文件，避免污染正式数据
+    bean_actions.DB_PATH = os.path.join(BENCH_DIRECTORY, 'beans.db')
+
+    results = {}
+    results.update(bench_startup(5))
+    bot = WeChatBot(transport=SimulatedTransport())
+    results.update(bench_generate_reply(bot, args.number))
+    results.update(bench_game_rounds(bot, args.number))
+    results.update(bench_bean_manager([int(size) for size in args.sizes.split(',')], args.number))
+
+    for name, result in results.items():
+        print(f"{name}: 平均 {result['mean_us']:.1f}us，p99 {result['p99_us']:.1f}us")
+    print(f"结果已保存到 {save_results('core', results, args.output)}")
+    if args.compare:
+        compare_results(args.compare, results)
+
+
+if __name__ == '__main__':
+    main()
@@ -1,182 +1,459 @@
-"""
-启动微信机器人并导入不同的功能模块
-"""
-import traceback
-import threading
-import queue
-import logging
-import itchat
-from itchat.content import TEXT
-from utils.scan_module import get_command_module_dict
-
-# 配置日志
-logging.basicConfig(level=logging.INFO, format='%(asctime)s %(threadName)s %(message)s')
-
-
-class WeChatBot:
-    """
-    微信机器人
-    """
-
-    def __init__(self):
-        # 功能模块映射，根据消息前缀映射到对应的模块名
-        self.module_mapping = get_command_module_dict()
-
-        # 定义消息队列
-        self.message_queue = queue.Queue()
-        self.num_worker_threads = 5  # 工作线程数
-
-        # 初始化发送者锁字典和锁
-        self.sender_locks = {}
-        self.sender_locks_lock = threading.Lock()
-
-        self.handle_private_message = None
-        self.handle_group_message = None
-
-        # 初始化 itchat
-        itchat.auto_login(hotReload=False)
-
-        # 注册消息处理函数
-        self.register_handlers()
-
-        # 启动消息处理线程
-        self.start_worker_threads()
-
-    def register_handlers(self):
-        """
-        注册消息处理器
-        """
-
-        # 由于装饰器的使用，我们需要将函数定义在这里，并使用 self 作为参数
-
-        @itchat.msg_register(TEXT, isFriendChat=True)
-        def handle_private_message(msg):
-            # 将消息放入队列，不直接处理
-            self.message_queue.put(('private', msg))
-
-        @itchat.msg_register(TEXT, isGroupChat=True)
-        def handle_group_message(msg):
-            # 将消息放入队列，不直接处理
-            if msg['IsAt']:
-                self.message_queue.put(('group', msg))
-
-        # 将函数绑定到实例
-        self.handle_private_message = handle_private_message
-        self.handle_group_message = handle_group_message
-
-    def start_worker_threads(self):
-        """
-        启动工作线程
-        """
-        for i in range(self.num_worker_threads):
-            thread_pool = threading.Thread(target=self.message_worker, name=f'Worker-{i + 1}')
-            thread_pool.daemon = True
-            thread_pool.start()
-
-    def message_worker(self):
-        """
-        通过多线程和队列处理信息，使用锁确保一时间
-        同一人只能占用一个线程
-        """
-        while True:
-            try:
-                msg_type, msg_data = self.message_queue.get(timeout=1)
-                sender_id = msg_data['FromUserName']
-
-                # 获取或创建发送者的锁
-                with self.sender_locks_lock:
-                    if sender_id not in self.sender_locks:
-                        self.sender_locks[sender_id] = threading.Lock()
-                    sender_lock = self.sender_locks[sender_id]
-
-                # 使用发送者的锁，确保同一时间只有一个线程处理该发送者的消息
-                with sender_lock:
-                    if msg_type == 'private':
-                        self.handle_private_message_worker(msg_data)
-                    elif msg_type == 'group':
-                        self.handle_group_message_worker(msg_data)
-
-                self.message_queue.task_done()
-            except queue.Empty:
-                continue
-            except Exception as exception:
-                logging.error("消息处理时发生异常：%s", exception)
-
-    def handle_private_message_worker(self, msg):
-        """
-        处理私聊消息
-        """
-        sender = msg['User']
-        nickname = sender['NickName']
-        content = msg['Text']
-        logging.info("私聊消息 - 来自 %s：%s", nickname, content)
-        reply = self.generate_reply(nickname, content)
-        itchat.send(reply, toUserName=sender['UserName'])
-
-    def handle_group_message_worker(self, msg):
-        """
-        处理群消息
-        """
-        if msg['IsAt']:
-            group_name = msg['User']['NickName']
-            sender_nickname = msg['ActualNickName']
-            actual_content = msg['Content']
-            # 获取自己的昵称
-            my_nickname = itchat.search_friends()['NickName']
-            # 去除@信息，提取实际内容
-            content = actual_content.replace(f'@{my_nickname}', '').strip()
-            logging.info("群聊消息 - %s 中 @%s 说：%s", group_name, sender_nickname, content)
-            reply_content = self.generate_reply(sender_nickname, content)
-            reply = f"@{sender_nickname} {reply_content}"
-            itchat.send(reply, toUserName=msg['FromUserName'])
-
-    def generate_reply(self, nickname, content):
-        """
-        调用不同的功能模块，处理消息生成回复
-        """
-        try:
-            command_sign = content.split(" ")[0]
-            if command_sign in self.module_mapping:
-                module_instance = self.module_mapping[command_sign]
-                reply = module_instance.process_messages(nickname, content)
-            else:
-                # 如果没有特殊命令，就直接调用聊天模块
-                module_instance = self.module_mapping["聊天"]
-                reply = module_instance.process_messages(nickname, content, directly=True)
-            return reply
-        except Exception as exception:
-            print(traceback.format_exc())
-            logging.error("处理模块时发生异常：%s", exception)
-            return '抱歉，出现了一些错误。'
-
-    @staticmethod
-    def run():
-        """
-        开始运行机器人
-        """
-        while True:
-            try:
-                itchat.run(blockThread=True)
-            except KeyboardInterrupt:
-                # 如果用户手动中断，退出循环
-                logging.info("微信机器人已停止")
-                break
-            except Exception as exception:
-                logging.error("主循环发生异常：%s", exception)
-                if 'request' in str(exception) or 'Logout' in str(exception) or 'login' in str(exception).lower():
-                    try:
-                        itchat.auto_login(hotReload=True)
-                        logging.info("重新登录成功")
-                    except Exception as login_exception:
-                        logging.error("重新登录失败：%s", login_exception)
-                        print("无法重新登录，程序即将退出")
-                        break  # 退出循环，不再尝试重新登录
-                else:
-                    logging.error("无法识别的异常，未能重新登录：%s", exception)
-                    print("遇到无法识别的异常，程序即将退出")
-                    break  # 退出循环，不再尝试
-
-
-if __name__ == '__main__':
-    bot = WeChatBot()
-    bot.run()
+"""
+启动微信机器人并导入不同的功能模块
+"""
+import argparse
+import asyncio
+import concurrent.futures
+import traceback
+import threading
+import time
+import logging
+from utils.scan_module import ModuleScanner, ModuleWatcher
+from utils.async_dispatcher import AsyncDispatcher
+from utils.shard_scheduler import ShardScheduler, LANE_HIGH, LANE_LOW
+from utils.self_profile import SelfProfile
+from utils.command_router import CommandRouter
+from utils.module_executor import ModuleExecutor
+from utils.transport import ItchatTransport
+from utils.metrics import METRICS, start_metrics_server
+from utils.outbound_sender import OutboundSender
+from utils import bean_actions
+
+# 配置日志
+logging.basicConfig(level=logging.INFO, format='%(asctime)s %(threadName)s %(message)s')
+
+# 运行时指标
+QUEUE_DEPTH = METRICS.gauge('wechatbot_queue_depth', '等待处理的消息数')
+QUEUE_WAIT = METRICS.histogram('wechatbot_queue_wait_seconds', '消息在队列中的等待时间')
+COMMAND_LATENCY = METRICS.histogram('wechatbot_command_seconds', '各命令生成回复的耗时', ('command',))
+WORKER_BUSY = METRICS.counter('wechatbot_worker_busy_seconds_total', '工作线程处理消息的时间', ('worker',))
+WORKER_IDLE = METRICS.counter('wechatbot_worker_idle_seconds_total', '工作线程等待消息的时间', ('worker',))
+
+
+class WeChatBot:
+    """
+    微信机器人
+    """
+
+    def __init__(self, dispatch_mode='thread', transport=None, metrics_port=9108,
+                 max_pending=10000, shed_policy='drop_low', watch_modules=False):
+        # 消息收发层，默认使用 itchat
+        self.transport = transport if transport is not None else ItchatTransport()
+
+        # 发送队列，工作线程放入回复后立即返回，由发送线程限速、合并和重试
+        self.outbound = OutboundSender(self.transport.send, **self.transport.rate_limits)
+
+        # 功能模块映射，根据消息前缀映射到对应的模块名
+        self.module_scanner = ModuleScanner()
+        self.module_mapping, _ = self.module_scanner.scan()
+        # 由命令构建的前缀树路由
+        self.router = CommandRouter(self.module_mapping)
+        # 按模块声明的执行方式（工作线程、模块线程池或进程池）调用模块，超过期限时返回超时回复
+        self.module_executor = ModuleExecutor()
+        # 模块文件变化时在后台重新加载，不需要重启机器人
+        self.module_watcher = None
+        if watch_modules:
+            self.module_watcher = ModuleWatcher(self.module_scanner, self.swap_modules).start()
+
+        # 分发模式：thread 为多线程加队列，async 为 asyncio 事件循环
+        self.dispatch_mode = dispatch_mode
+        self.dispatcher = None
+
+        self.num_worker_threads = 5  # 工作线程数
+        self.stats_interval = 60  # 输出调度统计的间隔（秒）
+
+        # 队列已满丢弃消息时的回复
+        self.busy_reply = '当前消息太多，请稍后再试。'
+
+        # 两种分发模式使用相同的排队上限和丢弃策略
+        self.max_pending = max_pending
+        self.shed_policy = shed_policy
+
+        # 按发送者分片的有界消息队列，保证同一发送者的消息按顺序处理，本地命令优先于聊天
+        self.message_queue = ShardScheduler(self.num_worker_threads, max_pending=max_pending,
+                                            shed_policy=shed_policy)
+
+        # 本地指标接口，端口为 0 或 None 时不启动
+        self.metrics_server = start_metrics_server(metrics_port) if metrics_port else None
+
+        self.handle_private_message = None
+        self.handle_group_message = None
+
+        # 机器人自己的账号信息，登录后填充
+        self.self_profile = SelfProfile()
+
+        # 登录
+        self.transport.login(hot_reload=False)
+        self.refresh_self_profile()
+
+        # 注册消息处理函数
+        self.register_handlers()
+
+        self.outbound.start()
+
+        # 启动消息处理线程
+        if self.dispatch_mode == 'async':
+            self.start_async_dispatcher()
+        else:
+            self.start_worker_threads()
+
+    def register_handlers(self):
+        """
+        注册消息处理器
+        """
+
+        def handle_private_message(msg):
+            # 将消息放入队列，不直接处理
+            self.dispatch_message('private', msg)
+
+        def handle_group_message(msg):
+            # 将消息放入队列，不直接处理
+            if msg['IsAt']:
+                self.dispatch_message('group', msg)
+
+        self.transport.register_handlers(handle_private_message, handle_group_message)
+
+        # 将函数绑定到实例
+        self.handle_private_message = handle_private_message
+        self.handle_group_message = handle_group_message
+
+    def dispatch_message(self, msg_type, msg):
+        """
+        解析消息后根据分发模式交给事件循环或者消息队列
+        """
+        parsed = self.parse_message(msg_type, msg)
+        if parsed is None:
+            return
+        sender_key = self.get_sender_key(msg_type, msg)
+        content = parsed[1]
+        # 聊天等会阻塞的请求走低优先级通道，查豆子、游戏等本地命令走高优先级通道
+        lane = LANE_LOW if self.is_blocking_content(content) else LANE_HIGH
+        if self.dispatcher is not None:
+            shed_messages = self.dispatcher.submit(sender_key, parsed, lane=lane, dedupe_key=content)
+        else:
+            shed_messages = self.message_queue.put(sender_key, parsed, lane=lane, dedupe_key=content)
+        for shed in shed_messages:
+            _, _, to_user_name, reply_prefix = shed
+            self.send_reply(reply_prefix + self.busy_reply, to_user_name)
+
+    @staticmethod
+    def get_sender_key(msg_type, msg):
+        """
+        返回用于保证消息顺序的发送者标识 (会话, 成员)
+
+        群聊按群内成员区分，一个成员的慢请求不会阻塞同群其他人的消息
+        """
+        if msg_type == 'group':
+            member = msg.get('ActualUserName') or msg.get('ActualNickName')
+            return msg['FromUserName'], member
+        return msg['FromUserName'], None
+
+    def start_async_dispatcher(self):
+        """
+        启动 asyncio 分发器
+        """
+        self.dispatcher = AsyncDispatcher(self.process_message_async,
+                                          max_blocking_workers=self.num_worker_threads,
+                                          max_pending=self.max_pending, shed_policy=self.shed_policy)
+        self.dispatcher.start()
+        QUEUE_DEPTH.set_function(self.dispatcher.qsize)
+
+    def start_worker_threads(self):
+        """
+        启动工作线程
+        """
+        QUEUE_DEPTH.set_function(self.message_queue.qsize)
+        for i in range(self.num_worker_threads):
+            thread_pool = threading.Thread(target=self.message_worker, args=(i,), name=f'Worker-{i + 1}')
+            thread_pool.daemon = True
+            thread_pool.start()
+        stats_thread = threading.Thread(target=self.stats_reporter, name='StatsReporter')
+        stats_thread.daemon = True
+        stats_thread.start()
+
+    def message_worker(self, worker_index):
+        """
+        从分片队列中取消息处理，同一发送者同一时间只会被一个线程处理，
+        当前分片空闲时会从其它分片窃取消息
+        """
+        worker_name = f'Worker-{worker_index + 1}'
+        while True:
+            idle_start = time.perf_counter()
+            ticket = self.message_queue.get(worker_index, timeout=1)
+            busy_start = time.perf_counter()
+            WORKER_IDLE.inc(busy_start - idle_start, worker=worker_name)
+            if ticket is None:
+                continue
+            QUEUE_WAIT.observe(ticket.wait_time)
+            pending = None
+            try:
+                pending = self.process_message(ticket.item)
+            except Exception as exception:
+                logging.error("消息处理时发生异常：%s", exception)
+            finally:
+                if pending is None:
+                    self.message_queue.task_done(ticket)
+                else:
+                    # 异步模块发送回复后才处理该发送者的下一条消息，工作线程不需要等待
+                    pending.add_done_callback(lambda _, done=ticket: self.message_queue.task_done(done))
+                WORKER_BUSY.inc(time.perf_counter() - busy_start, worker=worker_name)
+
+    def stats_reporter(self):
+        """
+        定期输出每个分片的排队情况，以及有卡住线程的功能模块
+        """
+        while True:
+            time.sleep(self.stats_interval)
+            for stats in self.message_queue.get_stats():
+                if stats['wait_count']:
+                    logging.info("分片 %d - 待处理 %d 条，活跃发送者 %d 个，平均等待 %.3fs，最长等待 %.3fs",
+                                 stats['shard'], stats['pending'], stats['senders'],
+                                 stats['wait_avg'], stats['wait_max'])
+            for stats in self.module_executor.get_stats():
+                if stats.get('abandoned') or stats.get('rejected'):
+                    logging.warning("功能模块 %s - 被放弃且未结束的线程 %d 个，替换 %d 次，暂停期间拒绝 %d 次调用",
+                                    stats['module'], stats['abandoned'], stats['restarts'], stats['rejected'])
+
+    def process_message(self, parsed):
+        """
+        在工作线程中处理一条解析好的消息并发送回复
+
+        Returns:
+            concurrent.futures.Future: 消息交给异步模块时返回，回复发送后完成；已经处理完时返回 None。
+        """
+        nickname, content, to_user_name, reply_prefix = parsed
+        reply_future = self.submit_reply(nickname, content)
+        if reply_future is None:
+            reply = self.generate_reply(nickname, content)
+            self.send_reply(reply_prefix + reply, to_user_name)
+            return None
+        reply_future.add_done_callback(lambda future: self.send_reply(reply_prefix + future.result(), to_user_name))
+        return reply_future
+
+    async def process_message_async(self, parsed):
+        """
+        在事件循环中处理一条解析好的消息，本地模块直接执行，阻塞型模块放到线程池执行
+        """
+        nickname, content, to_user_name, reply_prefix = parsed
+        reply_future = self.submit_reply(nickname, content)
+        if reply_future is not None:
+            reply = await asyncio.wrap_future(reply_future)
+        elif self.is_blocking_content(content):
+            reply = await self.dispatcher.run_blocking(self.generate_reply, nickname, content)
+        else:
+            reply = self.generate_reply(nickname, content)
+        self.send_reply(reply_prefix + reply, to_user_name)
+
+    def send_reply(self, reply, to_user_name):
+        """
+        把回复放入发送队列，不等待发送完成
+        """
+        self.outbound.enqueue(reply, to_user_name)
+
+    def refresh_self_profile(self):
+        """
+        登录后更新自己的账号信息缓存
+        """
+        self.self_profile.refresh(self.transport.get_self_profile())
+
+    def parse_message(self, msg_type, msg):
+        """
+        解析私聊或群消息
+
+        返回：
+            tuple: (发送者昵称, 实际内容, 回复对象, 回复前缀)，不需要处理时返回 None。
+        """
+        if msg_type == 'private':
+            sender = msg['User']
+            nickname = sender['NickName']
+            content = msg['Text']
+            logging.info("私聊消息 - 来自 %s：%s", nickname, content)
+            return nickname, content, sender['UserName'], ''
+        if msg_type == 'group' and msg['IsAt']:
+            group_name = msg['User']['NickName']
+            sender_nickname = msg['ActualNickName']
+            actual_content = msg['Content']
+            # 去除@信息，提取实际内容
+            content = self.self_profile.strip_mention(actual_content)
+            logging.info("群聊消息 - %s 中 @%s 说：%s", group_name, sender_nickname, content)
+            return sender_nickname, content, msg['FromUserName'], f"@{sender_nickname} "
+        return None
+
+    def swap_modules(self, module_mapping):
+        """
+        使用重新加载后的功能模块。新的路由在替换前构建完成，
+        正在处理的消息继续使用旧路由，之后的消息使用新路由，不需要暂停消息处理。
+        返回后 ModuleWatcher 才把旧版本的状态交给新版本并卸载旧版本。
+        """
+        router = CommandRouter(module_mapping)
+        self.router = router
+        self.module_mapping = module_mapping
+        # 被替换的模块在当前调用结束后关闭它们的线程池和进程池
+        self.module_executor.retire(module_mapping.values())
+        logging.info("功能模块已更新，共 %d 个命令", len(module_mapping))
+
+    def resolve_module(self, content):
+        """
+        根据消息内容找到对应的功能模块
+
+        返回：
+            tuple: (功能模块对象, CommandArgs)，没有匹配的命令时使用聊天模块，CommandArgs 为 None。
+        """
+        # 只读取一次路由，热重载替换路由时，同一条消息的命令和聊天模块来自同一个版本
+        router = self.router
+        module_instance, args = router.route(content)
+        if module_instance is None:
+            # 如果没有特殊命令，就直接调用聊天模块
+            return router.command_module_dict["聊天"], None
+        return module_instance, args
+
+    def is_blocking_content(self, content):
+        """
+        判断处理这条消息的模块是否会阻塞（如网络请求），在线程池或进程池中执行的模块需要等待结果，同样视为阻塞
+        """
+        try:
+            module_instance, _ = self.resolve_module(content)
+        except KeyError:
+            return False
+        return (getattr(module_instance, 'is_blocking', False)
+                or getattr(module_instance, 'execution_policy', 'inline') != 'inline')
+
+    def submit_reply(self, nickname, content):
+        """
+        处理消息的模块是异步模块（提供 submit_messages）时，把消息交给模块的事件循环，不等待回复
+
+        Returns:
+            concurrent.futures.Future: 结果为回复内容，不会抛出异常；不是异步模块时返回 None，由 generate_reply 处理。
+        """
+        try:
+            module_instance, args = self.resolve_module(content)
+        except KeyError:
+            return None
+        if not getattr(module_instance, 'is_async', False) or (args is not None and args.is_help):
+            return None
+        command_sign = '聊天' if args is None else args.command
+        start = time.perf_counter()
+        reply_future = concurrent.futures.Future()
+
+        def on_done(future):
+            COMMAND_LATENCY.observe(time.perf_counter() - start, command=command_sign)
+            try:
+                reply = future.result()
+            except (Exception, concurrent.futures.CancelledError) as exception:
+                # 模块关闭时会取消未完成的请求，也要回复，否则该发送者的后续消息不会被处理
+                logging.error("处理模块时发生异常：%r", exception)
+                reply = '抱歉，出现了一些错误。'
+            reply_future.set_result(reply)
+
+        try:
+            module_instance.submit_messages(nickname, content, directly=args is None).add_done_callback(on_done)
+        except Exception as exception:
+            print(traceback.format_exc())
+            logging.error("处理模块时发生异常：%s", exception)
+            reply_future.set_result('抱歉，出现了一些错误。')
+        return reply_future
+
+    def generate_reply(self, nickname, content):
+        """
+        调用不同的功能模块，处理消息生成回复
+        """
+        start = time.perf_counter()
+        command_sign = '聊天'
+        try:
+            module_instance, args = self.resolve_module(content)
+            if args is not None:
+                command_sign = args.command
+            call = self.module_executor.call
+            if args is None:
+                reply = call(module_instance, 'process_messages', nickname, content, directly=True)
+            elif args.is_help:
+                # 统一处理“命令 介绍/帮助/说明/help/功能”
+                reply = module_instance.get_detail_description()
+            elif getattr(module_instance, 'accept_args', False):
+                reply = call(module_instance, 'process_messages', nickname, content, args=args)
+            else:
+                reply = call(module_instance, 'process_messages', nickname, content)
+            return reply
+        except Exception as exception:
+            print(traceback.format_exc())
+            logging.error("处理模块时发生异常：%s", exception)
+            return '抱歉，出现了一些错误。'
+        finally:
+            COMMAND_LATENCY.observe(time.perf_counter() - start, command=command_sign)
+
+    def close_modules(self):
+        """
+        退出前关闭已经加载的功能模块，保存它们的数据（如聊天上下文、组提交队列中的写入）
+        """
+        self.module_executor.close()
+        for module_instance in set(self.module_mapping.values()):
+            # 没有使用过的模块不需要为了关闭而导入
+            if not getattr(module_instance, 'loaded', True) or not hasattr(module_instance, 'close'):
+                continue
+            try:
+                module_instance.close()
+            except Exception as exception:
+                logging.error("关闭功能模块时发生异常：%s", exception)
+
+    def run(self):
+        """
+        开始运行机器人
+        """
+        while True:
+            try:
+                self.transport.run()
+                # 正常返回说明已经停止接收消息（如退出登录或模拟结束），把剩余的回复发送完
+                self.outbound.stop()
+                self.close_modules()
+                break
+            except KeyboardInterrupt:
+                # 如果用户手动中断，退出循环
+                logging.info("微信机器人已停止")
+                self.close_modules()
+                break
+            except Exception as exception:
+                logging.error("主循环发生异常：%s", exception)
+                if 'request' in str(exception) or 'Logout' in str(exception) or 'login' in str(exception).lower():
+                    try:
+                        self.transport.login(hot_reload=True)
+                        self.refresh_self_profile()
+                        logging.info("重新登录成功")
+                    except Exception as login_exception:
+                        logging.error("重新登录失败：%s", login_exception)
+                        print("无法重新登录，程序即将退出")
+                        break  # 退出循环，不再尝试重新登录
+                else:
+                    logging.error("无法识别的异常，未能重新登录：%s", exception)
+                    print("遇到无法识别的异常，程序即将退出")
+                    break  # 退出循环，不再尝试
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='微信机器人')
+    parser.add_argument('--dispatch-mode', choices=['thread', 'async'], default='thread',
+                        help='消息分发模式：thread 为多线程加队列，async 为 asyncio 事件循环')
+    parser.add_argument('--metrics-port', type=int, default=9108,
+                        help='本地 Prometheus 指标接口的端口，0 表示不启动')
+    parser.add_argument('--max-pending', type=int, default=10000, help='消息队列最多排队的消息数')
+    parser.add_argument('--shed-policy', choices=['reject', 'drop_low'], default='drop_low',
+                        help='队列满时的丢弃策略：reject 丢弃新消息，drop_low 优先丢弃排队中的聊天消息')
+    parser.add_argument('--group-commit', action='store_true',
+                        help='豆子的增减由写线程批量提交，减少每次下注和结算的磁盘同步')
+    parser.add_argument('--bean-backend', choices=bean_actions.BACKENDS, default=bean_actions.BACKEND,
+                        help='豆子的存储后端：sqlite 为单个数据库文件，sharded 按用户分片到多个文件，memory 只保存在内存中，'
+                             'ledger 连接账本服务（python -m utils.bean_ledger），多个机器人进程共享豆子')
+    parser.add_argument('--bean-shards', type=int, default=bean_actions.NUM_SHARDS,
+                        help='sharded 后端的分片数量，确定后不能修改')
+    parser.add_argument('--ledger-socket', default=bean_actions.LEDGER_SOCKET, help='ledger 后端连接的账本服务套接字')
+    parser.add_argument('--watch-modules', action='store_true',
+                        help='监视 module 文件夹，功能模块修改后自动重新加载，不需要重启')
+    args = parser.parse_args()
+    # 需要在模块创建 BeanManager 之前设置
+    bean_actions.GROUP_COMMIT = args.group_commit
+    bean_actions.BACKEND = args.bean_backend
+    bean_actions.NUM_SHARDS = args.bean_shards
+    bean_actions.LEDGER_SOCKET = args.ledger_socket
+    bot = WeChatBot(dispatch_mode=args.dispatch_mode, metrics_port=args.metrics_port,
+                    max_pending=args.max_pending, shed_policy=args.shed_policy,
+                    watch_modules=args.watch_modules)
+    bot.run()
@@ -1,88 +1,201 @@
-"""
-排行榜功能模块
-"""
-
-from utils.bean_actions import BeanManager  # 假设 BeanManager 类保存在 bean_manager.py 文件中
-
-
-class FunctionModule:
-    """
-    FunctionModule 类，实现豆子排行榜功能。
-    """
-
-    _instance = None
-    # 命令标识，用于标注什么样的命令开头会调用这个功能模块
-    # 比如用户发送 "@机器人 排行榜" 或 "@机器人 查看排行榜" 会触发这个模块
-    _command_sign = ["排行榜", "查看排行榜"]
-    _reply_string = None
-    # 模块激活状态
-    is_active = True  # 设置为 True，表示模块被激活
-
-    def __new__(cls):
-        """
-        单例实现。
-        """
-        if cls._instance is None:
-            cls._instance = super(FunctionModule, cls).__new__(cls)
-        return cls._instance
-
-    def __init__(self):
-        """
-        初始化方法。
-        """
-        if not hasattr(self, '_initialized'):
-            self._initialized = True
-            # 初始化操作
-            self.bean_manager = BeanManager()
-
-    def get_command_sign(self):
-        """
-        返回当前模块的命令标识
-        """
-        return self._command_sign
-
-    def process_messages(self, sender_nickname, content):
-        """
-        根据发消息人的昵称和消息内容，处理排行榜的请求。
-
-        Args:
-            sender_nickname (str): 发送者的昵称。
-            content (str): 消息内容。
-
-        Returns:
-            str: 回复消息。
-        """
-        # 获取豆子数量最多的前 10 名用户
-        top_users = self.bean_manager.get_top_users(10)
-        if top_users:
-            reply_lines = ["📊 当前豆子排行榜："]
-            for rank, (username, total_beans) in enumerate(top_users, start=1):
-                reply_lines.append(f"第 {rank} 名：{username}，豆子数量：{total_beans}")
-            return "\n".join(reply_lines)
-        else:
-            return "当前还没有用户领取豆子，快来成为第一个领取豆子的人吧！"
-
-    @staticmethod
-    def get_simple_description():
-        """
-        返回简单的功能描述
-        """
-        return "查看豆子排行榜，显示前 10 名用户的豆子数量。"
-
-    @staticmethod
-    def get_detail_description():
-        """
-        返回详细的功能描述
-        """
-        return ("【豆子排行榜功能说明】\n"
-                "您可以通过发送“排行榜”或“查看排行榜”来查看豆子排行榜。\n"
-                "排行榜显示拥有豆子数量最多的前 10 名用户。\n"
-                "快来领取豆子，争当排行榜第一名吧！")
-
-    def close(self):
-        """
-        关闭资源，例如数据库连接。
-        """
-        self.bean_manager.close_connection()
-
-
+"""
+排行榜功能模块
+"""
+import threading
+import time
+from utils.bean_actions import BeanManager  # 假设 BeanManager 类保存在 bean_manager.py 文件中
+from utils.command_router import CommandRouter
+from utils.lru_cache import CACHE_HITS, CACHE_MISSES
+
+# 排行榜每页显示的用户数
+PAGE_SIZE = 10
+# 排行榜回复缓存的最短有效期（秒），期间即使前几名发生变化也直接使用缓存，用于吸收突发的请求
+CACHE_TTL_FLOOR = 2.0
+
+
+class FunctionModule:
+    """
+    FunctionModule 类，实现豆子排行榜功能。
+    """
+
+    _instance = None
+    # 命令标识，用于标注什么样的命令开头会调用这个功能模块
+    # 比如用户发送 "@机器人 排行榜" 或 "@机器人 查看排行榜" 会触发这个模块
+    # "排行榜 2" 查看第 2 页，"我的排名" 查看自己的名次和前后的用户
+    _command_sign = ["排行榜", "查看排行榜", "我的排名"]
+    _reply_string = None
+    # 模块激活状态
+    is_active = True  # 设置为 True，表示模块被激活
+    # process_messages 接收路由解析好的参数
+    accept_args = True
+
+    def __new__(cls):
+        """
+        单例实现。
+        """
+        if cls._instance is None:
+            cls._instance = super(FunctionModule, cls).__new__(cls)
+        return cls._instance
+
+    def __init__(self):
+        """
+        初始化方法。
+        """
+        if not hasattr(self, '_initialized'):
+            self._initialized = True
+            # 初始化操作
+            self.bean_manager = BeanManager()
+            # 直接调用 process_messages 而没有传入参数时，用于解析消息
+            self.router = CommandRouter({command: self for command in self._command_sign})
+            # 第一页排行榜的回复缓存，只有前几名的成员或顺序变化时才失效
+            self._cache_lock = threading.Lock()
+            self._cached_reply = None
+            self._cached_time = 0.0
+            self._cached_valid = False
+            # 缓存中的用户名，以及最后一名的排序键 (-豆子数量, 用户名)
+            self._cached_usernames = set()
+            self._cached_last_key = None
+            self._cache_version = 0
+            self.bean_manager.add_balance_listener(self.on_balance_changed)
+
+    def get_command_sign(self):
+        """
+        返回当前模块的命令标识
+        """
+        return self._command_sign
+
+    def process_messages(self, sender_nickname, content, args=None):
+        """
+        根据发消息人的昵称和消息内容，处理排行榜的请求。
+
+        Args:
+            sender_nickname (str): 发送者的昵称。
+            content (str): 消息内容。
+            args (CommandArgs): 路由解析好的命令和参数，为 None 时自行解析。
+
+        Returns:
+            str: 回复消息。
+        """
+        if args is None:
+            _, args = self.router.route(content)
+            if args is None:
+                return "无法识别的指令。你可以发送'排行榜'、'排行榜 页码'或'我的排名'。"
+        if args.command == '我的排名':
+            return self.get_rank_reply(sender_nickname)
+
+        page = 1
+        if args.args:
+            try:
+                page = int(args.args[0])
+            except ValueError:
+                page = 0
+            if page < 1:
+                return "页码需要是正整数，例如：排行榜 2"
+        if page == 1:
+            return self.get_top_reply()
+
+        users = self.bean_manager.get_users_by_rank((page - 1) * PAGE_SIZE + 1, PAGE_SIZE)
+        total_pages = (self.bean_manager.get_user_total() + PAGE_SIZE - 1) // PAGE_SIZE
+        if not users:
+            return f"排行榜只有 {total_pages} 页。"
+        reply_lines = [f"📊 豆子排行榜第 {page}/{total_pages} 页："]
+        for rank, username, total_beans in users:
+            reply_lines.append(f"第 {rank} 名：{username}，豆子数量：{total_beans}")
+        return "\n".join(reply_lines)
+
+    def get_top_reply(self):
+        """
+        返回第一页排行榜，优先使用缓存
+        """
+        with self._cache_lock:
+            if self._cached_reply is not None and (
+                    self._cached_valid or time.monotonic() - self._cached_time < CACHE_TTL_FLOOR):
+                CACHE_HITS.inc(cache='leaderboard')
+                return self._cached_reply
+            version = self._cache_version
+        CACHE_MISSES.inc(cache='leaderboard')
+
+        # 获取豆子数量最多的前 10 名用户
+        top_users = self.bean_manager.get_top_users(PAGE_SIZE)
+        if top_users:
+            reply_lines = ["📊 当前豆子排行榜："]
+            for rank, (username, total_beans) in enumerate(top_users, start=1):
+                reply_lines.append(f"第 {rank} 名：{username}，豆子数量：{total_beans}")
+            reply = "\n".join(reply_lines)
+        else:
+            reply = "当前还没有用户领取豆子，快来成为第一个领取豆子的人吧！"
+
+        with self._cache_lock:
+            self._cached_reply = reply
+            self._cached_time = time.monotonic()
+            # 查询期间前几名发生了变化时，查询结果可能已经过期，只在最短有效期内使用
+            self._cached_valid = self._cache_version == version
+            self._cached_usernames = {username for username, _ in top_users}
+            self._cached_last_key = (-top_users[-1][1], top_users[-1][0]) if top_users else None
+        return reply
+
+    def on_balance_changed(self, username, old_total, new_total):
+        """
+        豆子数量变化时判断是否影响第一页排行榜，影响时让缓存失效
+        """
+        with self._cache_lock:
+            if username is None or username in self._cached_usernames:
+                # 榜上用户的豆子数量变化，名次或显示的数量会变
+                affected = True
+            elif len(self._cached_usernames) < PAGE_SIZE:
+                # 榜单未满，任何用户都可能上榜
+                affected = True
+            else:
+                # 排在当前最后一名之前才会挤进榜单
+                affected = (-new_total, username) < self._cached_last_key
+            if affected:
+                self._cached_valid = False
+                self._cache_version += 1
+
+    def get_rank_reply(self, sender_nickname):
+        """
+        返回用户自己的名次以及排在前后的用户
+        """
+        users = self.bean_manager.get_users_around(sender_nickname)
+        if not users:
+            return f"{sender_nickname}，您还没有豆子，发送'领豆子'即可上榜。"
+        reply_lines = []
+        for rank, username, total_beans in users:
+            if username == sender_nickname:
+                reply_lines.insert(0, f"{sender_nickname}，您当前排在第 {rank} 名，豆子数量：{total_beans}。")
+                reply_lines.append(f"👉 第 {rank} 名：{username}，豆子数量：{total_beans}")
+            else:
+                reply_lines.append(f"第 {rank} 名：{username}，豆子数量：{total_beans}")
+        return "\n".join(reply_lines)
+
+    @staticmethod
+    def get_simple_description():
+        """
+        返回简单的功能描述
+        """
+        return "查看豆子排行榜，显示前 10 名用户的豆子数量，也可以翻页或查看自己的名次。"
+
+    @staticmethod
+    def get_detail_description():
+        """
+        返回详细的功能描述
+        """
+        return ("【豆子排行榜功能说明】\n"
+                "您可以通过发送“排行榜”或“查看排行榜”来查看豆子排行榜。\n"
+                "排行榜显示拥有豆子数量最多的前 10 名用户。\n"
+                "发送“排行榜 2”查看第 2 页，发送“我的排名”查看自己的名次和前后的用户。\n"
+                "快来领取豆子，争当排行榜第一名吧！")
+
+    def on_unload(self):
+        """
+        模块被热重载替换时取消注册的回调，BeanManager 由新版本继续使用，不关闭。
+        """
+        self.bean_manager.remove_balance_listener(self.on_balance_changed)
+
+    def close(self):
+        """
+        关闭资源，例如数据库连接。
+        """
+        self.bean_manager.close_connection()
+
+
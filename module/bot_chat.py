@@ -1,180 +1,271 @@
-"""
-使用openapi接口进行聊天的模块
-"""
-import os
-from openai import OpenAI
-
-
-class FunctionModule:
-    """
-    ChatGPTModule 类，实现与 OpenAI ChatGPT 模型的聊天互动。
-    """
-
-    _instance = None
-    # 命令标识，用于标注什么样的命令开头会调用这个功能模块
-    # 比如用户发送 "@机器人 聊天" 或 "@机器人 闲聊" 会触发这个模块
-    _command_sign = ["聊天"]
-    _reply_string = None
-    # 模块激活状态
-    is_active = True  # 设置为 True，表示模块被激活
-
-    def __new__(cls):
-        """
-        单例实现。
-        """
-        if cls._instance is None:
-            cls._instance = super(FunctionModule, cls).__new__(cls)
-        return cls._instance
-
-    def __init__(self):
-        """
-        初始化方法。
-        """
-        if not hasattr(self, '_initialized'):
-            self._initialized = True
-            # 初始化操作
-            print("初始化 ChatGPTModule 实例")
-            # 在这里初始化 OpenAI API 设置
-            self.api_key = 'sk-8AZopg1uvf41Rthisisnottruekkey55EjUfhimGyb8HLjc2'  # 请替换为您的实际 API 密钥
-            self.api_base = 'https://api.openai-proxy.org/v1'  # API 基础 URL，包含 /v1 后缀
-            self.model = 'gpt-3.5-turbo'  # 使用的模型名称
-            self.max_windows = 5  # 每个用户的上下文消息最多保留 5 条
-            self.max_users = 100  # 最多保存 100 个用户的会话
-            self.user_contexts = {}  # 用于保存用户的上下文
-            self.client = OpenAI(
-                # openai系列的sdk，包括langchain，都需要这个/v1的后缀
-                base_url=self.api_base,
-                api_key=self.api_key,
-            )
-
-    def get_command_sign(self):
-        """
-        返回当前模块的命令标识
-        """
-        return self._command_sign
-
-    def process_messages(self, sender_nickname, content, directly=False):
-        """
-        根据发消息人的昵称和消息内容，与 ChatGPT 进行对话。
-
-        Args:
-            sender_nickname (str): 发送者的昵称。
-            content (str): 消息内容。
-            directly : 判断是否是直接发送消息聊天还是通过命令调用聊天
-
-        Returns:
-            str: 回复消息。
-        """
-        # 去掉命令标识，获取实际用户输入
-        user_message = content
-        if not directly:
-            # 如果是通过命令调用聊天的话
-            for sign in self._command_sign:
-                if content.startswith(sign):
-                    user_message = content[len(sign):].strip()
-                    break
-
-        # 如果用户没有输入内容，则提示用户输入
-        if not user_message:
-            self._reply_string = "请在命令后添加您想说的话，例如：'聊天 你好！'"
-            return self.get_reply()
-
-        # 管理用户上下文
-        # 检查用户是否在上下文字典中
-        if sender_nickname not in self.user_contexts:
-            # 如果用户数量超过最大值，则删除最早的用户
-            if len(self.user_contexts) >= self.max_users:
-                first_user = next(iter(self.user_contexts))
-                del self.user_contexts[first_user]
-            # 初始化该用户的上下文列表
-            self.user_contexts[sender_nickname] = []
-
-        # 获取该用户的上下文
-        user_context = self.user_contexts[sender_nickname]
-
-        # 添加新消息到上下文
-        user_context.append({'role': 'user', 'content': user_message})
-        # 只保留最近的 max_windows * 2 条消息（因为包括 AI 的回复）
-        if len(user_context) > self.max_windows * 2:
-            user_context = user_context[-self.max_windows * 2:]
-
-        # 更新上下文
-        self.user_contexts[sender_nickname] = user_context
-
-        # 调用 OpenAI ChatCompletion API 进行对话
-        try:
-            response = self.client.chat.completions.create(
-                model=self.model,
-                messages=user_context
-            )
-            # 提取 AI 回复的内容
-            ai_reply = response.choices[0].message.content
-
-            # 将 AI 的回复也加入上下文
-            user_context.append({'role': 'assistant', 'content': ai_reply})
-            # 同样只保留最近的 max_windows * 2 条消息
-            if len(user_context) > self.max_windows * 2:
-                user_context = user_context[-self.max_windows * 2:]
-            # 更新上下文
-            self.user_contexts[sender_nickname] = user_context
-
-            self._reply_string = ai_reply
-        except Exception as e:
-            # 处理异常
-            self._reply_string = f"抱歉，{sender_nickname}，发生错误：{str(e)}"
-        return self.get_reply()
-
-    @staticmethod
-    def get_simple_description():
-        """
-        返回简单的功能描述
-        """
-        return "与 ChatGPT 进行聊天互动"
-
-    @staticmethod
-    def get_detail_description():
-        """
-        返回详细的功能描述
-        """
-        return ("【聊天功能说明】\n"
-                "您可以通过发送“聊天”或“闲聊”作为开头，再加上您的消息，与 ChatGPT 进行对话。\n"
-                "例如：“聊天 今天的天气怎么样？”\n"
-                "ChatGPT 将会回复您的问题。")
-
-    def get_reply(self):
-        """
-        返回最终的回复内容
-        """
-        return self._reply_string
-
-    def close(self):
-        """
-        如果需要，关闭与 OpenAI 的连接（在这个例子中不需要）。
-        """
-        pass
-
-
-if __name__ == "__main__":
-    chat_module = FunctionModule()
-    # 模拟多个用户的对话
-    users = ["Alice", "Bob", "Charlie", "David", "Eve"]
-    messages = [
-        "聊天 你好，今天天气怎么样？",
-        "闲聊 给我讲个笑话吧！",
-        "聊天 你知道OpenAI吗？",
-        "闲聊 讲个故事吧。",
-        "聊天 谈谈人工智能的发展。"
-    ]
-    for sender, message in zip(users, messages):
-        reply = chat_module.process_messages(sender, message)
-        print(f"{sender}: {message}")
-        print(f"ChatGPT: {reply}")
-
-    # 测试超过用户上限的情况
-    for i in range(101):
-        sender = f"User_{i}"
-        message = "聊天 测试用户上限。"
-        reply = chat_module.process_messages(sender, message)
-        print(f"{sender}: {message}")
-        print(f"ChatGPT: {reply}")
-    print(f"当前用户数量：{len(chat_module.user_contexts)}")  # 应该不超过 100
+"""
+使用openapi接口进行聊天的模块
+"""
+import asyncio
+import logging
+import os
+import time
+from openai import AsyncOpenAI
+from utils.context_store import ContextStore
+from utils.event_loop_thread import EventLoopThread
+from utils.metrics import METRICS
+
+CHAT_REQUEST_SECONDS = METRICS.histogram('wechatbot_chat_request_seconds', '聊天接口请求的耗时（含等待并发名额）',
+                                         ('result',))
+CHAT_IN_FLIGHT = METRICS.gauge('wechatbot_chat_in_flight', '正在请求或等待并发名额的聊天请求数')
+
+
+class FunctionModule:
+    """
+    ChatGPTModule 类，实现与 OpenAI ChatGPT 模型的聊天互动。
+    """
+
+    _instance = None
+    # 命令标识，用于标注什么样的命令开头会调用这个功能模块
+    # 比如用户发送 "@机器人 聊天" 或 "@机器人 闲聊" 会触发这个模块
+    _command_sign = ["聊天"]
+    _reply_string = None
+    # 模块激活状态
+    is_active = True  # 设置为 True，表示模块被激活
+    # 会发起网络请求，走低优先级通道
+    is_blocking = True
+    # 单次对话的期限（秒），包括等待并发名额的时间，超时后取消请求并回复 fallback_reply
+    timeout = 60
+    fallback_reply = '聊天服务响应超时，请稍后再试。'
+
+    def __new__(cls):
+        """
+        单例实现。
+        """
+        if cls._instance is None:
+            cls._instance = super(FunctionModule, cls).__new__(cls)
+        return cls._instance
+
+    def __init__(self):
+        """
+        初始化方法。
+        """
+        if not hasattr(self, '_initialized'):
+            self._initialized = True
+            # 初始化操作
+            print("初始化 ChatGPTModule 实例")
+            # 在这里初始化 OpenAI API 设置
+            # 可以通过环境变量指向其它兼容接口，如 benchmarks/mock_openai.py 启动的本地模拟接口
+            self.api_key = os.environ.get('OPENAI_API_KEY',
+                                          'sk-8AZopg1uvf41Rthisisnottruekkey55EjUfhimGyb8HLjc2')  # 请替换为您的实际 API 密钥
+            self.api_base = os.environ.get('OPENAI_BASE_URL',
+                                           'https://api.openai-proxy.org/v1')  # API 基础 URL，包含 /v1 后缀
+            self.model = 'gpt-3.5-turbo'  # 使用的模型名称
+            self.max_windows = 5  # 每个用户的上下文最多保留 5 轮对话
+            self.max_context_tokens = 1500  # 每个用户上下文的估算 token 预算，超过时删除最早的消息
+            self.max_context_bytes = 16 * 1024 * 1024  # 所有上下文占用的内存上限，超过时淘汰最久没有聊天的用户
+            # 用于保存用户的上下文，重启后从快照恢复
+            self.context_path = os.path.join('.', 'data', 'chat_contexts.bin')
+            self.snapshot_interval = 60  # 有修改时保存快照的间隔（秒）
+            self.user_contexts = ContextStore(max_tokens=self.max_context_tokens,
+                                              max_messages=self.max_windows * 2,
+                                              max_bytes=self.max_context_bytes)
+            self.user_contexts.load(self.context_path)
+            # 同时进行的请求数上限，不超过客户端连接池保留的长连接数（默认 100），请求都复用已有连接
+            self.max_concurrency = 50
+            # 所有请求都在这个事件循环中执行，等待接口时不占用处理消息的线程
+            self.loop_thread = EventLoopThread('ChatLoop').start()
+            self.semaphore = asyncio.Semaphore(self.max_concurrency)
+            # 正在请求或等待并发名额的请求数，只在事件循环中修改
+            self.in_flight = 0
+            CHAT_IN_FLIGHT.set_function(lambda: self.in_flight)
+            # 整个模块共用一个客户端和它的连接池
+            self.client = AsyncOpenAI(
+                # openai系列的sdk，包括langchain，都需要这个/v1的后缀
+                base_url=self.api_base,
+                api_key=self.api_key,
+                timeout=self.timeout,
+                max_retries=1,
+            )
+            self.loop_thread.loop.call_soon_threadsafe(self._schedule_snapshot)
+
+    def get_command_sign(self):
+        """
+        返回当前模块的命令标识
+        """
+        return self._command_sign
+
+    def process_messages(self, sender_nickname, content, directly=False):
+        """
+        根据发消息人的昵称和消息内容，与 ChatGPT 进行对话，等待回复后返回。
+
+        会占用调用的线程直到收到回复，机器人使用 submit_messages，不需要等待。
+
+        Args:
+            sender_nickname (str): 发送者的昵称。
+            content (str): 消息内容。
+            directly : 判断是否是直接发送消息聊天还是通过命令调用聊天
+
+        Returns:
+            str: 回复消息。
+        """
+        return self.submit_messages(sender_nickname, content, directly).result()
+
+    def submit_messages(self, sender_nickname, content, directly=False):
+        """
+        把消息交给模块的事件循环处理，立即返回。
+
+        Returns:
+            concurrent.futures.Future: 结果为回复消息。
+        """
+        return self.loop_thread.submit(self.process_messages_async(sender_nickname, content, directly))
+
+    async def process_messages_async(self, sender_nickname, content, directly=False):
+        """
+        process_messages 的异步实现，只在模块的事件循环中执行，因此访问上下文不需要加锁
+        """
+        # 去掉命令标识，获取实际用户输入
+        user_message = content
+        if not directly:
+            # 如果是通过命令调用聊天的话
+            for sign in self._command_sign:
+                if content.startswith(sign):
+                    user_message = content[len(sign):].strip()
+                    break
+
+        # 如果用户没有输入内容，则提示用户输入
+        if not user_message:
+            return "请在命令后添加您想说的话，例如：'聊天 你好！'"
+
+        # 添加新消息到上下文，超过 token 预算或消息数时删除最早的消息
+        self.user_contexts.add_message(sender_nickname, 'user', user_message)
+
+        # 调用 OpenAI ChatCompletion API 进行对话
+        start = time.perf_counter()
+        result = 'ok'
+        self.in_flight += 1
+        try:
+            # 超过期限时 wait_for 取消请求，连接由连接池关闭
+            ai_reply = await asyncio.wait_for(
+                self.request_completion(self.user_contexts.get_messages(sender_nickname)), self.timeout)
+
+            # 将 AI 的回复也加入上下文
+            self.user_contexts.add_message(sender_nickname, 'assistant', ai_reply)
+            return ai_reply
+        except asyncio.TimeoutError:
+            result = 'timeout'
+            return self.fallback_reply
+        except Exception as e:
+            # 处理异常
+            result = 'error'
+            return f"抱歉，{sender_nickname}，发生错误：{str(e)}"
+        finally:
+            self.in_flight -= 1
+            CHAT_REQUEST_SECONDS.observe(time.perf_counter() - start, result=result)
+
+    async def request_completion(self, messages):
+        """
+        在并发名额内请求接口，返回 AI 回复的内容
+        """
+        async with self.semaphore:
+            response = await self.client.chat.completions.create(
+                model=self.model,
+                messages=messages
+            )
+        # 提取 AI 回复的内容
+        return response.choices[0].message.content
+
+    @staticmethod
+    def get_simple_description():
+        """
+        返回简单的功能描述
+        """
+        return "与 ChatGPT 进行聊天互动"
+
+    @staticmethod
+    def get_detail_description():
+        """
+        返回详细的功能描述
+        """
+        return ("【聊天功能说明】\n"
+                "您可以通过发送“聊天”或“闲聊”作为开头，再加上您的消息，与 ChatGPT 进行对话。\n"
+                "例如：“聊天 今天的天气怎么样？”\n"
+                "ChatGPT 将会回复您的问题。")
+
+    def get_reply(self):
+        """
+        返回最终的回复内容
+        """
+        return self._reply_string
+
+    def _schedule_snapshot(self):
+        self.loop_thread.loop.call_later(self.snapshot_interval, self._snapshot_if_dirty)
+
+    def _snapshot_if_dirty(self):
+        """
+        上下文有修改时在线程池中保存快照，不阻塞事件循环
+        """
+        if self.user_contexts.dirty:
+            self.loop_thread.loop.run_in_executor(None, self.save_contexts)
+        self._schedule_snapshot()
+
+    def save_contexts(self):
+        """
+        把上下文快照保存到 context_path
+        """
+        try:
+            self.user_contexts.save(self.context_path)
+        except OSError as exception:
+            logging.error("保存聊天上下文失败：%s", exception)
+
+    def export_state(self):
+        """
+        热重载时交给新版本的会话上下文
+        """
+        return self.user_contexts
+
+    def import_state(self, state):
+        """
+        使用旧版本的会话上下文，指标改为读取它
+        """
+        self.user_contexts = state
+        self.user_contexts.bind_metrics()
+
+    def on_unload(self):
+        """
+        被热重载替换后，等待进行中的请求结束再关闭
+        """
+        self.close()
+
+    def close(self):
+        """
+        等待进行中的请求结束（最多 timeout 秒），保存上下文，然后关闭连接池和事件循环。
+        """
+        if self.loop_thread.loop.is_closed():
+            return
+        self.loop_thread.drain(self.timeout)
+        self.save_contexts()
+        self.loop_thread.submit(self.client.close()).result()
+        self.loop_thread.stop()
+
+
+if __name__ == "__main__":
+    chat_module = FunctionModule()
+    # 模拟多个用户的对话
+    users = ["Alice", "Bob", "Charlie", "David", "Eve"]
+    messages = [
+        "聊天 你好，今天天气怎么样？",
+        "闲聊 给我讲个笑话吧！",
+        "聊天 你知道OpenAI吗？",
+        "闲聊 讲个故事吧。",
+        "聊天 谈谈人工智能的发展。"
+    ]
+    for sender, message in zip(users, messages):
+        reply = chat_module.process_messages(sender, message)
+        print(f"{sender}: {message}")
+        print(f"ChatGPT: {reply}")
+
+    # 测试大量用户的情况，内存按字节数限制
+    for i in range(101):
+        sender = f"User_{i}"
+        message = "聊天 测试用户上限。"
+        reply = chat_module.process_messages(sender, message)
+        print(f"{sender}: {message}")
+        print(f"ChatGPT: {reply}")
+    print(f"当前用户数量：{len(chat_module.user_contexts)}，上下文占用约 {chat_module.user_contexts.size} 字节")
+    chat_module.close()
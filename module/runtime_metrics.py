@@ -0,0 +1,84 @@
+"""
+运行状态模块，管理员可以在聊天中查看机器人的运行指标
+"""
+from utils.metrics import METRICS
+
+
+class FunctionModule:
+    """
+    FunctionModule 类，输出队列、命令耗时、发送和数据库等运行指标。
+    """
+
+    _instance = None
+    # 命令标识，用于标注什么样的命令开头会调用这个功能模块
+    # 如@机器人 运行状态 或者 @机器人 metrics 就会触发这个模块
+    _command_sign = ["运行状态", "metrics"]
+    _reply_string = None
+    # 允许查看运行状态的管理员昵称，为空时所有人都不能查看
+    _admin_users = []
+    # 模块激活状态
+    is_active = True
+
+    def __new__(cls):
+        """
+        单例实现。
+        """
+        if cls._instance is None:
+            cls._instance = super(FunctionModule, cls).__new__(cls)
+        return cls._instance
+
+    def __init__(self):
+        """
+        初始化方法。
+        """
+        if not hasattr(self, '_initialized'):
+            self._initialized = True
+
+    def get_command_sign(self):
+        """
+        返回当前模块的命令标识
+        """
+        return self._command_sign
+
+    def process_messages(self, sender_nickname, content):
+        """
+        根据发消息人的昵称和消息内容，返回运行指标。
+
+        Args:
+            sender_nickname (str): 发送者的昵称。
+            content (str): 消息内容，命令后可以跟指标名前缀，如“运行状态 wechatbot_command”。
+
+        Returns:
+            str: 回复消息。
+        """
+        if sender_nickname not in self._admin_users:
+            self._reply_string = "抱歉，只有管理员可以查看运行状态。"
+            return self.get_reply()
+        parts = content.split()
+        prefix = parts[1] if len(parts) > 1 else ''
+        summary = METRICS.summary(prefix)
+        self._reply_string = f"📈 运行状态：\n{summary}" if summary else "暂时没有运行指标。"
+        return self.get_reply()
+
+    @staticmethod
+    def get_simple_description():
+        """
+        返回简单的功能描述
+        """
+        return "管理员查看机器人的运行指标"
+
+    @staticmethod
+    def get_detail_description():
+        """
+        返回详细的功能描述
+        """
+        return ("【运行状态功能说明】\n"
+                "管理员可以发送“运行状态”或“metrics”查看队列长度、排队时间、各命令耗时、发送耗时、"
+                "工作线程忙闲时间和数据库语句耗时。\n"
+                "命令后可以加指标名前缀进行过滤，例如：“运行状态 wechatbot_command”。")
+
+    def get_reply(self):
+        """
+        返回最终的回复内容
+        """
+        return self._reply_string
@@ -0,0 +1,161 @@
+"""
+基于 asyncio 的消息分发器
+"""
+import asyncio
+import collections
+import logging
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from utils.metrics import METRICS
+from utils.shard_scheduler import (LANE_HIGH, LANE_LOW, LANE_NAMES, SHED_POLICIES, SHED_MESSAGES,
+                                   COLLAPSED_MESSAGES, QueuedMessage)
+
+QUEUE_WAIT = METRICS.histogram('wechatbot_queue_wait_seconds', '消息在队列中的等待时间')
+
+
+class AsyncDispatcher:
+    """
+    在独立线程中运行事件循环，每条消息作为一个任务处理。
+
+    同一发送者的消息按到达顺序依次处理，不同发送者之间互不阻塞；
+    阻塞型的调用（如网络请求）放到线程池中执行，不占用事件循环。
+
+    与 ShardScheduler 使用相同的准入规则：最多排队 max_pending 条消息，超出时按 shed_policy 丢弃；
+    同一发送者排队中已有相同内容的消息时，新消息直接合并掉。
+    """
+
+    def __init__(self, handler, max_blocking_workers=5, max_pending=10000, shed_policy='drop_low'):
+        """
+        Args:
+            handler (coroutine function): 处理单条消息的协程函数，参数为 submit 时传入的消息。
+            max_blocking_workers (int): 执行阻塞型模块的线程数。
+            max_pending (int): 最多排队的消息数。
+            shed_policy (str): 队列满时的丢弃策略，见 shard_scheduler.SHED_POLICIES。
+        """
+        if shed_policy not in SHED_POLICIES:
+            raise ValueError(f"未知的丢弃策略：{shed_policy}")
+        self.handler = handler
+        self.max_pending = max(1, max_pending)
+        self.shed_policy = shed_policy
+        self.loop = asyncio.new_event_loop()
+        self.blocking_executor = ThreadPoolExecutor(max_workers=max_blocking_workers,
+                                                    thread_name_prefix='Blocking')
+        # 每个发送者待处理的消息（QueuedMessage），有消息或正在处理时存在；
+        # 接收消息的线程和事件循环线程都会访问，需要持有 _lock
+        self._sender_queues = {}
+        self._lock = threading.Lock()
+        # 等待处理的消息数，以及每个通道中的消息数
+        self._pending_count = 0
+        self._lane_pending = [0, 0]
+        self._loop_thread = None
+
+    def start(self):
+        """
+        启动事件循环线程
+        """
+        self._loop_thread = threading.Thread(target=self._run_loop, name='AsyncDispatcher')
+        self._loop_thread.daemon = True
+        self._loop_thread.start()
+
+    def stop(self):
+        """
+        停止事件循环并关闭线程池
+        """
+        self.loop.call_soon_threadsafe(self.loop.stop)
+        if self._loop_thread is not None:
+            self._loop_thread.join(timeout=5)
+        self.blocking_executor.shutdown(wait=False)
+
+    def _run_loop(self):
+        asyncio.set_event_loop(self.loop)
+        self.loop.run_forever()
+
+    def submit(self, sender_key, item, lane=LANE_LOW, dedupe_key=None):
+        """
+        从任意线程提交一条消息，sender_key 相同的消息按提交顺序处理
+
+        Args:
+            sender_key (tuple): (会话, 成员)。
+            item: 消息内容，作为 handler 的参数。
+            lane (int): 优先级通道，LANE_HIGH 或 LANE_LOW，队列满时用于选择丢弃的消息。
+            dedupe_key: 用于判断重复消息的值，为 None 时不合并。
+
+        Returns:
+            list: 因为队列已满被丢弃的消息（可能是新消息，也可能是排队中的低优先级消息）。
+        """
+        with self._lock:
+            pending = self._sender_queues.get(sender_key)
+            if pending is not None and dedupe_key is not None and any(
+                    queued.dedupe_key == dedupe_key for queued in pending):
+                COLLAPSED_MESSAGES.inc()
+                return []
+            shed = []
+            if self._pending_count >= self.max_pending:
+                evicted = self._evict_low() if self.shed_policy == 'drop_low' and lane == LANE_HIGH else None
+                if evicted is None:
+                    SHED_MESSAGES.inc(lane=LANE_NAMES[lane])
+                    return [item]
+                SHED_MESSAGES.inc(lane=LANE_NAMES[LANE_LOW])
+                shed.append(evicted)
+            self._pending_count += 1
+            self._lane_pending[lane] += 1
+            if pending is not None:
+                # 该发送者已有任务在处理，排在后面即可
+                pending.append(QueuedMessage(item, lane, dedupe_key))
+                return shed
+            pending = collections.deque([QueuedMessage(item, lane, dedupe_key)])
+            self._sender_queues[sender_key] = pending
+        self.loop.call_soon_threadsafe(self._start_drain, sender_key, pending)
+        return shed
+
+    def _evict_low(self):
+        """
+        丢弃一条排队的低优先级消息，只丢弃发送者队列末尾的消息以保证剩余消息的顺序，调用时需持有 _lock
+
+        Returns:
+            被丢弃的消息内容，没有可丢弃的消息时返回 None。
+        """
+        if not self._lane_pending[LANE_LOW]:
+            return None
+        for pending in self._sender_queues.values():
+            if pending and pending[-1].lane == LANE_LOW:
+                # 队列变空时由处理任务移除该发送者
+                evicted = pending.pop()
+                self._pending_count -= 1
+                self._lane_pending[LANE_LOW] -= 1
+                return evicted.item
+        return None
+
+    def qsize(self):
+        """
+        返回等待处理的消息数
+        """
+        return self._pending_count
+
+    def _start_drain(self, sender_key, pending):
+        self.loop.create_task(self._drain(sender_key, pending))
+
+    async def _drain(self, sender_key, pending):
+        """
+        依次处理同一发送者的消息，处理完毕后移除该发送者的状态
+        """
+        while True:
+            with self._lock:
+                if not pending:
+                    del self._sender_queues[sender_key]
+                    return
+                queued = pending.popleft()
+                self._pending_count -= 1
+                self._lane_pending[queued.lane] -= 1
+            QUEUE_WAIT.observe(time.monotonic() - queued.enqueue_time)
+            try:
+                await self.handler(queued.item)
+            except Exception as exception:
+                logging.error("消息处理时发生异常：%s", exception)
+
+    async def run_blocking(self, func, *args):
+        """
+        在阻塞线程池中执行函数并等待结果
+        """
+        return await self.loop.run_in_executor(self.blocking_executor, func, *args)
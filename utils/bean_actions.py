@@ -1,279 +1,409 @@
-"""
-用于处理豆子的类
-"""
-import os
-import sqlite3
-import datetime
-
-# 全局定义数据库路径
-DB_DIRECTORY = './data/'
-DB_PATH = os.path.join(DB_DIRECTORY, 'beans.db')
-
-
-class BeanManager:
-    """
-    处理豆子相关功能的类，采用单例模式。
-    """
-    _instance = None  # 用于存储单例实例
-    conn = None  # 用于存储数据库连接
-
-    def __new__(cls):
-        if cls._instance is None:
-            # 如果实例不存在，创建一个新的实例
-            cls._instance = super(BeanManager, cls).__new__(cls)
-            # 创建并保存数据库连接
-            cls._instance.conn = sqlite3.connect(DB_PATH,check_same_thread=False)
-            # 在第一次创建实例后，初始化数据库
-            cls._instance.init_db()
-            print("初始化 BeanManager 单例实例")
-        return cls._instance
-
-    def init_db(self):
-        """
-        初始化数据库，创建用户豆子表（如果尚未创建）。
-        """
-        # 如果目录不存在，创建目录
-        if not os.path.exists(DB_DIRECTORY):
-            os.makedirs(DB_DIRECTORY)
-
-        # 使用实例的连接
-        cursor = self.conn.cursor()
-
-        # 创建表（如果不存在）
-        cursor.execute('''
-            CREATE TABLE IF NOT EXISTS user_beans (
-                username TEXT PRIMARY KEY,
-                last_collect_time TEXT,
-                total_beans INTEGER
-            )
-        ''')
-        self.conn.commit()
-
-    def collect_beans(self, username):
-        """
-        处理用户领取豆子的请求。
-
-        如果用户上次领取豆子的时间距离现在超过一周，则允许领取并增加豆子数量；
-        否则，提示领取失败。
-
-        Args:
-            username (str): 用户名。
-
-        Returns:
-            bool: 如果成功领取豆子，返回 True；否则返回 False。
-        """
-        cursor = self.conn.cursor()
-
-        # 确保表已创建（如果未调用 init_db，这一步保证表存在）
-        cursor.execute('''
-            CREATE TABLE IF NOT EXISTS user_beans (
-                username TEXT PRIMARY KEY,
-                last_collect_time TEXT,
-                total_beans INTEGER
-            )
-        ''')
-
-        # 查询用户数据
-        cursor.execute('SELECT last_collect_time, total_beans FROM user_beans WHERE username = ?', (username,))
-        result = cursor.fetchone()
-
-        if result:
-            # 如果用户存在，获取上次领取时间和豆子总数
-            last_collect_time_str, total_beans = result
-            last_collect_time = datetime.datetime.fromisoformat(last_collect_time_str)
-        else:
-            # 如果用户不存在，初始化数据
-            last_collect_time = datetime.datetime(2000, 1, 1)  # 初始化为很早的时间
-            total_beans = 0
-
-        now = datetime.datetime.now()
-        delta = now - last_collect_time
-
-        if delta >= datetime.timedelta(weeks=1):
-            # 如果距离上次领取时间超过一周，给予领取
-            total_beans += 10000
-            last_collect_time_str = now.isoformat()
-
-            # 更新或插入用户数据
-            cursor.execute('''
-                INSERT INTO user_beans (username, last_collect_time, total_beans)
-                VALUES (?, ?, ?)
-                ON CONFLICT(username)
-                DO UPDATE SET last_collect_time=excluded.last_collect_time, total_beans=excluded.total_beans
-            ''', (username, last_collect_time_str, total_beans))
-            self.conn.commit()
-            return True  # 返回成功
-        return False  # 返回失败，未到领取时间
-
-    def add_beans(self, username, amount):
-        """
-        给指定用户增加豆子数量。
-
-        Args:
-            username (str): 用户名。
-            amount (int): 要增加的豆子数量。
-
-        Returns:
-            None
-        """
-        cursor = self.conn.cursor()
-
-        # 确保表已创建
-        cursor.execute('''
-            CREATE TABLE IF NOT EXISTS user_beans (
-                username TEXT PRIMARY KEY,
-                last_collect_time TEXT,
-                total_beans INTEGER
-            )
-        ''')
-
-        # 查询用户的豆子数量
-        cursor.execute('SELECT total_beans FROM user_beans WHERE username = ?', (username,))
-        result = cursor.fetchone()
-
-        if result:
-            # 如果用户存在，更新豆子数量
-            total_beans = result[0] + amount
-            cursor.execute('''
-                UPDATE user_beans
-                SET total_beans = ?
-                WHERE username = ?
-            ''', (total_beans, username))
-        else:
-            # 如果用户不存在，插入新用户
-            total_beans = amount
-            last_collect_time_str = datetime.datetime.now().isoformat()
-            cursor.execute('''
-                INSERT INTO user_beans (username, last_collect_time, total_beans)
-                VALUES (?, ?, ?)
-            ''', (username, last_collect_time_str, total_beans))
-
-        self.conn.commit()
-
-    def get_bean_count(self, username):
-        """
-        获取指定用户的豆子数量。
-
-        Args:
-            username (str): 用户名。
-
-        Returns:
-            int: 用户的豆子总数。如果用户不存在，返回 0。
-        """
-        cursor = self.conn.cursor()
-
-        # 确保表已创建
-        cursor.execute('''
-            CREATE TABLE IF NOT EXISTS user_beans (
-                username TEXT PRIMARY KEY,
-                last_collect_time TEXT,
-                total_beans INTEGER
-            )
-        ''')
-
-        # 查询用户的豆子数量
-        cursor.execute('SELECT total_beans FROM user_beans WHERE username = ?', (username,))
-        result = cursor.fetchone()
-
-        if result:
-            total_beans = result[0]
-        else:
-            total_beans = 0
-
-        return total_beans
-
-    def get_top_users(self, n=10):
-        """
-        获取豆子数量最多的前 n 个用户。
-
-        Args:
-            n (int): 要获取的用户数量，默认是 10。
-
-        Returns:
-            list of tuple: 包含用户名和豆子数量的列表，格式为 [(username, total_beans), ...]
-        """
-        cursor = self.conn.cursor()
-
-        # 确保表已创建
-        cursor.execute('''
-            CREATE TABLE IF NOT EXISTS user_beans (
-                username TEXT PRIMARY KEY,
-                last_collect_time TEXT,
-                total_beans INTEGER
-            )
-        ''')
-
-        # 查询豆子数量前 n 的用户
-        cursor.execute('''
-            SELECT username, total_beans FROM user_beans
-            ORDER BY total_beans DESC
-            LIMIT ?
-        ''', (n,))
-        result = cursor.fetchall()
-
-        return result
-
-    def get_next_collect_time(self, username):
-        """
-        获取用户下次可领取豆子的时间。
-
-        Args:
-            username (str): 用户名。
-
-        Returns:
-            datetime: 下次可领取时间。如果用户不存在，返回当前时间。
-        """
-        cursor = self.conn.cursor()
-
-        # 查询用户的最后领取时间
-        cursor.execute('SELECT last_collect_time FROM user_beans WHERE username = ?', (username,))
-        result = cursor.fetchone()
-
-        if result:
-            last_collect_time_str = result[0]
-            last_collect_time = datetime.datetime.fromisoformat(last_collect_time_str)
-            next_collect_time = last_collect_time + datetime.timedelta(weeks=1)
-            return next_collect_time
-        else:
-            # 如果用户不存在，立即可领取
-            return datetime.datetime.now()
-
-    def close_connection(self):
-        """
-        关闭数据库连接。
-        """
-        if self.conn:
-            self.conn.close()
-            self.conn = None
-
-
-if __name__ == '__main__':
-    # 获取 BeanManager 实例（单例）
-    bean_manager = BeanManager()
-
-    # 测试代码
-    test_usernames = ['user1', 'user2', 'user3', 'user4', 'user5',
-                      'user6', 'user7', 'user8', 'user9', 'user10',
-                      'user11', 'user12']
-
-    # 模拟用户领取豆子
-    for username in test_usernames:
-        bean_manager.collect_beans(username)
-
-    # 给指定用户增加豆子
-    bean_manager.add_beans('user1', 5000)
-    print("已给 user1 增加 5000 个豆子。")
-
-    # 查询用户的豆子数量
-    for username in test_usernames:
-        beans = bean_manager.get_bean_count(username)
-        print(f"{username} 当前的豆子总数是：{beans}")
-
-    # 获取豆子数量最多的前 10 名用户
-    top_users = bean_manager.get_top_users(10)
-    print("\n豆子数量最多的前 10 名用户：")
-    for rank, (username, total_beans) in enumerate(top_users, start=1):
-        print(f"第 {rank} 名：{username}，豆子数量：{total_beans}")
-
-    # 关闭数据库连接
-    bean_manager.close_connection()
+"""
+用于处理豆子的类
+"""
+import os
+import datetime
+import logging
+import threading
+# Reservation 定义在 bean_store 中，从这里导入以保持原有的导入路径
+from utils.bean_store import MemoryBeanStore, Reservation, ShardedSQLiteBeanStore, SQLiteBeanStore
+from utils.lru_cache import LRUCache
+from utils.rank_index import RankIndex
+
+# 全局定义数据库路径
+DB_DIRECTORY = './data/'
+DB_PATH = os.path.join(DB_DIRECTORY, 'beans.db')
+
+# 存储后端：sqlite 为单个数据库文件，sharded 为按用户分到 NUM_SHARDS 个数据库文件，memory 只保存在内存中，
+# ledger 连接 LEDGER_SOCKET 上的账本服务（utils/bean_ledger.py），多个机器人进程共享同一份数据
+BACKEND = 'sqlite'
+BACKENDS = ('sqlite', 'sharded', 'memory', 'ledger')
+NUM_SHARDS = 4
+LEDGER_SOCKET = os.path.join(DB_DIRECTORY, 'bean_ledger.sock')
+LEDGER_POOL_SIZE = 4
+
+# 磁盘同步级别，NORMAL 或 FULL
+SYNCHRONOUS = 'NORMAL'
+
+# 组提交模式：写操作交给一个写线程，每 GROUP_COMMIT_INTERVAL 秒或每 GROUP_COMMIT_MAX_OPS 个操作提交一次
+GROUP_COMMIT = False
+GROUP_COMMIT_INTERVAL = 0.01
+GROUP_COMMIT_MAX_OPS = 256
+
+# 内存中最多缓存的用户豆子数量
+BALANCE_CACHE_SIZE = 10000
+
+# 每次领取的豆子数量和两次领取的最短间隔
+COLLECT_AMOUNT = 10000
+COLLECT_INTERVAL = datetime.timedelta(weeks=1)
+
+
+def create_store(db_path):
+    """
+    按 BACKEND 的配置创建存储后端
+
+    Args:
+        db_path (str): 数据库文件路径，memory 和 ledger 后端不使用。
+
+    Returns:
+        BeanStore: 存储后端。
+    """
+    options = {'synchronous': SYNCHRONOUS, 'group_commit': GROUP_COMMIT,
+               'group_commit_interval': GROUP_COMMIT_INTERVAL, 'group_commit_max_ops': GROUP_COMMIT_MAX_OPS}
+    if BACKEND == 'sqlite':
+        return SQLiteBeanStore(db_path, **options)
+    if BACKEND == 'sharded':
+        return ShardedSQLiteBeanStore(db_path, NUM_SHARDS, **options)
+    if BACKEND == 'memory':
+        return MemoryBeanStore()
+    if BACKEND == 'ledger':
+        # 账本服务本身也通过 BeanManager 使用其它后端，在这里导入避免循环导入
+        from utils.bean_ledger import LedgerBeanStore
+        return LedgerBeanStore(LEDGER_SOCKET, LEDGER_POOL_SIZE)
+    raise ValueError(f"未知的存储后端：{BACKEND}")
+
+
+class BeanManager:
+    """
+    处理豆子相关功能的类，采用单例模式，每个数据库文件对应一个实例。
+
+    数据的读写交给存储后端（utils/bean_store.py），由 BACKEND 选择；
+    开启组提交（GROUP_COMMIT）时，SQLite 后端的豆子增减由写线程批量提交。
+
+    最近查询过的用户豆子数量缓存在内存中，每次写入时在事务内同步更新缓存，
+    缓存按数据库的提交顺序更新，不会出现旧值覆盖新值；提交失败时清空缓存。
+
+    排行榜的前几页由存储后端按 (total_beans DESC, username) 查询，查询名次时使用内存中的
+    排名索引，第一次查询名次时从存储后端加载，之后随每次写入同步更新。
+
+    其它模块可以通过 add_balance_listener 注册回调，在豆子数量的修改提交后收到通知。
+
+    后端的数据会被其它进程修改时（ledger 后端），不使用本地缓存和排名索引，直接查询后端。
+    """
+    _instances = {}  # 用于存储单例实例，key 为数据库路径
+
+    def __new__(cls, db_path=None):
+        # 不指定路径时使用全局定义的数据库路径
+        db_path = db_path or DB_PATH
+        if db_path not in cls._instances:
+            # 如果实例不存在，创建一个新的实例
+            instance = super(BeanManager, cls).__new__(cls)
+            instance.db_path = db_path
+            instance._local = threading.local()
+            instance.balance_cache = LRUCache('balance', BALANCE_CACHE_SIZE)
+            instance.rank_index = RankIndex()
+            instance._rank_index_lock = threading.Lock()
+            instance._balance_listeners = []
+            instance.store = create_store(db_path)
+            instance.store.set_callbacks(instance._on_balance_changed, instance._notify_balance_listeners,
+                                         instance._reset_derived_state)
+            cls._instances[db_path] = instance
+            print("初始化 BeanManager 单例实例")
+        return cls._instances[db_path]
+
+    def _reset_derived_state(self):
+        """
+        清空豆子数量缓存和排名索引，写入回滚后调用
+        """
+        self.balance_cache.clear()
+        self.rank_index.reset()
+        self._local.balance_changes = []
+        for listener in self._balance_listeners:
+            # 用户名为 None 表示所有用户的豆子数量都可能变化
+            listener(None, None, None)
+
+    def add_balance_listener(self, listener):
+        """
+        注册豆子数量变化的回调，在修改提交后调用，调用时不能再修改豆子
+
+        Args:
+            listener (callable): 参数为 (username, old_total, new_total)，
+                写入回滚时以 (None, None, None) 调用，表示所有数据都需要重新读取。
+        """
+        self._balance_listeners.append(listener)
+
+    def remove_balance_listener(self, listener):
+        """
+        取消注册豆子数量变化的回调
+        """
+        if listener in self._balance_listeners:
+            self._balance_listeners.remove(listener)
+
+    def _notify_balance_listeners(self):
+        """
+        提交后把当前线程记录的修改通知给回调
+        """
+        changes = getattr(self._local, 'balance_changes', None)
+        if not changes:
+            return
+        self._local.balance_changes = []
+        for listener in self._balance_listeners:
+            try:
+                for username, old_total, new_total in changes:
+                    listener(username, old_total, new_total)
+            except Exception as exception:
+                logging.error("豆子数量变化回调发生异常：%s", exception)
+
+    def _on_balance_changed(self, username, old_total, new_total):
+        """
+        写入后同步更新缓存和排名索引，在提交前调用，保证更新顺序与提交顺序一致
+
+        Args:
+            username (str): 用户名。
+            old_total (int): 写入前的豆子数量，新用户时不在排名索引中，不影响结果。
+            new_total (int): 写入后的豆子数量。
+        """
+        if not self.store.shared:
+            self.balance_cache.set(username, new_total)
+            self.rank_index.update((-old_total, username), (-new_total, username))
+        if self._balance_listeners:
+            # 修改还没有提交，先记录下来，提交后再通知
+            changes = getattr(self._local, 'balance_changes', None)
+            if changes is None:
+                changes = self._local.balance_changes = []
+            changes.append((username, old_total, new_total))
+
+    def collect_beans(self, username, wait=True):
+        """
+        处理用户领取豆子的请求。
+
+        如果用户上次领取豆子的时间距离现在超过一周，则允许领取并增加豆子数量；
+        否则，提示领取失败。判断和更新在一次写入中完成，同一用户并发领取时只会成功一次。
+
+        Args:
+            username (str): 用户名。
+            wait (bool): 是否等待提交完成，为 False 时返回 Future。
+
+        Returns:
+            int: 如果成功领取豆子，返回领取后的豆子总数；否则返回 None。
+        """
+        return self.store.collect(username, COLLECT_AMOUNT, int(COLLECT_INTERVAL.total_seconds()), wait)
+
+    def add_beans(self, username, amount, wait=True):
+        """
+        给指定用户增加豆子数量。
+
+        Args:
+            username (str): 用户名。
+            amount (int): 要增加的豆子数量，可以为负数。
+            wait (bool): 是否等待提交完成，为 False 时返回 Future。
+
+        Returns:
+            int: 增加后的豆子总数。
+        """
+        return self.store.add(username, amount, wait)
+
+    def reserve(self, username, amount):
+        """
+        押注：余额足够时扣除豆子并记录为冻结，检查和扣除在同一个事务中完成，
+        同一用户同时押注时不会透支。
+
+        Args:
+            username (str): 用户名。
+            amount (int): 押注金额，必须大于 0。
+
+        Returns:
+            Reservation: 押注记录，用于结算或返还；余额不足时返回 None。
+        """
+        if amount <= 0:
+            raise ValueError('押注金额必须大于0')
+        return self.store.reserve(username, amount)
+
+    def settle(self, reservation, payout, wait=True):
+        """
+        结算押注：删除押注记录并把 payout 加到用户的豆子中，在同一个事务中完成。
+        同一个押注只会结算一次，重复结算不会重复派奖。
+
+        Args:
+            reservation (Reservation): reserve 返回的押注记录。
+            payout (int): 返还给用户的豆子（包含本金），输掉时为 0。
+            wait (bool): 是否等待提交完成，为 False 时返回 Future。
+
+        Returns:
+            int: 结算后的豆子总数；押注已经结算过时返回 None。
+        """
+        return self.store.settle(reservation, payout, wait)
+
+    def refund(self, reservation, wait=True):
+        """
+        返还押注的全部金额
+
+        Returns:
+            int: 返还后的豆子总数；押注已经结算过时返回 None。
+        """
+        return self.settle(reservation, reservation.amount, wait)
+
+    def get_bean_count(self, username):
+        """
+        获取指定用户的豆子数量。
+
+        Args:
+            username (str): 用户名。
+
+        Returns:
+            int: 用户的豆子总数。如果用户不存在，返回 0。
+        """
+        if self.store.shared:
+            return self.store.get_balance(username)
+        return self.balance_cache.get_or_load(username, lambda: self.store.get_balance(username))
+
+    def get_top_users(self, n=10, after=None):
+        """
+        获取豆子数量最多的前 n 个用户，豆子数量相同时按用户名排序。
+
+        Args:
+            n (int): 要获取的用户数量，默认是 10。
+            after (tuple): 上一页最后一个用户的 (username, total_beans)，传入时返回排在它之后的 n 个用户。
+
+        Returns:
+            list of tuple: 包含用户名和豆子数量的列表，格式为 [(username, total_beans), ...]
+        """
+        return self.store.get_top(n, after)
+
+    def _ensure_rank_index(self):
+        """
+        排名索引还没有加载时从存储后端加载。
+
+        加载时持有写锁，等待正在进行的写入提交，读取期间也没有新的写入；
+        释放写锁后到加载完成前的写入会被记录下来，加载完成后重放。
+        """
+        if self.rank_index.ready:
+            return
+        with self._rank_index_lock:
+            if self.rank_index.ready:
+                return
+            try:
+                rows = self.store.load_ranked(self.rank_index.begin_build)
+            except Exception:
+                self.rank_index.reset()
+                raise
+            self.rank_index.finish_build((-total_beans, username) for total_beans, username in rows)
+
+    def get_user_rank(self, username):
+        """
+        获取用户在排行榜中的名次。
+
+        Args:
+            username (str): 用户名。
+
+        Returns:
+            tuple: (名次, 豆子数量)，名次从 1 开始。如果用户不存在，返回 None。
+        """
+        if self.store.shared:
+            return self.store.get_rank(username)
+        self._ensure_rank_index()
+        # 缓存和排名索引不是同时更新的，读到的豆子数量刚好被修改时重试
+        for _ in range(3):
+            total_beans = self.get_bean_count(username)
+            rank = self.rank_index.rank((-total_beans, username))
+            if rank is not None:
+                return rank + 1, total_beans
+        return None
+
+    def get_users_by_rank(self, start, count):
+        """
+        按名次获取一段排行榜，用于翻页。
+
+        Args:
+            start (int): 起始名次，从 1 开始。
+            count (int): 获取的用户数量。
+
+        Returns:
+            list of tuple: [(名次, username, total_beans), ...]
+        """
+        if self.store.shared:
+            return self.store.get_by_rank(start, count)
+        self._ensure_rank_index()
+        keys = self.rank_index.slice(start - 1, start - 1 + count)
+        return [(rank, username, -negative_total)
+                for rank, (negative_total, username) in enumerate(keys, start=start)]
+
+    def get_users_around(self, username, radius=2):
+        """
+        获取排行榜中排在用户前后各 radius 名的用户（包括用户自己）。
+
+        Returns:
+            list of tuple: [(名次, username, total_beans), ...]，用户不存在时返回空列表。
+        """
+        user_rank = self.get_user_rank(username)
+        if user_rank is None:
+            return []
+        rank, _ = user_rank
+        start = max(1, rank - radius)
+        return self.get_users_by_rank(start, rank + radius + 1 - start)
+
+    def get_user_total(self):
+        """
+        返回排行榜中的用户总数
+        """
+        if self.store.shared:
+            return self.store.get_user_total()
+        self._ensure_rank_index()
+        return len(self.rank_index)
+
+    def get_next_collect_time(self, username):
+        """
+        获取用户下次可领取豆子的时间，由存储后端返回的上次领取时间戳加上 COLLECT_INTERVAL 得到。
+
+        Args:
+            username (str): 用户名。
+
+        Returns:
+            datetime: 下次可领取时间。如果用户不存在，返回当前时间。
+        """
+        last_collect_time = self.store.get_last_collect_time(username)
+        if last_collect_time is None:
+            # 如果用户不存在，立即可领取
+            return datetime.datetime.now()
+        return datetime.datetime.fromtimestamp(last_collect_time) + COLLECT_INTERVAL
+
+    def import_users(self, rows):
+        """
+        批量导入用户，用于准备测试数据，导入后清空缓存和排名索引
+
+        Args:
+            rows (iterable): (username, last_collect_time, total_beans)，用户名不能重复。
+        """
+        self.store.import_users(rows)
+        self._reset_derived_state()
+
+    def close_connection(self):
+        """
+        关闭存储后端，组提交模式下先提交队列中剩余的写操作。
+        """
+        self.store.close()
+        # 关闭后再次获取实例时重新连接
+        if BeanManager._instances.get(self.db_path) is self:
+            del BeanManager._instances[self.db_path]
+
+
+if __name__ == '__main__':
+    # 获取 BeanManager 实例（单例）
+    bean_manager = BeanManager()
+
+    # 测试代码
+    test_usernames = ['user1', 'user2', 'user3', 'user4', 'user5',
+                      'user6', 'user7', 'user8', 'user9', 'user10',
+                      'user11', 'user12']
+
+    # 模拟用户领取豆子
+    for username in test_usernames:
+        bean_manager.collect_beans(username)
+
+    # 给指定用户增加豆子
+    bean_manager.add_beans('user1', 5000)
+    print("已给 user1 增加 5000 个豆子。")
+
+    # 查询用户的豆子数量
+    for username in test_usernames:
+        beans = bean_manager.get_bean_count(username)
+        print(f"{username} 当前的豆子总数是：{beans}")
+
+    # 获取豆子数量最多的前 10 名用户
+    top_users = bean_manager.get_top_users(10)
+    print("\n豆子数量最多的前 10 名用户：")
+    for rank, (username, total_beans) in enumerate(top_users, start=1):
+        print(f"第 {rank} 名：{username}，豆子数量：{total_beans}")
+
+    # 关闭数据库连接
+    bean_manager.close_connection()
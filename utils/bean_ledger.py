@@ -0,0 +1,653 @@
+"""
+豆子账本服务：一个本地守护进程持有存储后端，多个机器人进程通过 Unix 套接字共享同一份豆子数据
+
+启动守护进程：
+    python -m utils.bean_ledger --socket ./data/bean_ledger.sock --backend sqlite
+
+机器人进程使用 --bean-backend ledger 连接守护进程，模块仍然通过 BeanManager 读写豆子。
+
+协议：每个请求和响应都是一帧，帧头为 (负载长度 u32, 请求号 u32, 操作码或状态 u8)，均为网络字节序，
+负载中的整数为 i64，字符串为 u16 长度加 UTF-8 内容，列表为 u32 个数加元素，可选值前有 u8 标志。
+同一连接上可以连续发送多个请求而不等待响应，响应按请求号对应，顺序不一定与请求相同。
+"""
+import argparse
+import itertools
+import logging
+import os
+import queue
+import signal
+import socket
+import socketserver
+import struct
+import threading
+from concurrent.futures import Future
+from utils.bean_store import BeanStore, Reservation
+from utils.metrics import METRICS
+
+# 帧头：负载长度、请求号、操作码（请求）或状态（响应）
+HEADER = struct.Struct('!IIB')
+_I64 = struct.Struct('!q')
+_U32 = struct.Struct('!I')
+_U16 = struct.Struct('!H')
+_U8 = struct.Struct('!B')
+
+# 操作码
+OP_COLLECT = 1
+OP_ADD = 2
+OP_RESERVE = 3
+OP_SETTLE = 4
+OP_GET = 5
+OP_TOP = 6
+OP_RANK = 7
+OP_BY_RANK = 8
+OP_TOTAL = 9
+OP_LAST_COLLECT = 10
+OP_IMPORT = 11
+# 把连接切换为变化推送，之后只接收 STATUS_EVENT 帧
+OP_SUBSCRIBE = 12
+
+# 响应状态
+STATUS_OK = 0
+STATUS_ERROR = 1
+STATUS_EVENT = 2
+
+# 客户端等待响应的最长秒数
+REQUEST_TIMEOUT = 10
+# 每个订阅者最多积压的变化数，超过后丢弃并通知客户端全部重新读取
+SUBSCRIBER_QUEUE_SIZE = 10000
+# 订阅连接断开后重新连接的间隔（秒）
+RESUBSCRIBE_INTERVAL = 1.0
+
+LEDGER_REQUESTS = METRICS.counter('wechatbot_ledger_requests_total', '账本服务处理的请求数', ('op',))
+LEDGER_ERRORS = METRICS.counter('wechatbot_ledger_errors_total', '账本服务处理失败的请求数', ('op',))
+
+
+class LedgerError(Exception):
+    """
+    账本服务返回错误，或与账本服务的连接断开
+    """
+
+
+class _Writer:
+    """
+    按协议编码负载
+    """
+
+    def __init__(self):
+        self.buffer = bytearray()
+
+    def int(self, value):
+        self.buffer += _I64.pack(value)
+        return self
+
+    def count(self, value):
+        self.buffer += _U32.pack(value)
+        return self
+
+    def flag(self, value):
+        self.buffer += _U8.pack(1 if value else 0)
+        return self
+
+    def str(self, value):
+        data = value.encode('utf-8')
+        self.buffer += _U16.pack(len(data))
+        self.buffer += data
+        return self
+
+    def optional_int(self, value):
+        self.flag(value is not None)
+        if value is not None:
+            self.int(value)
+        return self
+
+
+class _Reader:
+    """
+    按协议解码负载
+    """
+
+    def __init__(self, data):
+        self.data = data
+        self.offset = 0
+
+    def _unpack(self, fmt):
+        value = fmt.unpack_from(self.data, self.offset)[0]
+        self.offset += fmt.size
+        return value
+
+    def int(self):
+        return self._unpack(_I64)
+
+    def count(self):
+        return self._unpack(_U32)
+
+    def flag(self):
+        return self._unpack(_U8)
+
+    def str(self):
+        length = self._unpack(_U16)
+        value = bytes(self.data[self.offset:self.offset + length]).decode('utf-8')
+        self.offset += length
+        return value
+
+    def optional_int(self):
+        return self.int() if self.flag() else None
+
+
+def _frame(request_id, code, payload=b''):
+    return HEADER.pack(len(payload), request_id, code) + payload
+
+
+def _read_frame(rfile):
+    """
+    读取一帧，连接关闭时返回 None
+
+    Returns:
+        tuple: (请求号, 操作码或状态, 负载)
+    """
+    header = rfile.read(HEADER.size)
+    if len(header) < HEADER.size:
+        return None
+    length, request_id, code = HEADER.unpack(header)
+    payload = rfile.read(length) if length else b''
+    if len(payload) < length:
+        return None
+    return request_id, code, payload
+
+
+def _encode_event(username, old_total, new_total):
+    writer = _Writer().flag(username is not None)
+    if username is not None:
+        writer.str(username).int(old_total).int(new_total)
+    return bytes(writer.buffer)
+
+
+class LedgerRequestHandler(socketserver.StreamRequestHandler):
+    """
+    处理一个客户端连接：依次读取请求，读操作直接回复，写操作在提交后回复
+    """
+
+    def setup(self):
+        super().setup()
+        self.send_lock = threading.Lock()
+
+    def send(self, request_id, status, payload=b''):
+        with self.send_lock:
+            self.request.sendall(_frame(request_id, status, payload))
+
+    def handle(self):
+        server = self.server
+        while True:
+            frame = _read_frame(self.rfile)
+            if frame is None:
+                return
+            request_id, opcode, payload = frame
+            if opcode == OP_SUBSCRIBE:
+                server.serve_subscriber(self)
+                return
+            handler = server.handlers.get(opcode)
+            if handler is None:
+                self.send(request_id, STATUS_ERROR, bytes(_Writer().str(f'未知的操作码：{opcode}').buffer))
+                continue
+            LEDGER_REQUESTS.inc(op=handler.__name__)
+            try:
+                result = handler(_Reader(payload))
+            except Exception as exception:
+                self._reply_error(request_id, handler, exception)
+                continue
+            if isinstance(result, Future):
+                # 写操作提交后再回复，组提交模式下不阻塞同一连接上的后续请求
+                result.add_done_callback(
+                    lambda future, request_id=request_id, handler=handler: self._reply_future(request_id, handler,
+                                                                                              future))
+            else:
+                self._reply(request_id, result)
+
+    def _reply(self, request_id, payload):
+        try:
+            self.send(request_id, STATUS_OK, payload)
+        except OSError:
+            # 客户端已断开，读取循环会结束
+            pass
+
+    def _reply_error(self, request_id, handler, exception):
+        LEDGER_ERRORS.inc(op=handler.__name__)
+        logging.error("账本请求 %s 失败：%s", handler.__name__, exception)
+        try:
+            self.send(request_id, STATUS_ERROR, bytes(_Writer().str(str(exception)).buffer))
+        except OSError:
+            pass
+
+    def _reply_future(self, request_id, handler, future):
+        exception = future.exception()
+        if exception is not None:
+            self._reply_error(request_id, handler, exception)
+        else:
+            self._reply(request_id, future.result())
+
+
+class LedgerServer(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+    """
+    账本服务，每个连接一个线程，所有请求都交给同一个 BeanManager 处理。
+
+    豆子数量的每次变化在提交后推送给所有订阅的连接，客户端据此让本地的缓存失效。
+    """
+    daemon_threads = True
+
+    def __init__(self, socket_path, bean_manager):
+        """
+        Args:
+            socket_path (str): Unix 套接字路径，已存在时先删除。
+            bean_manager (BeanManager): 持有存储后端的 BeanManager，不能是 ledger 后端。
+        """
+        if os.path.exists(socket_path):
+            os.remove(socket_path)
+        self.socket_path = socket_path
+        self.bean_manager = bean_manager
+        self._subscribers = []
+        self._subscribers_lock = threading.Lock()
+        bean_manager.add_balance_listener(self.publish)
+        self.handlers = {
+            OP_COLLECT: self.collect,
+            OP_ADD: self.add,
+            OP_RESERVE: self.reserve,
+            OP_SETTLE: self.settle,
+            OP_GET: self.get,
+            OP_TOP: self.top,
+            OP_RANK: self.rank,
+            OP_BY_RANK: self.by_rank,
+            OP_TOTAL: self.total,
+            OP_LAST_COLLECT: self.last_collect,
+            OP_IMPORT: self.import_users,
+        }
+        super().__init__(socket_path, LedgerRequestHandler)
+
+    # 以下处理函数解码请求负载，读操作返回编码后的响应负载，写操作返回 Future
+
+    def collect(self, reader):
+        username, amount, interval = reader.str(), reader.int(), reader.int()
+        future = self.bean_manager.store.collect(username, amount, interval, wait=False)
+        return self._encode_future(future, lambda total: bytes(_Writer().optional_int(total).buffer))
+
+    def add(self, reader):
+        username, amount = reader.str(), reader.int()
+        future = self.bean_manager.add_beans(username, amount, wait=False)
+        return self._encode_future(future, lambda total: bytes(_Writer().int(total).buffer))
+
+    def reserve(self, reader):
+        reservation = self.bean_manager.reserve(reader.str(), reader.int())
+        writer = _Writer().flag(reservation is not None)
+        if reservation is not None:
+            writer.int(reservation.reservation_id).int(reservation.user_id)
+        return bytes(writer.buffer)
+
+    def settle(self, reader):
+        reservation = Reservation(reader.int(), reader.int(), reader.str(), reader.int())
+        future = self.bean_manager.settle(reservation, reader.int(), wait=False)
+        return self._encode_future(future, lambda total: bytes(_Writer().optional_int(total).buffer))
+
+    def get(self, reader):
+        return bytes(_Writer().int(self.bean_manager.get_bean_count(reader.str())).buffer)
+
+    def top(self, reader):
+        n = reader.count()
+        after = (reader.str(), reader.int()) if reader.flag() else None
+        users = self.bean_manager.get_top_users(n, after)
+        writer = _Writer().count(len(users))
+        for username, total_beans in users:
+            writer.str(username).int(total_beans)
+        return bytes(writer.buffer)
+
+    def rank(self, reader):
+        user_rank = self.bean_manager.get_user_rank(reader.str())
+        writer = _Writer().flag(user_rank is not None)
+        if user_rank is not None:
+            writer.int(user_rank[0]).int(user_rank[1])
+        return bytes(writer.buffer)
+
+    def by_rank(self, reader):
+        users = self.bean_manager.get_users_by_rank(reader.int(), reader.count())
+        writer = _Writer().count(len(users))
+        for rank, username, total_beans in users:
+            writer.int(rank).str(username).int(total_beans)
+        return bytes(writer.buffer)
+
+    def total(self, reader):
+        return bytes(_Writer().int(self.bean_manager.get_user_total()).buffer)
+
+    def last_collect(self, reader):
+        last_collect_time = self.bean_manager.store.get_last_collect_time(reader.str())
+        return bytes(_Writer().optional_int(last_collect_time).buffer)
+
+    def import_users(self, reader):
+        self.bean_manager.import_users([(reader.str(), reader.int(), reader.int()) for _ in range(reader.count())])
+        return b''
+
+    @staticmethod
+    def _encode_future(future, encode):
+        """
+        返回在 future 完成后得到编码结果的新 Future
+        """
+        encoded = Future()
+
+        def done(completed):
+            exception = completed.exception()
+            if exception is not None:
+                encoded.set_exception(exception)
+            else:
+                encoded.set_result(encode(completed.result()))
+
+        future.add_done_callback(done)
+        return encoded
+
+    def publish(self, username, old_total, new_total):
+        """
+        豆子数量变化的回调，把变化放入每个订阅者的队列
+        """
+        event = _encode_event(username, old_total, new_total)
+        with self._subscribers_lock:
+            subscribers = list(self._subscribers)
+        for subscriber in subscribers:
+            try:
+                subscriber.put_nowait(event)
+            except queue.Full:
+                # 积压过多，丢弃积压的变化，改为通知客户端全部重新读取
+                self._reset_subscriber(subscriber)
+
+    @staticmethod
+    def _reset_subscriber(subscriber):
+        with subscriber.mutex:
+            subscriber.queue.clear()
+        subscriber.put_nowait(_encode_event(None, None, None))
+
+    def serve_subscriber(self, handler):
+        """
+        在连接线程中不断把变化推送给订阅的客户端，直到连接断开
+        """
+        subscriber = queue.Queue(SUBSCRIBER_QUEUE_SIZE)
+        with self._subscribers_lock:
+            self._subscribers.append(subscriber)
+        try:
+            while True:
+                handler.send(0, STATUS_EVENT, subscriber.get())
+        except OSError:
+            pass
+        finally:
+            with self._subscribers_lock:
+                self._subscribers.remove(subscriber)
+
+    def server_close(self):
+        super().server_close()
+        if os.path.exists(self.socket_path):
+            os.remove(self.socket_path)
+
+
+class LedgerConnection:
+    """
+    客户端到账本服务的一个连接，多个线程可以同时在上面发送请求，
+    由读取线程按请求号把响应交给对应的 Future。
+    """
+
+    def __init__(self, socket_path):
+        self.sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        self.sock.connect(socket_path)
+        self.closed = False
+        self._send_lock = threading.Lock()
+        # 请求号 -> (Future, 解码函数)
+        self._pending = {}
+        self._request_ids = itertools.count(1)
+        self._thread = threading.Thread(target=self._read_responses, name='LedgerConnection')
+        self._thread.daemon = True
+        self._thread.start()
+
+    def request(self, opcode, payload, decode):
+        """
+        发送一个请求，不等待响应
+
+        Args:
+            opcode (int): 操作码。
+            payload (bytes): 请求负载。
+            decode (callable): 参数为 _Reader，返回响应的结果。
+
+        Returns:
+            Future: 收到响应后完成。
+        """
+        future = Future()
+        with self._send_lock:
+            if self.closed:
+                raise LedgerError('与账本服务的连接已断开')
+            request_id = next(self._request_ids) & 0xFFFFFFFF
+            self._pending[request_id] = (future, decode)
+            try:
+                self.sock.sendall(_frame(request_id, opcode, payload))
+            except OSError as exception:
+                del self._pending[request_id]
+                self.closed = True
+                raise LedgerError(f'发送请求失败：{exception}') from exception
+        return future
+
+    def _read_responses(self):
+        rfile = self.sock.makefile('rb')
+        try:
+            while True:
+                frame = _read_frame(rfile)
+                if frame is None:
+                    break
+                request_id, status, payload = frame
+                with self._send_lock:
+                    future, decode = self._pending.pop(request_id)
+                try:
+                    if status == STATUS_OK:
+                        future.set_result(decode(_Reader(payload)))
+                    else:
+                        future.set_exception(LedgerError(_Reader(payload).str()))
+                except Exception as exception:
+                    future.set_exception(exception)
+        except OSError:
+            pass
+        finally:
+            with self._send_lock:
+                self.closed = True
+                pending = list(self._pending.values())
+                self._pending.clear()
+            for future, _ in pending:
+                future.set_exception(LedgerError('与账本服务的连接已断开'))
+
+    def close(self):
+        with self._send_lock:
+            self.closed = True
+        try:
+            self.sock.shutdown(socket.SHUT_RDWR)
+        except OSError:
+            pass
+        self.sock.close()
+
+
+class LedgerBeanStore(BeanStore):
+    """
+    账本服务的客户端，作为 BeanManager 的存储后端使用。
+
+    请求通过连接池发送，每个连接上可以有多个请求同时等待响应。
+    数据可能被其它进程修改，BeanManager 不在本地缓存豆子数量和排名，直接查询账本服务；
+    豆子数量的变化由账本服务推送，通过 on_change 和 on_commit 通知，包括其它进程的修改。
+    """
+    shared = True
+
+    def __init__(self, socket_path, pool_size=4, subscribe=True):
+        """
+        Args:
+            socket_path (str): 账本服务的 Unix 套接字路径。
+            pool_size (int): 连接池中的连接数。
+            subscribe (bool): 是否接收豆子数量变化的推送。
+        """
+        super().__init__()
+        self.socket_path = socket_path
+        self._pool = [None] * pool_size
+        self._pool_lock = threading.Lock()
+        self._next = itertools.count()
+        self._closed = threading.Event()
+        self._subscription = None
+        if subscribe:
+            self._subscriber_thread = threading.Thread(target=self._receive_events, name='LedgerSubscriber')
+            self._subscriber_thread.daemon = True
+            self._subscriber_thread.start()
+
+    def _connection(self):
+        """
+        按轮询从连接池取一个连接，连接断开时重新连接
+        """
+        index = next(self._next) % len(self._pool)
+        connection = self._pool[index]
+        if connection is None or connection.closed:
+            with self._pool_lock:
+                connection = self._pool[index]
+                if connection is None or connection.closed:
+                    try:
+                        connection = LedgerConnection(self.socket_path)
+                    except OSError as exception:
+                        raise LedgerError(f'无法连接账本服务 {self.socket_path}：{exception}') from exception
+                    self._pool[index] = connection
+        return connection
+
+    def _call(self, opcode, writer, decode, wait=True):
+        future = self._connection().request(opcode, bytes(writer.buffer), decode)
+        return future.result(REQUEST_TIMEOUT) if wait else future
+
+    def _receive_events(self):
+        """
+        订阅连接的读取线程，断开后定期重连；重连期间错过的变化无法补回，重连后通知全部重新读取
+        """
+        reconnected = False
+        while not self._closed.is_set():
+            try:
+                connection = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+                connection.connect(self.socket_path)
+                connection.sendall(_frame(0, OP_SUBSCRIBE))
+            except OSError:
+                self._closed.wait(RESUBSCRIBE_INTERVAL)
+                continue
+            self._subscription = connection
+            if reconnected:
+                self.on_rollback()
+            reconnected = True
+            rfile = connection.makefile('rb')
+            try:
+                while True:
+                    frame = _read_frame(rfile)
+                    if frame is None:
+                        break
+                    reader = _Reader(frame[2])
+                    if reader.flag():
+                        self.on_change(reader.str(), reader.int(), reader.int())
+                        self.on_commit()
+                    else:
+                        self.on_rollback()
+            except OSError:
+                pass
+            finally:
+                connection.close()
+
+    def collect(self, username, amount, interval, wait=True):
+        return self._call(OP_COLLECT, _Writer().str(username).int(amount).int(interval),
+                          lambda reader: reader.optional_int(), wait)
+
+    def add(self, username, amount, wait=True):
+        return self._call(OP_ADD, _Writer().str(username).int(amount), lambda reader: reader.int(), wait)
+
+    def reserve(self, username, amount):
+        def decode(reader):
+            if not reader.flag():
+                return None
+            return Reservation(reader.int(), reader.int(), username, amount)
+
+        return self._call(OP_RESERVE, _Writer().str(username).int(amount), decode)
+
+    def settle(self, reservation, payout, wait=True):
+        writer = (_Writer().int(reservation.reservation_id).int(reservation.user_id).str(reservation.username)
+                  .int(reservation.amount).int(payout))
+        return self._call(OP_SETTLE, writer, lambda reader: reader.optional_int(), wait)
+
+    def get_balance(self, username):
+        return self._call(OP_GET, _Writer().str(username), lambda reader: reader.int())
+
+    def get_top(self, n, after=None):
+        writer = _Writer().count(n).flag(after is not None)
+        if after is not None:
+            writer.str(after[0]).int(after[1])
+        return self._call(OP_TOP, writer, lambda reader: [(reader.str(), reader.int())
+                                                          for _ in range(reader.count())])
+
+    def get_rank(self, username):
+        def decode(reader):
+            return (reader.int(), reader.int()) if reader.flag() else None
+
+        return self._call(OP_RANK, _Writer().str(username), decode)
+
+    def get_by_rank(self, start, count):
+        return self._call(OP_BY_RANK, _Writer().int(start).count(count),
+                          lambda reader: [(reader.int(), reader.str(), reader.int()) for _ in range(reader.count())])
+
+    def get_user_total(self):
+        return self._call(OP_TOTAL, _Writer(), lambda reader: reader.int())
+
+    def get_last_collect_time(self, username):
+        return self._call(OP_LAST_COLLECT, _Writer().str(username), lambda reader: reader.optional_int())
+
+    def import_users(self, rows):
+        rows = list(rows)
+        writer = _Writer().count(len(rows))
+        for username, last_collect_time, total_beans in rows:
+            writer.str(username).int(last_collect_time).int(total_beans)
+        self._call(OP_IMPORT, writer, lambda reader: None)
+
+    def close(self):
+        self._closed.set()
+        if self._subscription is not None:
+            try:
+                self._subscription.shutdown(socket.SHUT_RDWR)
+            except OSError:
+                pass
+        with self._pool_lock:
+            for connection in self._pool:
+                if connection is not None:
+                    connection.close()
+            self._pool = [None] * len(self._pool)
+
+
+def main():
+    """
+    启动账本守护进程，收到 SIGTERM 或 Ctrl+C 时提交剩余的写入后退出
+    """
+    from utils import bean_actions
+    from utils.bean_actions import BeanManager
+
+    parser = argparse.ArgumentParser(description='豆子账本服务')
+    parser.add_argument('--socket', default=bean_actions.LEDGER_SOCKET, help='Unix 套接字路径')
+    parser.add_argument('--backend', choices=[backend for backend in bean_actions.BACKENDS if backend != 'ledger'],
+                        default='sqlite', help='账本使用的存储后端')
+    parser.add_argument('--db-path', default=bean_actions.DB_PATH, help='数据库文件路径')
+    parser.add_argument('--shards', type=int, default=bean_actions.NUM_SHARDS, help='sharded 后端的分片数量')
+    parser.add_argument('--group-commit', action='store_true', help='豆子的增减由写线程批量提交')
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+
+    bean_actions.BACKEND = args.backend
+    bean_actions.NUM_SHARDS = args.shards
+    bean_actions.GROUP_COMMIT = args.group_commit
+    bean_manager = BeanManager(args.db_path)
+    server = LedgerServer(args.socket, bean_manager)
+    # serve_forever 所在线程不能调用 shutdown，在其它线程中停止
+    signal.signal(signal.SIGTERM, lambda signum, frame: threading.Thread(target=server.shutdown).start())
+    logging.info("账本服务已启动：%s（%s 后端）", args.socket, args.backend)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        bean_manager.close_connection()
+        logging.info("账本服务已停止")
+
+
+if __name__ == '__main__':
+    main()
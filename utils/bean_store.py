@@ -0,0 +1,790 @@
+"""
+豆子数据的存储后端：单个 SQLite 文件、按用户哈希分片的多个 SQLite 文件，以及只保存在内存中的实现
+"""
+import collections
+import contextlib
+import datetime
+import heapq
+import itertools
+import logging
+import os
+import sqlite3
+import threading
+import time
+import zlib
+from concurrent.futures import Future
+from utils.group_commit import GroupCommitWriter
+from utils.metrics import METRICS
+from utils.rank_index import RankIndex
+
+# 连接参数：写锁被占用时最多等待的毫秒数，以及内存映射的大小（字节）
+BUSY_TIMEOUT_MS = 5000
+MMAP_SIZE = 256 * 1024 * 1024
+
+# 数据库结构版本，保存在 PRAGMA user_version 中；迁移旧数据时每批复制的行数
+SCHEMA_VERSION = 1
+MIGRATION_BATCH_SIZE = 10000
+
+# 押注时冻结的豆子，结算或返还前不能再使用
+Reservation = collections.namedtuple('Reservation', ['reservation_id', 'user_id', 'username', 'amount'])
+
+# 每条 SQL 语句的耗时，按语句名称区分
+STATEMENT_LATENCY = METRICS.histogram('wechatbot_sqlite_statement_seconds', 'BeanManager 中 SQL 语句的耗时',
+                                      ('statement',))
+
+
+def _completed(result):
+    """
+    返回一个已经完成的 Future
+    """
+    future = Future()
+    future.set_result(result)
+    return future
+
+
+class BeanStore:
+    """
+    豆子数据的存储接口，BeanManager 通过它读写数据，具体实现见下面的几个子类。
+
+    写操作修改豆子数量后，在提交前调用 on_change(username, old_total, new_total)，
+    调用顺序必须与提交顺序一致；提交成功后在同一个线程调用 on_commit()，
+    提交失败回滚后调用 on_rollback()。三个回调由 BeanManager 通过 set_callbacks 设置。
+
+    写方法的 wait 参数为 False 时可以不等待提交，返回 Future。
+    """
+    # 数据是否会被其它进程修改；为 True 时 BeanManager 不在本地缓存豆子数量和排名，
+    # 改为调用 get_balance、get_rank、get_by_rank 和 get_user_total 查询
+    shared = False
+
+    def __init__(self):
+        self.on_change = lambda username, old_total, new_total: None
+        self.on_commit = lambda: None
+        self.on_rollback = lambda: None
+
+    def set_callbacks(self, on_change, on_commit, on_rollback):
+        """
+        设置写入时的回调
+        """
+        self.on_change = on_change
+        self.on_commit = on_commit
+        self.on_rollback = on_rollback
+
+    def collect(self, username, amount, interval, wait=True):
+        """
+        领取豆子：新用户直接领取，老用户距离上次领取超过 interval 秒才能领取
+
+        Returns:
+            int: 领取后的豆子总数，不能领取时返回 None。
+        """
+        raise NotImplementedError
+
+    def add(self, username, amount, wait=True):
+        """
+        增加豆子（可以为负数），用户不存在时创建
+
+        Returns:
+            int: 增加后的豆子总数。
+        """
+        raise NotImplementedError
+
+    def reserve(self, username, amount):
+        """
+        余额足够时扣除豆子并记录为冻结
+
+        Returns:
+            Reservation: 押注记录；余额不足时返回 None。
+        """
+        raise NotImplementedError
+
+    def settle(self, reservation, payout, wait=True):
+        """
+        删除押注记录并把 payout 加到用户的豆子中
+
+        Returns:
+            int: 结算后的豆子总数；押注已经结算过时返回 None。
+        """
+        raise NotImplementedError
+
+    def get_balance(self, username):
+        """
+        返回用户的豆子数量，用户不存在时返回 0
+        """
+        raise NotImplementedError
+
+    def get_top(self, n, after=None):
+        """
+        返回按豆子数量降序、用户名升序排列的前 n 个 (username, total_beans)，
+        after 为 (username, total_beans) 时从它之后开始
+        """
+        raise NotImplementedError
+
+    def load_ranked(self, on_locked):
+        """
+        读取所有用户，用于加载排名索引。持有写锁时调用 on_locked()，
+        保证之后提交的写入都会在 on_locked() 之后通知。
+
+        Returns:
+            list of tuple: 按豆子数量降序、用户名升序排列的 [(total_beans, username), ...]
+        """
+        raise NotImplementedError
+
+    def get_rank(self, username):
+        """
+        返回用户的 (名次, 豆子数量)，名次从 1 开始，用户不存在时返回 None。只有 shared 的后端需要实现
+        """
+        raise NotImplementedError
+
+    def get_by_rank(self, start, count):
+        """
+        返回从名次 start 开始的 count 个 (名次, username, total_beans)。只有 shared 的后端需要实现
+        """
+        raise NotImplementedError
+
+    def get_user_total(self):
+        """
+        返回用户总数。只有 shared 的后端需要实现
+        """
+        raise NotImplementedError
+
+    def get_last_collect_time(self, username):
+        """
+        返回用户上次领取豆子的时间戳（秒），用户不存在时返回 None
+        """
+        raise NotImplementedError
+
+    def import_users(self, rows):
+        """
+        批量导入用户，不触发回调，用于准备测试数据
+
+        Args:
+            rows (iterable): (username, last_collect_time, total_beans)，用户名不能重复。
+        """
+        raise NotImplementedError
+
+    def close(self):
+        """
+        提交未完成的写入并释放资源
+        """
+        raise NotImplementedError
+
+
+class SQLiteBeanStore(BeanStore):
+    """
+    保存在单个 SQLite 文件中。
+
+    每个线程使用自己的数据库连接，数据库使用 WAL 模式，读操作不会被写操作阻塞。
+    开启组提交时，写操作由写线程批量提交。
+    """
+
+    def __init__(self, db_path, synchronous='NORMAL', group_commit=False, group_commit_interval=0.01,
+                 group_commit_max_ops=256):
+        """
+        Args:
+            db_path (str): 数据库文件路径，目录不存在时创建。
+            synchronous (str): 磁盘同步级别，NORMAL 或 FULL。
+            group_commit (bool): 是否使用组提交。
+            group_commit_interval (float): 组提交每批最多等待的秒数。
+            group_commit_max_ops (int): 组提交每批最多包含的写操作数。
+        """
+        super().__init__()
+        self.db_path = db_path
+        self.synchronous = synchronous
+        # 如果目录不存在，创建目录
+        db_directory = os.path.dirname(db_path)
+        if db_directory and not os.path.exists(db_directory):
+            os.makedirs(db_directory)
+        # 每个线程的数据库连接
+        self._local = threading.local()
+        # 所有线程创建的连接，关闭时统一关闭
+        self._connections = []
+        self._connections_lock = threading.Lock()
+        self.init_db()
+        self.writer = None
+        if group_commit:
+            self.writer = GroupCommitWriter(lambda: self.conn, group_commit_interval, group_commit_max_ops,
+                                            name=f'GroupCommitWriter-{os.path.basename(db_path)}',
+                                            on_commit=lambda: self.on_commit(),
+                                            on_rollback=lambda: self.on_rollback())
+
+    @property
+    def conn(self):
+        """
+        返回当前线程的数据库连接，第一次使用时创建
+        """
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = self._connect()
+            self._local.conn = conn
+        return conn
+
+    def _connect(self):
+        """
+        创建一个新的数据库连接并设置连接参数
+        """
+        conn = sqlite3.connect(self.db_path, timeout=BUSY_TIMEOUT_MS / 1000, check_same_thread=False)
+        conn.execute(f'PRAGMA busy_timeout = {BUSY_TIMEOUT_MS}')
+        # WAL 模式下 NORMAL 只在检查点时同步磁盘，断电最多丢失最近的事务，不会损坏数据库
+        conn.execute(f'PRAGMA synchronous = {self.synchronous}')
+        conn.execute(f'PRAGMA mmap_size = {MMAP_SIZE}')
+        conn.execute('PRAGMA temp_store = MEMORY')
+        with self._connections_lock:
+            self._connections.append(conn)
+        return conn
+
+    def init_db(self):
+        """
+        初始化数据库，开启 WAL 模式，创建或升级用户豆子表和押注表。
+
+        游戏状态只保存在内存中，启动时还存在的押注都是上次退出时未结算的，全部返还给用户。
+        """
+        # WAL 模式会保存在数据库文件中，设置一次即可
+        self.conn.execute('PRAGMA journal_mode = WAL')
+
+        # 使用实例的连接
+        cursor = self.conn.cursor()
+
+        version = cursor.execute('PRAGMA user_version').fetchone()[0]
+        if version == 0 and (self._table_exists(cursor, 'user_beans')
+                             or self._table_exists(cursor, 'user_beans_migrating')):
+            # 旧版本的表以用户名为主键、用字符串保存领取时间；存在 user_beans_migrating 说明上次迁移没有完成
+            self._migrate_from_v0(cursor)
+
+        # 创建表（如果不存在），其它表通过整数 user_id 关联用户，领取时间为秒级时间戳
+        self._execute(cursor, 'init_db.create_table', '''
+            CREATE TABLE IF NOT EXISTS user_beans (
+                user_id INTEGER PRIMARY KEY,
+                username TEXT NOT NULL UNIQUE,
+                last_collect_time INTEGER NOT NULL,
+                total_beans INTEGER NOT NULL
+            )
+        ''')
+        # 排行榜按豆子数量降序、用户名升序排列，索引与排序完全一致时不需要额外排序
+        self._execute(cursor, 'init_db.create_index', '''
+            CREATE INDEX IF NOT EXISTS idx_user_beans_rank ON user_beans (total_beans DESC, username)
+        ''')
+        self._execute(cursor, 'init_db.create_reservations', '''
+            CREATE TABLE IF NOT EXISTS bean_reservations (
+                reservation_id INTEGER PRIMARY KEY,
+                user_id INTEGER NOT NULL,
+                amount INTEGER NOT NULL
+            )
+        ''')
+        cursor.execute(f'PRAGMA user_version = {SCHEMA_VERSION}')
+        self._execute(cursor, 'init_db.refund_reservations', '''
+            UPDATE user_beans
+            SET total_beans = total_beans + (
+                SELECT SUM(amount) FROM bean_reservations WHERE bean_reservations.user_id = user_beans.user_id)
+            WHERE user_id IN (SELECT user_id FROM bean_reservations)
+        ''')
+        if cursor.rowcount:
+            logging.info("返还了 %d 个用户未结算的押注", cursor.rowcount)
+        self._execute(cursor, 'init_db.clear_reservations', 'DELETE FROM bean_reservations')
+        self._commit()
+
+    @staticmethod
+    def _table_exists(cursor, table):
+        return cursor.execute("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = ?",
+                              (table,)).fetchone() is not None
+
+    def _migrate_from_v0(self, cursor):
+        """
+        把旧版本的 user_beans 表迁移到新结构：整数 user_id 主键、整数时间戳。
+
+        按 rowid 分批复制到 user_beans_migrating，每批在单独的事务中提交，不会长时间持有写锁；
+        中途退出时下次启动从已复制的最后一个用户之后继续。最后一批的复制、删除旧表、重命名新表和更新
+        user_version 在同一个事务中完成，任何时候退出都不会丢失数据。
+        """
+        if not self._table_exists(cursor, 'user_beans'):
+            # 旧表已删除但新表没有重命名（之前的版本替换表时不在一个事务中），只需完成替换
+            logging.warning("发现未完成的 user_beans 迁移，继续完成替换")
+            with self._immediate_transaction(cursor):
+                cursor.execute('ALTER TABLE user_beans_migrating RENAME TO user_beans')
+                cursor.execute(f'PRAGMA user_version = {SCHEMA_VERSION}')
+            return
+
+        if self._table_exists(cursor, 'user_beans_migrating'):
+            # 旧表在迁移期间不会修改，新表按 rowid 顺序插入，最后插入的用户就是已复制到的位置
+            row = cursor.execute('''
+                SELECT rowid FROM user_beans WHERE username = (
+                    SELECT username FROM user_beans_migrating ORDER BY user_id DESC LIMIT 1)
+            ''').fetchone()
+            last_rowid = row[0] if row else 0
+            copied = cursor.execute('SELECT COUNT(*) FROM user_beans_migrating').fetchone()[0]
+            logging.info("继续迁移 user_beans 表到版本 %d，已复制 %d 个用户", SCHEMA_VERSION, copied)
+        else:
+            logging.info("开始迁移 user_beans 表到版本 %d", SCHEMA_VERSION)
+            with self._immediate_transaction(cursor):
+                # 旧的押注表以用户名关联，先按旧结构返还
+                if self._table_exists(cursor, 'bean_reservations'):
+                    self._execute(cursor, 'migrate.refund_reservations', '''
+                        UPDATE user_beans
+                        SET total_beans = total_beans + (
+                            SELECT SUM(amount) FROM bean_reservations
+                            WHERE bean_reservations.username = user_beans.username)
+                        WHERE username IN (SELECT username FROM bean_reservations)
+                    ''')
+                    cursor.execute('DROP TABLE bean_reservations')
+                cursor.execute('''
+                    CREATE TABLE user_beans_migrating (
+                        user_id INTEGER PRIMARY KEY,
+                        username TEXT NOT NULL UNIQUE,
+                        last_collect_time INTEGER NOT NULL,
+                        total_beans INTEGER NOT NULL
+                    )
+                ''')
+            last_rowid = 0
+            copied = 0
+
+        while True:
+            with self._immediate_transaction(cursor):
+                rows = cursor.execute('''
+                    SELECT rowid, username, last_collect_time, total_beans FROM user_beans
+                    WHERE rowid > ? ORDER BY rowid LIMIT ?
+                ''', (last_rowid, MIGRATION_BATCH_SIZE)).fetchall()
+                if rows:
+                    last_rowid = rows[-1][0]
+                    # 旧版本保存的是本地时间，按本地时区转换为时间戳
+                    cursor.executemany('''
+                        INSERT INTO user_beans_migrating (username, last_collect_time, total_beans)
+                        VALUES (?, ?, ?)
+                    ''', ((username, self._parse_legacy_time(last_collect_time), total_beans or 0)
+                          for _, username, last_collect_time, total_beans in rows))
+                    copied += len(rows)
+                if len(rows) < MIGRATION_BATCH_SIZE:
+                    # 最后一批，在同一个事务中用新表替换旧表
+                    cursor.execute('DROP TABLE user_beans')
+                    cursor.execute('ALTER TABLE user_beans_migrating RENAME TO user_beans')
+                    cursor.execute(f'PRAGMA user_version = {SCHEMA_VERSION}')
+                    break
+        logging.info("user_beans 表迁移完成，共 %d 个用户", copied)
+
+    @contextlib.contextmanager
+    def _immediate_transaction(self, cursor):
+        """
+        显式开始持有写锁的事务，正常退出时提交，发生异常时回滚。
+
+        sqlite3 模块不会在 DDL 语句前自动开始事务，多条 DDL 需要一起生效时使用。
+        """
+        cursor.execute('BEGIN IMMEDIATE')
+        try:
+            yield cursor
+        except BaseException:
+            self.conn.rollback()
+            raise
+        self._commit()
+
+    @staticmethod
+    def _parse_legacy_time(value):
+        """
+        把旧版本的 ISO 格式时间转换为时间戳，无法解析时返回 0（视为可以立即领取）
+        """
+        try:
+            return int(datetime.datetime.fromisoformat(value).timestamp())
+        except (TypeError, ValueError):
+            return 0
+
+    def _execute(self, cursor, statement, sql, params=()):
+        """
+        执行 SQL 语句并记录耗时
+
+        Args:
+            cursor (sqlite3.Cursor): 游标。
+            statement (str): 语句名称，用于区分指标。
+            sql (str): SQL 语句。
+            params (tuple): 参数。
+        """
+        start = time.perf_counter()
+        try:
+            return cursor.execute(sql, params)
+        finally:
+            STATEMENT_LATENCY.observe(time.perf_counter() - start, statement=statement)
+
+    def _commit(self):
+        """
+        提交事务并记录耗时
+        """
+        start = time.perf_counter()
+        try:
+            self.conn.commit()
+        finally:
+            STATEMENT_LATENCY.observe(time.perf_counter() - start, statement='commit')
+
+    def _write(self, operation, wait):
+        """
+        执行一个写操作：组提交模式下交给写线程，否则在当前线程执行并立即提交
+
+        Args:
+            operation (callable): 参数为游标，返回写操作的结果。
+            wait (bool): 是否等待提交完成。
+
+        Returns:
+            wait 为 True 时返回写操作的结果，否则返回 Future。
+        """
+        if self.writer is not None:
+            future = self.writer.submit(operation)
+            return future.result() if wait else future
+        try:
+            result = operation(self.conn.cursor())
+            self._commit()
+        except Exception:
+            # 写操作可能已经通知了修改，回滚后需要丢弃
+            self.conn.rollback()
+            self.on_rollback()
+            raise
+        self.on_commit()
+        return result if wait else _completed(result)
+
+    def collect(self, username, amount, interval, wait=True):
+        now = int(time.time())
+
+        def operation(cursor):
+            # 新用户直接插入；老用户只有上次领取时间早于 interval 秒前才更新，否则不返回任何行
+            self._execute(cursor, 'collect_beans.upsert', '''
+                INSERT INTO user_beans (username, last_collect_time, total_beans)
+                VALUES (?, ?, ?)
+                ON CONFLICT(username)
+                DO UPDATE SET last_collect_time = excluded.last_collect_time,
+                              total_beans = total_beans + excluded.total_beans
+                WHERE last_collect_time <= excluded.last_collect_time - ?
+                RETURNING total_beans
+            ''', (username, now, amount, interval))
+            result = cursor.fetchone()
+            if result is None:
+                return None
+            # 提交前通知修改，此时其它写入在等待写锁，通知顺序与提交顺序一致
+            self.on_change(username, result[0] - amount, result[0])
+            return result[0]
+
+        return self._write(operation, wait)
+
+    def add(self, username, amount, wait=True):
+        now = int(time.time())
+
+        def operation(cursor):
+            # 用户不存在时插入新用户，存在时在原有数量上累加
+            self._execute(cursor, 'add_beans.upsert', '''
+                INSERT INTO user_beans (username, last_collect_time, total_beans)
+                VALUES (?, ?, ?)
+                ON CONFLICT(username)
+                DO UPDATE SET total_beans = total_beans + excluded.total_beans
+                RETURNING total_beans
+            ''', (username, now, amount))
+            total_beans = cursor.fetchone()[0]
+            self.on_change(username, total_beans - amount, total_beans)
+            return total_beans
+
+        return self._write(operation, wait)
+
+    def reserve(self, username, amount):
+        def operation(cursor):
+            self._execute(cursor, 'reserve.debit', '''
+                UPDATE user_beans SET total_beans = total_beans - ?
+                WHERE username = ? AND total_beans >= ?
+                RETURNING user_id, total_beans
+            ''', (amount, username, amount))
+            result = cursor.fetchone()
+            if result is None:
+                return None
+            user_id, total_beans = result
+            self._execute(cursor, 'reserve.insert', '''
+                INSERT INTO bean_reservations (user_id, amount) VALUES (?, ?)
+            ''', (user_id, amount))
+            reservation_id = cursor.lastrowid
+            self.on_change(username, total_beans + amount, total_beans)
+            return Reservation(reservation_id, user_id, username, amount)
+
+        return self._write(operation, True)
+
+    def settle(self, reservation, payout, wait=True):
+        def operation(cursor):
+            self._execute(cursor, 'settle.delete', '''
+                DELETE FROM bean_reservations WHERE reservation_id = ? RETURNING user_id
+            ''', (reservation.reservation_id,))
+            if cursor.fetchone() is None:
+                return None
+            self._execute(cursor, 'settle.credit', '''
+                UPDATE user_beans SET total_beans = total_beans + ?
+                WHERE user_id = ?
+                RETURNING total_beans
+            ''', (payout, reservation.user_id))
+            total_beans = cursor.fetchone()[0]
+            if payout:
+                self.on_change(reservation.username, total_beans - payout, total_beans)
+            return total_beans
+
+        return self._write(operation, wait)
+
+    def get_balance(self, username):
+        cursor = self.conn.cursor()
+        self._execute(cursor, 'get_bean_count.select', 'SELECT total_beans FROM user_beans WHERE username = ?',
+                      (username,))
+        result = cursor.fetchone()
+        return result[0] if result else 0
+
+    def get_top(self, n, after=None):
+        cursor = self.conn.cursor()
+        if after is None:
+            self._execute(cursor, 'get_top_users.select', '''
+                SELECT username, total_beans FROM user_beans
+                ORDER BY total_beans DESC, username
+                LIMIT ?
+            ''', (n,))
+        else:
+            # 从上一页的最后一个用户继续向后取，沿索引定位，不需要跳过前面的行
+            after_username, after_total = after
+            self._execute(cursor, 'get_top_users.select_after', '''
+                SELECT username, total_beans FROM user_beans
+                WHERE total_beans <= ? AND (total_beans < ? OR username > ?)
+                ORDER BY total_beans DESC, username
+                LIMIT ?
+            ''', (after_total, after_total, after_username, n))
+        return cursor.fetchall()
+
+    @contextlib.contextmanager
+    def write_locked(self):
+        """
+        在当前线程的连接上持有写锁，等待正在进行的写入提交，退出时回滚
+
+        Yields:
+            sqlite3.Cursor: 持有写锁的游标。
+        """
+        cursor = self.conn.cursor()
+        cursor.execute('BEGIN IMMEDIATE')
+        try:
+            yield cursor
+        finally:
+            self.conn.rollback()
+
+    def _read_ranked(self, cursor):
+        self._execute(cursor, 'rank_index.load', '''
+            SELECT total_beans, username FROM user_beans
+            ORDER BY total_beans DESC, username
+        ''')
+        return cursor.fetchall()
+
+    def load_ranked(self, on_locked):
+        with self.write_locked() as cursor:
+            on_locked()
+            return self._read_ranked(cursor)
+
+    def get_last_collect_time(self, username):
+        cursor = self.conn.cursor()
+        self._execute(cursor, 'get_next_collect_time.select',
+                      'SELECT last_collect_time FROM user_beans WHERE username = ?', (username,))
+        result = cursor.fetchone()
+        return result[0] if result else None
+
+    def import_users(self, rows):
+        self.conn.executemany(
+            'INSERT INTO user_beans (username, last_collect_time, total_beans) VALUES (?, ?, ?)', rows)
+        self._commit()
+
+    def close(self):
+        """
+        关闭所有线程的数据库连接，组提交模式下先提交队列中剩余的写操作
+        """
+        if self.writer is not None:
+            self.writer.stop()
+            self.writer = None
+        with self._connections_lock:
+            connections = self._connections
+            self._connections = []
+        for conn in connections:
+            conn.close()
+        self._local = threading.local()
+
+
+class ShardedSQLiteBeanStore(BeanStore):
+    """
+    按用户名的哈希把用户分到多个 SQLite 文件中，每个分片有自己的写锁（和组提交写线程），
+    不同分片的写入可以同时提交。
+
+    同一用户的数据和押注都在同一个分片，单个用户的操作只涉及一个分片；
+    排行榜从每个分片取前 n 名后归并。
+    """
+
+    def __init__(self, db_path, num_shards, **options):
+        """
+        Args:
+            db_path (str): 数据库文件路径，第 i 个分片保存在 <文件名>.shard<i><扩展名>。
+            num_shards (int): 分片数量，确定后不能修改，否则用户会被分到其它分片。
+            options: 传给每个分片的 SQLiteBeanStore 的参数。
+        """
+        super().__init__()
+        root, extension = os.path.splitext(db_path)
+        self.shards = [SQLiteBeanStore(f'{root}.shard{i}{extension}', **options) for i in range(num_shards)]
+
+    def set_callbacks(self, on_change, on_commit, on_rollback):
+        super().set_callbacks(on_change, on_commit, on_rollback)
+        for shard in self.shards:
+            shard.set_callbacks(on_change, on_commit, on_rollback)
+
+    def get_shard(self, username):
+        """
+        返回用户所在的分片，使用 crc32 保证每次启动的结果相同
+        """
+        return self.shards[zlib.crc32(username.encode('utf-8')) % len(self.shards)]
+
+    def collect(self, username, amount, interval, wait=True):
+        return self.get_shard(username).collect(username, amount, interval, wait)
+
+    def add(self, username, amount, wait=True):
+        return self.get_shard(username).add(username, amount, wait)
+
+    def reserve(self, username, amount):
+        return self.get_shard(username).reserve(username, amount)
+
+    def settle(self, reservation, payout, wait=True):
+        return self.get_shard(reservation.username).settle(reservation, payout, wait)
+
+    def get_balance(self, username):
+        return self.get_shard(username).get_balance(username)
+
+    def get_top(self, n, after=None):
+        # 每个分片的前 n 名已经有序，归并后取前 n 名
+        rows = heapq.merge(*(shard.get_top(n, after) for shard in self.shards),
+                           key=lambda row: (-row[1], row[0]))
+        return list(itertools.islice(rows, n))
+
+    def load_ranked(self, on_locked):
+        # 按固定顺序锁住所有分片，单个写入只锁一个分片，不会死锁
+        with contextlib.ExitStack() as stack:
+            cursors = [stack.enter_context(shard.write_locked()) for shard in self.shards]
+            on_locked()
+            ranked = [shard._read_ranked(cursor) for shard, cursor in zip(self.shards, cursors)]
+        return list(heapq.merge(*ranked, key=lambda row: (-row[0], row[1])))
+
+    def get_last_collect_time(self, username):
+        return self.get_shard(username).get_last_collect_time(username)
+
+    def import_users(self, rows):
+        rows_by_shard = collections.defaultdict(list)
+        for row in rows:
+            rows_by_shard[id(self.get_shard(row[0]))].append(row)
+        for shard in self.shards:
+            shard.import_users(rows_by_shard[id(shard)])
+
+    def close(self):
+        for shard in self.shards:
+            shard.close()
+
+
+class MemoryBeanStore(BeanStore):
+    """
+    只保存在内存中，进程退出后数据丢失，用于测试和性能对比。
+
+    所有操作在一个锁内完成，排行榜通过内存中的排名索引查询。
+    """
+
+    def __init__(self):
+        super().__init__()
+        # username -> [user_id, last_collect_time, total_beans]
+        self._users = {}
+        # reservation_id -> (user_id, amount)
+        self._reservations = {}
+        self._user_ids = itertools.count(1)
+        self._reservation_ids = itertools.count(1)
+        # 按 (-total_beans, username) 排列的所有用户
+        self._ranked = RankIndex()
+        self._ranked.finish_build([])
+        self._lock = threading.Lock()
+
+    def _write(self, operation, wait):
+        """
+        在锁内执行写操作，释放锁后调用 on_commit
+        """
+        with self._lock:
+            result = operation()
+        self.on_commit()
+        return result if wait else _completed(result)
+
+    def _changed(self, username, old_total, new_total):
+        """
+        更新排行榜并通知修改，调用时需持有锁
+        """
+        self._ranked.update((-old_total, username), (-new_total, username))
+        self.on_change(username, old_total, new_total)
+
+    def _get_or_create(self, username, now):
+        user = self._users.get(username)
+        if user is None:
+            user = self._users[username] = [next(self._user_ids), now, 0]
+        return user
+
+    def collect(self, username, amount, interval, wait=True):
+        now = int(time.time())
+
+        def operation():
+            user = self._users.get(username)
+            if user is not None and user[1] > now - interval:
+                return None
+            user = self._get_or_create(username, now)
+            user[1] = now
+            user[2] += amount
+            self._changed(username, user[2] - amount, user[2])
+            return user[2]
+
+        return self._write(operation, wait)
+
+    def add(self, username, amount, wait=True):
+        now = int(time.time())
+
+        def operation():
+            user = self._get_or_create(username, now)
+            user[2] += amount
+            self._changed(username, user[2] - amount, user[2])
+            return user[2]
+
+        return self._write(operation, wait)
+
+    def reserve(self, username, amount):
+        def operation():
+            user = self._users.get(username)
+            if user is None or user[2] < amount:
+                return None
+            user[2] -= amount
+            reservation_id = next(self._reservation_ids)
+            self._reservations[reservation_id] = (user[0], amount)
+            self._changed(username, user[2] + amount, user[2])
+            return Reservation(reservation_id, user[0], username, amount)
+
+        return self._write(operation, True)
+
+    def settle(self, reservation, payout, wait=True):
+        def operation():
+            if self._reservations.pop(reservation.reservation_id, None) is None:
+                return None
+            user = self._users[reservation.username]
+            user[2] += payout
+            if payout:
+                self._changed(reservation.username, user[2] - payout, user[2])
+            return user[2]
+
+        return self._write(operation, wait)
+
+    def get_balance(self, username):
+        user = self._users.get(username)
+        return user[2] if user else 0
+
+    def get_top(self, n, after=None):
+        start = 0 if after is None else self._ranked.position((-after[1], after[0]))
+        return [(username, -negative_total) for negative_total, username in self._ranked.slice(start, start + n)]
+
+    def load_ranked(self, on_locked):
+        with self._lock:
+            on_locked()
+            keys = self._ranked.slice(0, len(self._ranked))
+        return [(-negative_total, username) for negative_total, username in keys]
+
+    def get_last_collect_time(self, username):
+        user = self._users.get(username)
+        return user[1] if user else None
+
+    def import_users(self, rows):
+        with self._lock:
+            for username, last_collect_time, total_beans in rows:
+                self._users[username] = [next(self._user_ids), last_collect_time, total_beans]
+            self._ranked.finish_build(sorted((-user[2], username) for username, user in self._users.items()))
+
+    def close(self):
+        pass
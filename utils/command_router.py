@@ -0,0 +1,107 @@
+"""
+命令路由，根据消息开头的命令找到对应的功能模块
+"""
+import re
+import unicodedata
+
+# 紧跟在命令后面的帮助词，如“百家乐 介绍”
+HELP_WORDS = frozenset(['介绍', '帮助', '说明', 'help', '功能'])
+# 命令和参数之间没有空格时，参数必须像押注金额，如“21点押1000”
+ARGUMENT_PATTERN = re.compile(r'[押赌]?\d')
+# 押注金额前可以带的前缀
+AMOUNT_PREFIXES = ('押', '赌')
+
+
+class CommandArgs:
+    """
+    解析好的命令和参数，传给功能模块后不需要再次解析消息
+    """
+    __slots__ = ('command', 'args', 'text', 'is_help')
+
+    def __init__(self, command, text):
+        """
+        Args:
+            command (str): 匹配到的命令（已归一化）。
+            text (str): 命令后面的内容（已归一化并去除首尾空白）。
+        """
+        self.command = command
+        self.text = text
+        self.args = text.split()
+        self.is_help = len(self.args) == 1 and self.args[0] in HELP_WORDS
+
+    def get_amount(self, index):
+        """
+        把第 index 个参数解析为押注金额，支持'押1000'、'赌1000'或'1000'
+
+        Returns:
+            int: 押注金额，参数不存在时返回 None。
+
+        Raises:
+            ValueError: 参数不是有效的数字。
+        """
+        if index >= len(self.args):
+            return None
+        token = self.args[index]
+        if token.startswith(AMOUNT_PREFIXES):
+            token = token[1:]
+        return int(token)
+
+
+class CommandRouter:
+    """
+    由命令构建的前缀树，匹配耗时只与消息长度有关，与模块数量无关。
+
+    匹配前会把全角字符转换为半角并转为小写，支持“21点 押1000”和“21点押1000”两种写法。
+    """
+
+    # 前缀树节点中保存匹配结果的键
+    _END = ''
+
+    def __init__(self, command_module_dict):
+        """
+        Args:
+            command_module_dict (dict): 命令 -> 功能模块对象。
+        """
+        self.command_module_dict = command_module_dict
+        self._root = {}
+        for command_sign, module_instance in command_module_dict.items():
+            command = self.normalize(command_sign)
+            node = self._root
+            for char in command:
+                node = node.setdefault(char, {})
+            node[self._END] = (command, module_instance)
+
+    @staticmethod
+    def normalize(text):
+        """
+        全角转半角、转小写并去除首尾空白
+        """
+        return unicodedata.normalize('NFKC', text).lower().strip()
+
+    def route(self, content):
+        """
+        找到消息对应的功能模块，命令有多个可以匹配时取最长的那个
+
+        Returns:
+            tuple: (功能模块对象, CommandArgs)，没有匹配的命令时返回 (None, None)。
+        """
+        text = self.normalize(content)
+        matched = None
+        node = self._root
+        for position, char in enumerate(text):
+            node = node.get(char)
+            if node is None:
+                break
+            if self._END in node and self._is_boundary(text, position + 1):
+                matched = (position + 1, node[self._END])
+        if matched is None:
+            return None, None
+        end, (command, module_instance) = matched
+        return module_instance, CommandArgs(command, text[end:].strip())
+
+    @staticmethod
+    def _is_boundary(text, end):
+        """
+        判断命令是否在 end 处结束：消息结束、后面是空白，或者后面直接跟着金额
+        """
+        return end == len(text) or text[end].isspace() or ARGUMENT_PATTERN.match(text, end) is not None
@@ -0,0 +1,243 @@
+"""
+聊天上下文存储：按最近使用顺序淘汰用户，按估算的 token 数裁剪上下文，内存按字节数限制，可以保存到磁盘
+"""
+import collections
+import logging
+import os
+import struct
+import threading
+import zlib
+from utils.metrics import METRICS
+
+CONTEXT_BYTES = METRICS.gauge('wechatbot_chat_context_bytes', '聊天上下文估算占用的字节数')
+CONTEXT_USERS = METRICS.gauge('wechatbot_chat_context_users', '保存了聊天上下文的用户数')
+CONTEXT_EVICTIONS = METRICS.counter('wechatbot_chat_context_evictions_total', '因内存上限被淘汰的用户上下文数')
+
+# 每条消息除内容外的估算开销：token 数参考接口对每条消息的额外计数，字节数为元组和双端队列中的引用等
+MESSAGE_OVERHEAD_TOKENS = 4
+MESSAGE_OVERHEAD_BYTES = 120
+# 每个用户除消息外的估算开销（字节）
+CONVERSATION_OVERHEAD_BYTES = 400
+
+# 快照格式：魔数和版本，之后是 zlib 压缩的记录
+SNAPSHOT_MAGIC = b'WBCX'
+SNAPSHOT_VERSION = 1
+_SNAPSHOT_HEADER = struct.Struct('!4sB')
+# 用户：用户名长度、消息数
+_USER_HEADER = struct.Struct('!HH')
+# 消息：角色、内容长度
+_MESSAGE_HEADER = struct.Struct('!BI')
+ROLES = ('user', 'assistant', 'system')
+_ROLE_CODES = {role: code for code, role in enumerate(ROLES)}
+
+
+def estimate_tokens(text, encoded_length=None):
+    """
+    粗略估算文本的 token 数：中日韩字符大约一个字一个 token，其它字符大约四个字符一个 token。
+
+    中日韩字符的 UTF-8 编码为 3 个字节，其它常见字符为 1 个字节，由编码后的长度推算中日韩字符数，
+    不需要逐个字符判断。
+
+    Args:
+        text (str): 文本。
+        encoded_length (int): 文本 UTF-8 编码后的字节数，已经计算过时传入。
+    """
+    if encoded_length is None:
+        encoded_length = len(text.encode('utf-8'))
+    wide = min((encoded_length - len(text)) // 2, len(text))
+    return wide + (len(text) - wide + 3) // 4 + MESSAGE_OVERHEAD_TOKENS
+
+
+class Conversation:
+    """
+    一个用户的上下文，消息保存在双端队列中，从头部裁剪时不需要复制
+    """
+    __slots__ = ('messages', 'tokens', 'size')
+
+    def __init__(self):
+        # (角色, 内容, token 数, 字节数)
+        self.messages = collections.deque()
+        self.tokens = 0
+        self.size = CONVERSATION_OVERHEAD_BYTES
+
+    def append(self, role, content):
+        encoded_length = len(content.encode('utf-8'))
+        tokens = estimate_tokens(content, encoded_length)
+        size = encoded_length + MESSAGE_OVERHEAD_BYTES
+        self.messages.append((role, content, tokens, size))
+        self.tokens += tokens
+        self.size += size
+
+    def popleft(self):
+        _, _, tokens, size = self.messages.popleft()
+        self.tokens -= tokens
+        self.size -= size
+
+    def trim(self, max_tokens, max_messages):
+        """
+        从最早的消息开始删除，直到不超过 token 预算和消息数，最新的一条消息始终保留；
+        删除后上下文不以 AI 的回复开头
+        """
+        while len(self.messages) > 1 and (self.tokens > max_tokens or len(self.messages) > max_messages):
+            self.popleft()
+        while self.messages and self.messages[0][0] == 'assistant':
+            self.popleft()
+
+
+class ContextStore:
+    """
+    所有用户的聊天上下文。
+
+    用户按最近使用的顺序保存，所有上下文估算的字节数超过 max_bytes 时淘汰最久没有聊天的用户；
+    每个用户的上下文超过 max_tokens 或 max_messages 时从最早的消息开始删除。
+    """
+
+    def __init__(self, max_tokens=1500, max_messages=10, max_bytes=16 * 1024 * 1024):
+        """
+        Args:
+            max_tokens (int): 每个用户上下文的估算 token 预算。
+            max_messages (int): 每个用户最多保留的消息数。
+            max_bytes (int): 所有上下文估算占用的字节数上限。
+        """
+        self.max_tokens = max_tokens
+        self.max_messages = max_messages
+        self.max_bytes = max_bytes
+        self._conversations = collections.OrderedDict()
+        self._size = 0
+        self._lock = threading.Lock()
+        # 上次保存之后是否有修改
+        self.dirty = False
+        self.bind_metrics()
+
+    def bind_metrics(self):
+        """
+        让上下文的内存和用户数指标读取这个存储，热重载后交给新版本模块的存储需要重新绑定
+        """
+        CONTEXT_BYTES.set_function(lambda: self._size)
+        CONTEXT_USERS.set_function(self.__len__)
+
+    def __len__(self):
+        return len(self._conversations)
+
+    def __contains__(self, username):
+        return username in self._conversations
+
+    @property
+    def size(self):
+        """
+        所有上下文估算占用的字节数
+        """
+        return self._size
+
+    def add_message(self, username, role, content):
+        """
+        在用户的上下文末尾添加一条消息，并把该用户移到最近使用的位置
+        """
+        with self._lock:
+            conversation = self._conversations.get(username)
+            if conversation is None:
+                conversation = self._conversations[username] = Conversation()
+                self._size += conversation.size
+            else:
+                self._conversations.move_to_end(username)
+            old_size = conversation.size
+            conversation.append(role, content)
+            conversation.trim(self.max_tokens, self.max_messages)
+            if not conversation.messages:
+                # 只剩 AI 的回复（用户的提问已被淘汰）时不保留
+                del self._conversations[username]
+                self._size -= old_size
+            else:
+                self._size += conversation.size - old_size
+            self._evict()
+            self.dirty = True
+
+    def _evict(self):
+        # 最近使用的用户不会被淘汰
+        while self._size > self.max_bytes and len(self._conversations) > 1:
+            _, conversation = self._conversations.popitem(last=False)
+            self._size -= conversation.size
+            CONTEXT_EVICTIONS.inc()
+
+    def get_messages(self, username):
+        """
+        返回用户的上下文，格式为接口需要的 [{'role': ..., 'content': ...}]
+        """
+        with self._lock:
+            conversation = self._conversations.get(username)
+            if conversation is None:
+                return []
+            return [{'role': role, 'content': content} for role, content, _, _ in conversation.messages]
+
+    def remove(self, username):
+        """
+        删除用户的上下文
+        """
+        with self._lock:
+            conversation = self._conversations.pop(username, None)
+            if conversation is not None:
+                self._size -= conversation.size
+                self.dirty = True
+
+    def dumps(self):
+        """
+        返回所有上下文的快照，用户按最近使用的顺序排列
+        """
+        with self._lock:
+            items = [(username, [(role, content) for role, content, _, _ in conversation.messages])
+                     for username, conversation in self._conversations.items()]
+            self.dirty = False
+        parts = []
+        for username, messages in items:
+            name = username.encode('utf-8')
+            parts.append(_USER_HEADER.pack(len(name), len(messages)))
+            parts.append(name)
+            for role, content in messages:
+                data = content.encode('utf-8')
+                parts.append(_MESSAGE_HEADER.pack(_ROLE_CODES[role], len(data)))
+                parts.append(data)
+        return _SNAPSHOT_HEADER.pack(SNAPSHOT_MAGIC, SNAPSHOT_VERSION) + zlib.compress(b''.join(parts))
+
+    def loads(self, snapshot):
+        """
+        从快照恢复上下文，按当前的预算和内存上限裁剪
+        """
+        magic, version = _SNAPSHOT_HEADER.unpack_from(snapshot)
+        if magic != SNAPSHOT_MAGIC or version != SNAPSHOT_VERSION:
+            raise ValueError('不支持的聊天上下文快照格式')
+        data = zlib.decompress(snapshot[_SNAPSHOT_HEADER.size:])
+        offset = 0
+        while offset < len(data):
+            name_length, count = _USER_HEADER.unpack_from(data, offset)
+            offset += _USER_HEADER.size
+            username = data[offset:offset + name_length].decode('utf-8')
+            offset += name_length
+            for _ in range(count):
+                role_code, length = _MESSAGE_HEADER.unpack_from(data, offset)
+                offset += _MESSAGE_HEADER.size
+                self.add_message(username, ROLES[role_code], data[offset:offset + length].decode('utf-8'))
+                offset += length
+        self.dirty = False
+
+    def save(self, path):
+        """
+        把快照写入临时文件后替换，中途退出不会留下不完整的文件
+        """
+        snapshot = self.dumps()
+        temp_path = path + '.tmp'
+        with open(temp_path, 'wb') as f:
+            f.write(snapshot)
+        os.replace(temp_path, path)
+        return len(snapshot)
+
+    def load(self, path):
+        """
+        读取 save 保存的快照，文件不存在或损坏时保持为空
+        """
+        try:
+            with open(path, 'rb') as f:
+                self.loads(f.read())
+        except FileNotFoundError:
+            return
+        except (OSError, ValueError, struct.error, zlib.error) as exception:
+            logging.error("读取聊天上下文快照 %s 失败：%s", path, exception)
@@ -0,0 +1,66 @@
+"""
+在独立线程中运行的 asyncio 事件循环，供同步代码提交协程
+"""
+import asyncio
+import threading
+
+
+class EventLoopThread:
+    """
+    在守护线程中运行一个事件循环。其它线程通过 submit 提交协程，得到 concurrent.futures.Future，
+    可以等待结果，也可以注册回调而不占用线程。
+    """
+
+    def __init__(self, name):
+        """
+        Args:
+            name (str): 线程名。
+        """
+        self.name = name
+        self.loop = asyncio.new_event_loop()
+        self._thread = None
+
+    def start(self):
+        """
+        启动事件循环线程
+        """
+        self._thread = threading.Thread(target=self._run_loop, name=self.name)
+        self._thread.daemon = True
+        self._thread.start()
+        return self
+
+    def _run_loop(self):
+        asyncio.set_event_loop(self.loop)
+        self.loop.run_forever()
+
+    def submit(self, coroutine):
+        """
+        从任意线程提交协程，返回 concurrent.futures.Future
+        """
+        return asyncio.run_coroutine_threadsafe(coroutine, self.loop)
+
+    async def _drain(self, timeout):
+        tasks = [task for task in asyncio.all_tasks() if task is not asyncio.current_task()]
+        if not tasks:
+            return
+        _, pending = await asyncio.wait(tasks, timeout=timeout)
+        for task in pending:
+            task.cancel()
+        await asyncio.gather(*pending, return_exceptions=True)
+
+    def drain(self, timeout=None):
+        """
+        等待已提交的协程结束，超过 timeout 秒仍未结束的被取消
+        """
+        self.submit(self._drain(timeout)).result()
+
+    def stop(self, timeout=None):
+        """
+        等待已提交的协程结束后停止事件循环，见 drain
+        """
+        if self._thread is None or self.loop.is_closed():
+            return
+        self.drain(timeout)
+        self.loop.call_soon_threadsafe(self.loop.stop)
+        self._thread.join()
+        self.loop.close()
@@ -0,0 +1,150 @@
+"""
+组提交写线程：把多次数据库写操作合并到一个事务中提交，减少每次提交的磁盘同步
+"""
+import atexit
+import collections
+import logging
+import threading
+import time
+from concurrent.futures import Future
+from utils.metrics import METRICS
+
+BATCH_SIZE = METRICS.histogram('wechatbot_group_commit_batch_size', '每次组提交包含的写操作数',
+                               buckets=(1, 2, 4, 8, 16, 32, 64, 128, 256, 512, 1024))
+COMMIT_LATENCY = METRICS.histogram('wechatbot_group_commit_seconds', '组提交执行一批写操作并提交的耗时')
+
+
+class GroupCommitWriter:
+    """
+    所有写操作放入队列，由一个写线程依次执行，每 interval 秒或每 max_ops 个操作提交一次。
+
+    每个写操作在自己的保存点中执行，单个操作出错只回滚它自己，不影响同一批的其它操作。
+    提交成功后才设置操作的 Future 结果，等待 Future 的调用方可以确认数据已经写入。
+    """
+
+    def __init__(self, get_connection, interval=0.01, max_ops=256, name='GroupCommitWriter', on_commit=None,
+                 on_rollback=None):
+        """
+        Args:
+            get_connection (callable): 返回当前线程的数据库连接，在写线程中调用。
+            interval (float): 一批写操作最多等待的秒数。
+            max_ops (int): 一批最多包含的写操作数，达到后立即提交。
+            name (str): 写线程的名称。
+            on_commit (callable): 每批提交成功后、设置 Future 结果前调用。
+            on_rollback (callable): 提交失败、整批回滚后调用，用于清理写操作中更新的缓存。
+        """
+        self.get_connection = get_connection
+        self.on_commit = on_commit
+        self.on_rollback = on_rollback
+        self.interval = interval
+        self.max_ops = max_ops
+        # 元素为 (写操作, Future)
+        self._queue = collections.deque()
+        self._condition = threading.Condition()
+        self._running = True
+        self._thread = threading.Thread(target=self._run, name=name)
+        self._thread.daemon = True
+        self._thread.start()
+        # 进程正常退出时提交队列中剩余的写操作
+        atexit.register(self.stop)
+
+    def submit(self, operation):
+        """
+        把写操作放入队列
+
+        Args:
+            operation (callable): 参数为数据库游标，返回值作为 Future 的结果，不需要提交事务。
+
+        Returns:
+            Future: 所在批次提交后完成。
+        """
+        future = Future()
+        with self._condition:
+            if not self._running:
+                raise RuntimeError('组提交写线程已停止')
+            self._queue.append((operation, future))
+            if len(self._queue) == 1 or len(self._queue) >= self.max_ops:
+                self._condition.notify()
+        return future
+
+    def qsize(self):
+        """
+        返回等待执行的写操作数
+        """
+        return len(self._queue)
+
+    def _next_batch(self):
+        """
+        等待第一个写操作，再等待最多 interval 秒凑够一批，停止且队列为空时返回 None
+        """
+        with self._condition:
+            while not self._queue:
+                if not self._running:
+                    return None
+                self._condition.wait()
+            deadline = time.monotonic() + self.interval
+            while self._running and len(self._queue) < self.max_ops:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                self._condition.wait(remaining)
+            count = min(len(self._queue), self.max_ops)
+            return [self._queue.popleft() for _ in range(count)]
+
+    def _run(self):
+        conn = self.get_connection()
+        while True:
+            batch = self._next_batch()
+            if batch is None:
+                return
+            self._commit_batch(conn, batch)
+
+    def _commit_batch(self, conn, batch):
+        """
+        在一个事务中执行一批写操作并提交
+        """
+        start = time.perf_counter()
+        cursor = conn.cursor()
+        # 显式开启事务，否则释放最外层的保存点时会直接提交
+        cursor.execute('BEGIN')
+        results = []
+        for operation, future in batch:
+            try:
+                cursor.execute('SAVEPOINT group_commit_op')
+                result = operation(cursor)
+                cursor.execute('RELEASE group_commit_op')
+                results.append((future, result, None))
+            except Exception as exception:
+                cursor.execute('ROLLBACK TO group_commit_op')
+                cursor.execute('RELEASE group_commit_op')
+                results.append((future, None, exception))
+        try:
+            conn.commit()
+        except Exception as exception:
+            logging.error("组提交失败：%s", exception)
+            conn.rollback()
+            if self.on_rollback is not None:
+                self.on_rollback()
+            for future, _, _ in results:
+                future.set_exception(exception)
+            return
+        finally:
+            BATCH_SIZE.observe(len(batch))
+            COMMIT_LATENCY.observe(time.perf_counter() - start)
+        if self.on_commit is not None:
+            self.on_commit()
+        for future, result, exception in results:
+            if exception is None:
+                future.set_result(result)
+            else:
+                future.set_exception(exception)
+
+    def stop(self, timeout=10):
+        """
+        停止接收新的写操作，提交队列中剩余的写操作后停止写线程
+        """
+        with self._condition:
+            self._running = False
+            self._condition.notify_all()
+        self._thread.join(timeout=timeout)
+        atexit.unregister(self.stop)
@@ -0,0 +1,114 @@
+"""
+线程安全的 LRU 缓存，超过容量时淘汰最久未使用的条目
+"""
+import collections
+import threading
+from utils.metrics import METRICS
+
+CACHE_HITS = METRICS.counter('wechatbot_cache_hits_total', '缓存命中次数', ('cache',))
+CACHE_MISSES = METRICS.counter('wechatbot_cache_misses_total', '缓存未命中次数', ('cache',))
+CACHE_EVICTIONS = METRICS.counter('wechatbot_cache_evictions_total', '缓存淘汰的条目数', ('cache',))
+CACHE_SIZE = METRICS.gauge('wechatbot_cache_size', '缓存中的条目数', ('cache',))
+
+# 区分“没有缓存”和“缓存的值为 None”
+_MISSING = object()
+
+
+class LRUCache:
+    """
+    按最近使用顺序保存的缓存，所有操作在一个锁内完成。
+
+    未命中时通过 get_or_load 从数据源加载。为了避免加载期间发生的写入被旧值覆盖，
+    每次写入都会递增版本号，加载前后版本号不同时不保存加载到的值。
+    """
+
+    def __init__(self, name, max_size):
+        """
+        Args:
+            name (str): 缓存名称，用于区分指标。
+            max_size (int): 最多保存的条目数。
+        """
+        self.name = name
+        self.max_size = max_size
+        self._data = collections.OrderedDict()
+        self._lock = threading.Lock()
+        self._version = 0
+        CACHE_SIZE.set_function(self.__len__, cache=name)
+
+    def __len__(self):
+        return len(self._data)
+
+    def get(self, key, default=None):
+        """
+        返回缓存的值，不存在时返回 default
+        """
+        with self._lock:
+            value = self._data.get(key, _MISSING)
+            if value is not _MISSING:
+                self._data.move_to_end(key)
+        if value is _MISSING:
+            CACHE_MISSES.inc(cache=self.name)
+            return default
+        CACHE_HITS.inc(cache=self.name)
+        return value
+
+    def get_or_load(self, key, loader):
+        """
+        返回缓存的值，不存在时调用 loader() 加载并保存
+
+        Args:
+            key: 缓存键。
+            loader (callable): 无参数，返回数据源中的值。
+        """
+        with self._lock:
+            value = self._data.get(key, _MISSING)
+            if value is not _MISSING:
+                self._data.move_to_end(key)
+            version = self._version
+        if value is not _MISSING:
+            CACHE_HITS.inc(cache=self.name)
+            return value
+        CACHE_MISSES.inc(cache=self.name)
+        value = loader()
+        with self._lock:
+            # 加载期间有写入时，加载到的值可能已经过期，不保存
+            if self._version == version:
+                self._store(key, value)
+        return value
+
+    def set(self, key, value):
+        """
+        保存新值（写入数据源后调用）
+        """
+        with self._lock:
+            self._version += 1
+            self._store(key, value)
+
+    def invalidate(self, key):
+        """
+        删除一个条目
+        """
+        with self._lock:
+            self._version += 1
+            self._data.pop(key, None)
+
+    def clear(self):
+        """
+        删除所有条目
+        """
+        with self._lock:
+            self._version += 1
+            self._data.clear()
+
+    def _store(self, key, value):
+        """
+        保存条目并淘汰超出容量的条目，调用时需持有锁
+        """
+        self._data[key] = value
+        self._data.move_to_end(key)
+        evicted = 0
+        while len(self._data) > self.max_size:
+            self._data.popitem(last=False)
+            evicted += 1
+        if evicted:
+            CACHE_EVICTIONS.inc(evicted, cache=self.name)
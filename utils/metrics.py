@@ -0,0 +1,307 @@
+"""
+运行时指标：计数器、仪表和直方图，可以通过本地 HTTP 接口以 Prometheus 文本格式导出
+"""
+import bisect
+import logging
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+# 默认的耗时分桶（秒）
+DEFAULT_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+
+def _format_labels(label_names, label_values, extra=None):
+    pairs = list(zip(label_names, label_values))
+    if extra:
+        pairs.append(extra)
+    if not pairs:
+        return ''
+    escaped = ('{}="{}"'.format(name, str(value).replace('\\', '\\\\').replace('"', '\\"'))
+               for name, value in pairs)
+    return '{' + ','.join(escaped) + '}'
+
+
+class Metric:
+    """
+    指标基类，按标签值分别保存数据
+    """
+    metric_type = 'untyped'
+
+    def __init__(self, name, description, label_names=()):
+        self.name = name
+        self.description = description
+        self.label_names = tuple(label_names)
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def _key(self, labels):
+        return tuple(labels.get(name, '') for name in self.label_names)
+
+    def render(self):
+        """
+        返回 Prometheus 文本格式的行
+        """
+        lines = [f'# HELP {self.name} {self.description}', f'# TYPE {self.name} {self.metric_type}']
+        with self._lock:
+            items = list(self._values.items())
+        for label_values, value in items:
+            lines.append(f'{self.name}{_format_labels(self.label_names, label_values)} {value}')
+        return lines
+
+    def summary(self):
+        """
+        返回适合在聊天中展示的简短文字
+        """
+        with self._lock:
+            items = list(self._values.items())
+        return [f"{self.name}{_format_labels(self.label_names, label_values)}：{value:g}"
+                for label_values, value in items]
+
+
+class Counter(Metric):
+    """
+    只增不减的计数器
+    """
+    metric_type = 'counter'
+
+    def inc(self, amount=1, **labels):
+        """
+        增加计数
+        """
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+
+class Gauge(Metric):
+    """
+    可以任意设置的数值，也可以在导出时调用函数获取
+    """
+    metric_type = 'gauge'
+
+    def __init__(self, name, description, label_names=()):
+        super().__init__(name, description, label_names)
+        self._callbacks = {}
+
+    def set(self, value, **labels):
+        """
+        设置数值
+        """
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = value
+
+    def set_function(self, func, **labels):
+        """
+        导出时调用 func 获取数值
+        """
+        key = self._key(labels)
+        with self._lock:
+            self._callbacks[key] = func
+
+    def _collect(self):
+        with self._lock:
+            callbacks = list(self._callbacks.items())
+        for key, func in callbacks:
+            try:
+                value = func()
+            except Exception as exception:
+                logging.error("获取指标 %s 时发生异常：%s", self.name, exception)
+                continue
+            with self._lock:
+                self._values[key] = value
+
+    def render(self):
+        self._collect()
+        return super().render()
+
+    def summary(self):
+        self._collect()
+        return super().summary()
+
+
+class HistogramData:
+    """
+    直方图中一组标签对应的数据
+    """
+    __slots__ = ('bucket_counts', 'count', 'total')
+
+    def __init__(self, num_buckets):
+        self.bucket_counts = [0] * (num_buckets + 1)
+        self.count = 0
+        self.total = 0.0
+
+
+class Histogram(Metric):
+    """
+    按分桶统计的分布，用于耗时
+    """
+    metric_type = 'histogram'
+
+    def __init__(self, name, description, label_names=(), buckets=DEFAULT_BUCKETS):
+        super().__init__(name, description, label_names)
+        self.buckets = tuple(buckets)
+
+    def observe(self, value, **labels):
+        """
+        记录一次观测值
+        """
+        key = self._key(labels)
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            data = self._values.get(key)
+            if data is None:
+                data = HistogramData(len(self.buckets))
+                self._values[key] = data
+            data.bucket_counts[index] += 1
+            data.count += 1
+            data.total += value
+
+    def render(self):
+        lines = [f'# HELP {self.name} {self.description}', f'# TYPE {self.name} {self.metric_type}']
+        with self._lock:
+            items = [(key, list(data.bucket_counts), data.count, data.total) for key, data in self._values.items()]
+        for label_values, bucket_counts, count, total in items:
+            cumulative = 0
+            for bound, bucket_count in zip(self.buckets + ('+Inf',), bucket_counts):
+                cumulative += bucket_count
+                labels = _format_labels(self.label_names, label_values, ('le', bound))
+                lines.append(f'{self.name}_bucket{labels} {cumulative}')
+            labels = _format_labels(self.label_names, label_values)
+            lines.append(f'{self.name}_sum{labels} {total}')
+            lines.append(f'{self.name}_count{labels} {count}')
+        return lines
+
+    def quantile(self, percent, **labels):
+        """
+        根据分桶估算分位数，返回所在分桶的上界
+        """
+        with self._lock:
+            data = self._values.get(self._key(labels))
+            if data is None or data.count == 0:
+                return 0.0
+            bucket_counts = list(data.bucket_counts)
+            count = data.count
+        target = count * percent / 100
+        cumulative = 0
+        for bound, bucket_count in zip(self.buckets + (float('inf'),), bucket_counts):
+            cumulative += bucket_count
+            if cumulative >= target:
+                return bound
+        return float('inf')
+
+    def summary(self):
+        with self._lock:
+            items = [(key, data.count, data.total) for key, data in self._values.items()]
+        lines = []
+        for label_values, count, total in items:
+            p99 = self.quantile(99, **dict(zip(self.label_names, label_values)))
+            lines.append(f"{self.name}{_format_labels(self.label_names, label_values)}："
+                         f"{count} 次，平均 {total / count * 1000:.1f}ms，p99 ≤ {p99 * 1000:g}ms")
+        return lines
+
+
+class MetricsRegistry:
+    """
+    保存所有指标，同名指标只创建一次
+    """
+
+    def __init__(self):
+        self._metrics = {}
+        self._lock = threading.Lock()
+
+    def _get_or_create(self, metric_class, name, description, **kwargs):
+        with self._lock:
+            metric = self._metrics.get(name)
+            if metric is None:
+                metric = metric_class(name, description, **kwargs)
+                self._metrics[name] = metric
+            return metric
+
+    def counter(self, name, description, label_names=()):
+        """
+        获取或创建计数器
+        """
+        return self._get_or_create(Counter, name, description, label_names=label_names)
+
+    def gauge(self, name, description, label_names=()):
+        """
+        获取或创建仪表
+        """
+        return self._get_or_create(Gauge, name, description, label_names=label_names)
+
+    def histogram(self, name, description, label_names=(), buckets=DEFAULT_BUCKETS):
+        """
+        获取或创建直方图
+        """
+        return self._get_or_create(Histogram, name, description, label_names=label_names, buckets=buckets)
+
+    def render(self):
+        """
+        返回所有指标的 Prometheus 文本格式
+        """
+        with self._lock:
+            metrics = list(self._metrics.values())
+        lines = []
+        for metric in metrics:
+            lines.extend(metric.render())
+        return '\n'.join(lines) + '\n'
+
+    def summary(self, prefix=''):
+        """
+        返回适合在聊天中展示的文字，可以按指标名前缀过滤
+        """
+        with self._lock:
+            metrics = [metric for name, metric in self._metrics.items() if name.startswith(prefix)]
+        lines = []
+        for metric in metrics:
+            lines.extend(metric.summary())
+        return '\n'.join(lines)
+
+
+# 全局指标注册表
+METRICS = MetricsRegistry()
+
+
+class MetricsRequestHandler(BaseHTTPRequestHandler):
+    """
+    处理 /metrics 请求
+    """
+
+    def do_GET(self):
+        """
+        返回所有指标
+        """
+        if self.path.split('?')[0] != '/metrics':
+            self.send_error(404)
+            return
+        body = METRICS.render().encode('utf-8')
+        self.send_response(200)
+        self.send_header('Content-Type', 'text/plain; version=0.0.4; charset=utf-8')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        # 不输出每次请求的访问日志
+        pass
+
+
+def start_metrics_server(port, host='127.0.0.1'):
+    """
+    在后台线程中启动指标 HTTP 服务
+
+    Returns:
+        ThreadingHTTPServer: 启动失败时返回 None。
+    """
+    try:
+        server = ThreadingHTTPServer((host, port), MetricsRequestHandler)
+    except OSError as exception:
+        logging.error("指标服务启动失败：%s", exception)
+        return None
+    server.daemon_threads = True
+    thread = threading.Thread(target=server.serve_forever, name='MetricsServer')
+    thread.daemon = True
+    thread.start()
+    logging.info("指标服务已启动：http://%s:%d/metrics", host, port)
+    return server
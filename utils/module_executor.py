@@ -0,0 +1,458 @@
+"""
+按功能模块声明的执行方式调用模块：在工作线程中直接执行、在模块自己的线程池中执行，或者在独立的进程池中执行
+"""
+import inspect
+import itertools
+import logging
+import multiprocessing
+import os
+import queue
+import signal
+import threading
+import time
+from concurrent.futures import Future, TimeoutError as FutureTimeoutError
+from utils.metrics import METRICS
+from utils.scan_module import load_function_module
+
+# 模块可以通过 execution_policy 属性声明的执行方式
+POLICIES = ('inline', 'thread', 'process')
+# 模块没有声明 timeout 时单次调用的期限（秒）
+DEFAULT_TIMEOUT = 10.0
+# 模块没有声明 fallback_reply 时超时的回复
+DEFAULT_FALLBACK_REPLY = '抱歉，处理超时了，请稍后再试。'
+# thread 方式每个模块的线程数
+THREAD_WORKERS = 4
+# thread 方式每个模块最多保留的被放弃（超时后仍未结束）的线程数，超过后不再替换线程池，直接返回超时回复
+MAX_ABANDONED_THREADS = THREAD_WORKERS * 4
+# process 方式每个模块的进程数，计算量大的模块可以使用所有核心
+PROCESS_WORKERS = os.cpu_count() or 1
+# 新进程导入模块的最长等待时间（秒），不计入单次调用的期限
+PROCESS_START_TIMEOUT = 30.0
+
+MODULE_TIMEOUTS = METRICS.counter('wechatbot_module_timeouts_total', '功能模块调用超过期限的次数',
+                                  ('module', 'policy'))
+MODULE_RESTARTS = METRICS.counter('wechatbot_module_restarts_total', '功能模块超时后重启线程池或进程的次数',
+                                  ('module', 'policy'))
+
+
+class ModuleCallError(Exception):
+    """
+    进程中的模块调用失败或进程意外退出
+    """
+
+
+class ModulePoolExhausted(TimeoutError):
+    """
+    模块被放弃的线程太多，线程池暂停使用，调用直接按超时处理
+    """
+
+
+def _process_worker_main(conn, py_file_path):
+    """
+    进程池中每个进程的入口：导入模块并创建实例，然后依次处理 (方法名, 位置参数, 关键字参数) 请求
+    """
+    # Ctrl+C 由主进程处理，主进程退出时会结束这些进程
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    try:
+        instance = load_function_module(py_file_path)()
+    except Exception as exception:
+        conn.send((False, f'导入模块失败：{type(exception).__name__}: {exception}'))
+        return
+    conn.send((True, None))
+    while True:
+        try:
+            request = conn.recv()
+        except EOFError:
+            break
+        if request is None:
+            break
+        method, args, kwargs = request
+        try:
+            conn.send((True, getattr(instance, method)(*args, **kwargs)))
+        except Exception as exception:
+            # 异常对象不一定能序列化，只传回描述
+            conn.send((False, f'{type(exception).__name__}: {exception}'))
+
+
+class ProcessWorker:
+    """
+    运行一个功能模块的子进程，通过管道发送请求和接收回复
+    """
+
+    def __init__(self, context, py_file_path, name):
+        self._conn, child_conn = context.Pipe()
+        self.process = context.Process(target=_process_worker_main, args=(child_conn, py_file_path),
+                                       name=name, daemon=True)
+        self.process.start()
+        child_conn.close()
+        self._ready = False
+
+    def _receive(self):
+        try:
+            ok, result = self._conn.recv()
+        except (EOFError, OSError):
+            raise ModuleCallError('模块进程意外退出')
+        if not ok:
+            raise ModuleCallError(result)
+        return result
+
+    def call(self, method, args, kwargs, timeout):
+        """
+        在子进程中调用模块的方法，超过期限时抛出 TimeoutError
+        """
+        if not self._ready:
+            # 等待子进程导入模块
+            if not self._conn.poll(PROCESS_START_TIMEOUT):
+                raise TimeoutError
+            self._receive()
+            self._ready = True
+        self._conn.send((method, args, kwargs))
+        if not self._conn.poll(timeout):
+            raise TimeoutError
+        return self._receive()
+
+    def kill(self):
+        """
+        立即结束子进程
+        """
+        self.process.kill()
+        self.process.join()
+        self._conn.close()
+
+    def close(self):
+        """
+        通知子进程退出，没有按时退出时结束它
+        """
+        try:
+            self._conn.send(None)
+        except OSError:
+            pass
+        self.process.join(timeout=1)
+        if self.process.is_alive():
+            self.process.kill()
+            self.process.join()
+        self._conn.close()
+
+
+class ProcessModulePool:
+    """
+    一个功能模块的进程池，每个进程各自导入模块，请求和回复序列化后通过管道传递。
+
+    超时的进程被结束并立即启动新进程替换，其它进程不受影响。
+    模块的状态（如 user_states）不在进程之间共享，适合没有状态的计算型模块。
+    """
+
+    policy = 'process'
+
+    def __init__(self, context, py_file_path, size):
+        self.py_file_path = py_file_path
+        self.name = os.path.basename(py_file_path)
+        self._context = context
+        self._idle = queue.Queue()
+        self._closed = False
+        self._lock = threading.Lock()
+        self._counter = 0
+        # 提前启动所有进程，第一次调用不需要等待导入
+        for _ in range(size):
+            self._idle.put(self._start_worker())
+
+    def _start_worker(self):
+        with self._lock:
+            self._counter += 1
+            name = f'Module-{self.name}-{self._counter}'
+        return ProcessWorker(self._context, self.py_file_path, name)
+
+    def call(self, method, args, kwargs, timeout):
+        deadline = time.monotonic() + timeout
+        try:
+            # 所有进程都在忙时排队，排队时间也计入期限
+            worker = self._idle.get(timeout=timeout)
+        except queue.Empty:
+            raise TimeoutError
+        try:
+            result = worker.call(method, args, kwargs, max(deadline - time.monotonic(), 0))
+        except TimeoutError:
+            worker.kill()
+            MODULE_RESTARTS.inc(module=self.name, policy=self.policy)
+            self._release(self._start_worker())
+            raise
+        except ModuleCallError:
+            if not worker.process.is_alive():
+                worker.kill()
+                worker = self._start_worker()
+            self._release(worker)
+            raise
+        self._release(worker)
+        return result
+
+    def _release(self, worker):
+        if self._closed:
+            worker.close()
+        else:
+            self._idle.put(worker)
+
+    def get_stats(self):
+        """
+        返回进程池的统计信息
+        """
+        return {'module': self.name, 'policy': self.policy, 'idle': self._idle.qsize(), 'started': self._counter}
+
+    def close(self):
+        """
+        结束所有空闲的进程，正在处理的进程在调用结束后结束
+        """
+        self._closed = True
+        while True:
+            try:
+                self._idle.get_nowait().close()
+            except queue.Empty:
+                break
+
+
+def _thread_worker_main(tasks):
+    """
+    线程池中每个线程的入口，收到 None 时退出
+    """
+    while True:
+        task = tasks.get()
+        if task is None:
+            return
+        future, func, args, kwargs = task
+        if not future.set_running_or_notify_cancel():
+            continue
+        try:
+            future.set_result(func(*args, **kwargs))
+        except BaseException as exception:
+            future.set_exception(exception)
+
+
+class ThreadModulePool:
+    """
+    一个功能模块专用的线程池，一个模块卡住不会占满处理消息的工作线程。
+
+    线程无法被强制结束，超时后放弃当前的线程并启动新的线程，卡住的线程结束当前调用后自行退出，
+    之后的调用不会排在它们后面。线程都是守护线程，卡住的线程不会阻止程序退出。
+
+    被放弃但还没有结束的线程达到 max_abandoned 个后不再启动新线程，之后的调用直接抛出
+    ModulePoolExhausted，直到卡住的线程陆续结束，线程数不会随模块反复卡住无限增长。
+    """
+
+    policy = 'thread'
+
+    def __init__(self, module, name, size, max_abandoned=MAX_ABANDONED_THREADS):
+        self.module = module
+        self.name = name
+        self._size = size
+        self.max_abandoned = max_abandoned
+        self._counter = itertools.count(1)
+        self._lock = threading.Lock()
+        # 被放弃的线程，结束后在 _abandoned_count 中移除
+        self._abandoned = []
+        self._restarts = 0
+        self._rejected = 0
+        self._closed = False
+        self._threads = []
+        self._tasks = self._start()
+
+    def _start(self):
+        """
+        启动一组线程，返回它们共用的任务队列
+        """
+        tasks = queue.Queue()
+        self._threads = []
+        for _ in range(self._size):
+            thread = threading.Thread(target=_thread_worker_main, args=(tasks,),
+                                      name=f'Module-{self.name}-{next(self._counter)}')
+            thread.daemon = True
+            thread.start()
+            self._threads.append(thread)
+        return tasks
+
+    def _abandoned_count(self):
+        """
+        返回被放弃且还没有结束的线程数，调用时需持有锁
+        """
+        self._abandoned = [thread for thread in self._abandoned if thread.is_alive()]
+        return len(self._abandoned)
+
+    def _stop(self, tasks):
+        """
+        取消还在排队的调用，线程处理完当前调用后退出
+        """
+        while True:
+            try:
+                task = tasks.get_nowait()
+            except queue.Empty:
+                break
+            if task is not None:
+                task[0].cancel()
+        for _ in range(self._size):
+            tasks.put(None)
+
+    def call(self, method, args, kwargs, timeout):
+        tasks = self._tasks
+        if tasks is None:
+            with self._lock:
+                if self._tasks is None:
+                    if self._closed or self._abandoned_count() >= self.max_abandoned:
+                        self._rejected += 1
+                        raise ModulePoolExhausted
+                    # 卡住的线程已经结束了一部分，恢复使用
+                    logging.info("功能模块 %s 被放弃的线程已减少，恢复线程池", self.name)
+                    self._tasks = self._start()
+                tasks = self._tasks
+        future = Future()
+        tasks.put((future, getattr(self.module, method), args, kwargs))
+        try:
+            return future.result(timeout=timeout)
+        except FutureTimeoutError:
+            # 没有开始执行说明所有线程都被占用，同样需要替换
+            future.cancel()
+            with self._lock:
+                # 其它线程可能已经替换过了
+                if self._tasks is tasks:
+                    self._abandoned.extend(self._threads)
+                    self._stop(tasks)
+                    if self._abandoned_count() >= self.max_abandoned:
+                        self._tasks = None
+                        logging.warning("功能模块 %s 被放弃的线程达到 %d 个，暂停线程池，调用直接返回超时回复",
+                                        self.name, self.max_abandoned)
+                    else:
+                        self._tasks = self._start()
+                        self._restarts += 1
+                        MODULE_RESTARTS.inc(module=self.name, policy=self.policy)
+            raise TimeoutError
+
+    def get_stats(self):
+        """
+        返回线程池的统计信息
+
+        Returns:
+            dict: 当前线程数、被放弃且还没有结束的线程数、替换次数，以及暂停期间直接拒绝的调用数。
+        """
+        with self._lock:
+            return {
+                'module': self.name,
+                'policy': self.policy,
+                'threads': len(self._threads) if self._tasks is not None else 0,
+                'abandoned': self._abandoned_count(),
+                'restarts': self._restarts,
+                'rejected': self._rejected,
+            }
+
+    def close(self):
+        with self._lock:
+            self._closed = True
+            if self._tasks is not None:
+                self._stop(self._tasks)
+                self._tasks = None
+
+
+class ModuleExecutor:
+    """
+    按模块的 execution_policy 属性调用模块：
+
+        inline: 在处理消息的工作线程中直接执行（默认）。无法中断，超过期限时只记录。
+        thread: 在模块专用的线程池中执行，超过期限时返回 fallback_reply 并替换线程池；
+            被放弃的线程达到上限后暂停线程池，调用直接返回 fallback_reply。
+        process: 在模块专用的进程池中执行，超过期限时返回 fallback_reply，结束超时的进程并启动新进程。
+
+    模块可以通过 timeout 属性设置单次调用的期限（秒），通过 fallback_reply 属性设置超时的回复。
+    """
+
+    def __init__(self, thread_workers=THREAD_WORKERS, process_workers=PROCESS_WORKERS):
+        """
+        Args:
+            thread_workers (int): thread 方式每个模块的线程数。
+            process_workers (int): process 方式每个模块的进程数。
+        """
+        self.thread_workers = thread_workers
+        self.process_workers = process_workers
+        # 使用 spawn 启动子进程，不复制主进程中其它线程持有的锁
+        self._context = multiprocessing.get_context('spawn')
+        # 功能模块对象 -> 线程池或进程池
+        self._pools = {}
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def get_module_name(module):
+        py_file_path = getattr(module, 'py_file_path', None) or inspect.getfile(type(module))
+        return os.path.basename(py_file_path)
+
+    def _get_pool(self, module, policy):
+        pool = self._pools.get(module)
+        if pool is not None:
+            return pool
+        with self._lock:
+            pool = self._pools.get(module)
+            if pool is None:
+                if policy == 'process':
+                    py_file_path = getattr(module, 'py_file_path', None) or inspect.getfile(type(module))
+                    pool = ProcessModulePool(self._context, py_file_path, self.process_workers)
+                else:
+                    pool = ThreadModulePool(module, self.get_module_name(module), self.thread_workers)
+                self._pools[module] = pool
+            return pool
+
+    def call(self, module, method, *args, **kwargs):
+        """
+        按模块的执行方式调用 module.method(*args, **kwargs)
+
+        Returns:
+            调用结果，thread 和 process 方式超过期限时返回模块的 fallback_reply。
+
+        Raises:
+            ModuleCallError: process 方式下模块抛出异常或进程意外退出。
+        """
+        policy = getattr(module, 'execution_policy', 'inline')
+        timeout = getattr(module, 'timeout', DEFAULT_TIMEOUT)
+        if policy not in POLICIES:
+            raise ValueError(f'未知的执行方式：{policy}')
+        if policy == 'inline':
+            start = time.perf_counter()
+            result = getattr(module, method)(*args, **kwargs)
+            elapsed = time.perf_counter() - start
+            if elapsed > timeout:
+                name = self.get_module_name(module)
+                MODULE_TIMEOUTS.inc(module=name, policy=policy)
+                logging.warning("功能模块 %s 执行了 %.1fs，超过期限 %.1fs，可以改为 thread 或 process 执行方式",
+                                name, elapsed, timeout)
+            return result
+        pool = self._get_pool(module, policy)
+        try:
+            return pool.call(method, args, kwargs, timeout)
+        except ModulePoolExhausted:
+            return getattr(module, 'fallback_reply', DEFAULT_FALLBACK_REPLY)
+        except TimeoutError:
+            name = self.get_module_name(module)
+            MODULE_TIMEOUTS.inc(module=name, policy=policy)
+            logging.warning("功能模块 %s 超过期限 %.1fs，返回超时回复", name, timeout)
+            return getattr(module, 'fallback_reply', DEFAULT_FALLBACK_REPLY)
+
+    def get_stats(self):
+        """
+        返回每个模块线程池或进程池的统计信息
+
+        Returns:
+            list of dict: 见 ThreadModulePool.get_stats 和 ProcessModulePool.get_stats。
+        """
+        with self._lock:
+            pools = list(self._pools.values())
+        return [pool.get_stats() for pool in pools]
+
+    def retire(self, modules):
+        """
+        关闭不在 modules 中的模块的线程池和进程池，用于热重载替换模块之后
+        """
+        keep = set(modules)
+        with self._lock:
+            retired = [module for module in self._pools if module not in keep]
+            pools = [self._pools.pop(module) for module in retired]
+        for pool in pools:
+            pool.close()
+
+    def close(self):
+        """
+        关闭所有线程池和进程池
+        """
+        self.retire(())
@@ -0,0 +1,275 @@
+"""
+异步发送队列：限速、合并同一会话的回复、失败重试
+"""
+import heapq
+import logging
+import threading
+import time
+from utils.metrics import METRICS
+
+# 合并多条回复时使用的分隔线
+COALESCE_SEPARATOR = '\n──────────\n'
+
+SEND_LATENCY = METRICS.histogram('wechatbot_send_seconds', '发送消息的耗时')
+SEND_FAILURES = METRICS.counter('wechatbot_send_failures_total', '发送消息失败的次数')
+SEND_RETRIES = METRICS.counter('wechatbot_send_retries_total', '发送消息重试的次数')
+SEND_DROPPED = METRICS.counter('wechatbot_send_dropped_total', '重试后仍然失败被丢弃的回复数')
+SEND_COALESCED = METRICS.counter('wechatbot_send_coalesced_total', '被合并到其它消息中一起发送的回复数')
+OUTBOUND_DEPTH = METRICS.gauge('wechatbot_outbound_queue_depth', '等待发送的回复数')
+
+
+class TokenBucket:
+    """
+    令牌桶，按固定速率补充令牌，最多保存 capacity 个
+    """
+    __slots__ = ('rate', 'capacity', 'tokens', 'updated')
+
+    def __init__(self, rate, capacity):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated = time.monotonic()
+
+    def _refill(self, now):
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def wait_time(self, now):
+        """
+        返回还需要等待多久才有一个令牌，0 表示现在就有
+        """
+        self._refill(now)
+        if self.tokens >= 1:
+            return 0.0
+        return (1 - self.tokens) / self.rate
+
+    def consume(self):
+        """
+        取走一个令牌，调用前需确认 wait_time 为 0
+        """
+        self.tokens -= 1
+
+    def is_full(self, now):
+        """
+        令牌是否已经补满（长时间没有使用）
+        """
+        self._refill(now)
+        return self.tokens >= self.capacity
+
+
+class ChatOutbox:
+    """
+    一个会话待发送的回复
+    """
+    __slots__ = ('messages', 'scheduled', 'attempts')
+
+    def __init__(self):
+        # 元素为 (消息, 包含的回复数)，重试时合并后的消息会放回队首
+        self.messages = []
+        # 是否已在发送计划中
+        self.scheduled = False
+        # 当前这批回复已经失败的次数
+        self.attempts = 0
+
+
+class OutboundSender:
+    """
+    工作线程把回复放入队列后立即返回，由独立的发送线程按全局和单个会话的速率限制发送。
+
+    会话没有待发送的回复且有令牌时立即发送；会话被限速或正在发送时，之后到达的回复
+    在合并窗口内合并为一条消息发送。发送失败（如被微信限流）时按指数退避重试，不会占用工作线程。
+    """
+
+    def __init__(self, send_func, global_rate=5.0, global_burst=10, chat_rate=1.0, chat_burst=3,
+                 coalesce_window=0.3, max_retries=3, retry_backoff=1.0):
+        """
+        Args:
+            send_func (callable): 实际发送消息的函数，参数为 (消息, 接收者)，失败时抛出异常。
+            global_rate (float): 全局每秒最多发送的消息数。
+            global_burst (int): 全局允许的突发消息数。
+            chat_rate (float): 单个会话每秒最多发送的消息数。
+            chat_burst (int): 单个会话允许的突发消息数。
+            coalesce_window (float): 合并窗口（秒），会话被限速时，窗口内同一会话的回复合并发送。
+            max_retries (int): 最多重试次数。
+            retry_backoff (float): 第一次重试前等待的秒数，之后每次翻倍。
+        """
+        self.send_func = send_func
+        self.global_bucket = TokenBucket(global_rate, global_burst)
+        self.chat_rate = chat_rate
+        self.chat_burst = chat_burst
+        self.coalesce_window = coalesce_window
+        self.max_retries = max_retries
+        self.retry_backoff = retry_backoff
+
+        # 会话 -> ChatOutbox
+        self._outboxes = {}
+        # 会话 -> TokenBucket，长时间不用的会话会被清理
+        self._chat_buckets = {}
+        # 发送计划，元素为 (计划发送时间, 序号, 会话)
+        self._schedule = []
+        self._sequence = 0
+        self._pending_count = 0
+        self._condition = threading.Condition()
+        self._running = False
+        self._thread = None
+        self._last_cleanup = time.monotonic()
+        OUTBOUND_DEPTH.set_function(self.qsize)
+
+    def start(self):
+        """
+        启动发送线程
+        """
+        self._running = True
+        self._thread = threading.Thread(target=self._run, name='OutboundSender')
+        self._thread.daemon = True
+        self._thread.start()
+
+    def stop(self, timeout=5):
+        """
+        等待已排队的回复发送完（最多 timeout 秒）后停止发送线程
+        """
+        deadline = time.monotonic() + timeout
+        while self.qsize() and time.monotonic() < deadline:
+            time.sleep(0.05)
+        with self._condition:
+            self._running = False
+            self._condition.notify_all()
+        if self._thread is not None:
+            self._thread.join(timeout=1)
+
+    def qsize(self):
+        """
+        返回等待发送的回复数
+        """
+        return self._pending_count
+
+    def enqueue(self, message, to_user_name):
+        """
+        把回复放入发送队列，立即返回
+        """
+        with self._condition:
+            outbox = self._outboxes.get(to_user_name)
+            # 会话的发件箱在发送结束前一直存在，没有发件箱说明既没有排队也没有正在发送的回复
+            idle = outbox is None
+            if idle:
+                outbox = ChatOutbox()
+                self._outboxes[to_user_name] = outbox
+            outbox.messages.append((message, 1))
+            self._pending_count += 1
+            if not outbox.scheduled:
+                outbox.scheduled = True
+                now = time.monotonic()
+                if idle and self._has_tokens(to_user_name, now):
+                    # 不需要等待，立即发送
+                    self._push(now, to_user_name)
+                else:
+                    self._push(now + self.coalesce_window, to_user_name)
+
+    def _has_tokens(self, to_user_name, now):
+        """
+        会话和全局是否都有令牌，不取走令牌，调用时需持有锁
+        """
+        bucket = self._chat_buckets.get(to_user_name)
+        if bucket is not None and bucket.wait_time(now) > 0:
+            return False
+        return self.global_bucket.wait_time(now) == 0
+
+    def _push(self, ready_time, to_user_name):
+        """
+        加入发送计划，调用时需持有锁
+        """
+        self._sequence += 1
+        heapq.heappush(self._schedule, (ready_time, self._sequence, to_user_name))
+        self._condition.notify()
+
+    def _next_batch(self):
+        """
+        等待下一个可以发送的会话，返回 (会话, 合并后的消息, 包含的回复数, 合并的条数)，停止时返回 None
+        """
+        with self._condition:
+            while self._running:
+                now = time.monotonic()
+                if not self._schedule:
+                    self._condition.wait(1)
+                    continue
+                ready_time, _, to_user_name = self._schedule[0]
+                if ready_time > now:
+                    self._condition.wait(ready_time - now)
+                    continue
+                bucket = self._chat_buckets.get(to_user_name)
+                if bucket is None:
+                    bucket = TokenBucket(self.chat_rate, self.chat_burst)
+                    self._chat_buckets[to_user_name] = bucket
+                wait = max(bucket.wait_time(now), self.global_bucket.wait_time(now))
+                heapq.heappop(self._schedule)
+                if wait > 0:
+                    # 被限速，推迟发送，期间到达的回复会一起合并
+                    self._push(now + wait, to_user_name)
+                    continue
+                bucket.consume()
+                self.global_bucket.consume()
+                outbox = self._outboxes[to_user_name]
+                messages = outbox.messages
+                outbox.messages = []
+                message = COALESCE_SEPARATOR.join(text for text, _ in messages)
+                return to_user_name, message, sum(count for _, count in messages), len(messages)
+        return None
+
+    def _run(self):
+        while True:
+            batch = self._next_batch()
+            if batch is None:
+                return
+            to_user_name, message, count, merged = batch
+            start = time.perf_counter()
+            try:
+                self.send_func(message, to_user_name)
+                succeeded = True
+            except Exception as exception:
+                succeeded = False
+                SEND_FAILURES.inc()
+                logging.error("发送消息给 %s 失败：%s", to_user_name, exception)
+            finally:
+                SEND_LATENCY.observe(time.perf_counter() - start)
+            if merged > 1:
+                SEND_COALESCED.inc(merged - 1)
+            self._finish(to_user_name, message, count, succeeded)
+
+    def _finish(self, to_user_name, message, count, succeeded):
+        """
+        发送结束后更新会话状态，失败时按退避时间重新加入计划
+        """
+        with self._condition:
+            outbox = self._outboxes[to_user_name]
+            now = time.monotonic()
+            if succeeded:
+                outbox.attempts = 0
+                self._pending_count -= count
+            elif outbox.attempts < self.max_retries:
+                # 放回队首，和之后到达的回复一起重试
+                outbox.attempts += 1
+                outbox.messages.insert(0, (message, count))
+                SEND_RETRIES.inc()
+                self._push(now + self.retry_backoff * 2 ** (outbox.attempts - 1), to_user_name)
+                return
+            else:
+                logging.error("发送消息给 %s 重试 %d 次后仍然失败，已丢弃", to_user_name, self.max_retries)
+                outbox.attempts = 0
+                self._pending_count -= count
+                SEND_DROPPED.inc(count)
+            if outbox.messages:
+                self._push(now, to_user_name)
+            else:
+                del self._outboxes[to_user_name]
+            self._cleanup_buckets(now)
+
+    def _cleanup_buckets(self, now):
+        """
+        每分钟清理一次已经补满令牌、没有待发送回复的会话，调用时需持有锁
+        """
+        if now - self._last_cleanup < 60:
+            return
+        self._last_cleanup = now
+        for to_user_name in [name for name, bucket in self._chat_buckets.items()
+                             if name not in self._outboxes and bucket.is_full(now)]:
+            del self._chat_buckets[to_user_name]
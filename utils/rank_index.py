@@ -0,0 +1,225 @@
+"""
+内存中的有序排名索引，支持 O(log n) 查询某个键的名次和按名次取一段
+"""
+import bisect
+import threading
+
+# 每个分段的目标长度，超过两倍时拆分
+DEFAULT_LOAD = 1000
+
+
+class RankIndex:
+    """
+    把所有键按升序分成若干个有序分段，再用树状数组保存每个分段的长度，
+    插入、删除、查询名次和按名次定位都是 O(log n)（加上分段内的 O(load) 移动）。
+
+    键不允许重复，add 和 discard 都是幂等的。
+
+    索引从数据库加载期间发生的更新会先记录下来，加载完成后按顺序重放，
+    保证加载时的快照和之后的更新都不会丢失。
+    """
+
+    def __init__(self, load=DEFAULT_LOAD):
+        self.load = load
+        self.ready = False
+        self._lists = []
+        # 每个分段的最大键，用于定位分段
+        self._maxes = []
+        # 分段长度的树状数组，下标从 1 开始
+        self._tree = [0]
+        self._size = 0
+        # 加载期间记录的更新，不在加载时为 None
+        self._pending = None
+        self._lock = threading.RLock()
+
+    def __len__(self):
+        return self._size
+
+    def begin_build(self):
+        """
+        开始从数据源加载，之后的 update 会被记录下来
+        """
+        with self._lock:
+            self._pending = []
+
+    def finish_build(self, sorted_keys):
+        """
+        用已排序的键构建索引，并重放加载期间记录的更新
+
+        Args:
+            sorted_keys (iterable): 按升序排列、没有重复的键。
+        """
+        lists = []
+        chunk = []
+        for key in sorted_keys:
+            chunk.append(key)
+            if len(chunk) == self.load:
+                lists.append(chunk)
+                chunk = []
+        if chunk:
+            lists.append(chunk)
+        with self._lock:
+            self._lists = lists
+            self._maxes = [chunk[-1] for chunk in lists]
+            self._size = sum(len(chunk) for chunk in lists)
+            self._rebuild_tree()
+            pending = self._pending or []
+            self._pending = None
+            for old_key, new_key in pending:
+                self._update(old_key, new_key)
+            self.ready = True
+
+    def reset(self):
+        """
+        清空索引，下次使用前需要重新加载
+        """
+        with self._lock:
+            self._lists = []
+            self._maxes = []
+            self._tree = [0]
+            self._size = 0
+            self._pending = None
+            self.ready = False
+
+    def update(self, old_key, new_key):
+        """
+        把 old_key 替换为 new_key，old_key 为 None 或不存在时只插入 new_key。
+
+        索引还没有加载时忽略更新，加载时会从数据源读到最新的值。
+        """
+        with self._lock:
+            if self._pending is not None:
+                self._pending.append((old_key, new_key))
+            elif self.ready:
+                self._update(old_key, new_key)
+
+    def _update(self, old_key, new_key):
+        if old_key is not None:
+            self._discard(old_key)
+        if new_key is not None:
+            self._add(new_key)
+
+    def _rebuild_tree(self):
+        tree = [0] * (len(self._lists) + 1)
+        for index, chunk in enumerate(self._lists, start=1):
+            tree[index] += len(chunk)
+            parent = index + (index & -index)
+            if parent < len(tree):
+                tree[parent] += tree[index]
+        self._tree = tree
+
+    def _tree_add(self, index, delta):
+        index += 1
+        while index < len(self._tree):
+            self._tree[index] += delta
+            index += index & -index
+
+    def _prefix(self, index):
+        """
+        前 index 个分段的总长度
+        """
+        total = 0
+        while index > 0:
+            total += self._tree[index]
+            index -= index & -index
+        return total
+
+    def _add(self, key):
+        if not self._lists:
+            self._lists.append([key])
+            self._maxes.append(key)
+            self._size = 1
+            self._rebuild_tree()
+            return
+        position = bisect.bisect_left(self._maxes, key)
+        if position == len(self._maxes):
+            position -= 1
+        chunk = self._lists[position]
+        index = bisect.bisect_left(chunk, key)
+        if index < len(chunk) and chunk[index] == key:
+            return
+        chunk.insert(index, key)
+        self._maxes[position] = chunk[-1]
+        self._size += 1
+        if len(chunk) > self.load * 2:
+            # 分段过长，拆成两半，分段数量变化后重建树状数组
+            self._lists[position:position + 1] = [chunk[:self.load], chunk[self.load:]]
+            self._maxes[position:position + 1] = [chunk[self.load - 1], chunk[-1]]
+            self._rebuild_tree()
+        else:
+            self._tree_add(position, 1)
+
+    def _discard(self, key):
+        position = bisect.bisect_left(self._maxes, key)
+        if position == len(self._maxes):
+            return
+        chunk = self._lists[position]
+        index = bisect.bisect_left(chunk, key)
+        if index == len(chunk) or chunk[index] != key:
+            return
+        del chunk[index]
+        self._size -= 1
+        if chunk:
+            self._maxes[position] = chunk[-1]
+            self._tree_add(position, -1)
+        else:
+            del self._lists[position]
+            del self._maxes[position]
+            self._rebuild_tree()
+
+    def rank(self, key):
+        """
+        返回键的名次（从 0 开始），键不存在时返回 None
+        """
+        with self._lock:
+            position = bisect.bisect_left(self._maxes, key)
+            if position == len(self._maxes):
+                return None
+            chunk = self._lists[position]
+            index = bisect.bisect_left(chunk, key)
+            if index == len(chunk) or chunk[index] != key:
+                return None
+            return self._prefix(position) + index
+
+    def position(self, key):
+        """
+        返回小于等于 key 的键的数量，即排在 key 之后的第一个键的名次（key 不需要存在）
+        """
+        with self._lock:
+            position = bisect.bisect_right(self._maxes, key)
+            if position == len(self._maxes):
+                return self._size
+            return self._prefix(position) + bisect.bisect_right(self._lists[position], key)
+
+    def _locate(self, rank):
+        """
+        返回名次所在的 (分段, 分段内下标)，在树状数组上二分查找
+        """
+        position = 0
+        remaining = rank
+        step = 1 << (len(self._tree).bit_length())
+        while step:
+            next_position = position + step
+            if next_position < len(self._tree) and self._tree[next_position] <= remaining:
+                position = next_position
+                remaining -= self._tree[next_position]
+            step >>= 1
+        return position, remaining
+
+    def slice(self, start, stop):
+        """
+        返回名次在 [start, stop) 之间的键
+        """
+        with self._lock:
+            start = max(0, start)
+            stop = min(self._size, stop)
+            if start >= stop:
+                return []
+            position, index = self._locate(start)
+            keys = []
+            while len(keys) < stop - start:
+                chunk = self._lists[position]
+                keys.extend(chunk[index:index + stop - start - len(keys)])
+                position += 1
+                index = 0
+            return keys
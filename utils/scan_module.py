@@ -1,75 +1,436 @@
-"""
-扫描模块
-"""
-import os
-import importlib.util
-import json
-
-
-def get_command_module_dict(modules_path='./module'):
-    """
-    扫描指定目录下的所有 .py 文件，动态导入每个文件中的 FunctionModule 类，
-    并构建一个字典，以对应命令值为键，功能模块对象为值。
-
-    同时，调用每个模块的 get_simple_description() 方法，
-    将简单介绍以 JSON 格式保存在 data 文件夹下。
-
-    参数：
-        modules_path (str): 要扫描的目录路径。默认值为 '/module'。
-
-    返回：
-        dict: 包含 command_sign 和对应功能模块对象的字典。
-    """
-    # 用于存储不同模块命令对应的功能模块对象
-    command_module_dict = {}
-    # 用于存储模块的简单介绍
-    description_dict = {}
-
-    # 遍历指定目录下的所有文件
-    for root, _, files in os.walk(modules_path):
-        for file in files:
-            if file.endswith('.py'):
-                # 获取每个 .py 文件的完整路径
-                py_file_path = os.path.join(root, file).replace("\\", "/")
-
-                # 动态加载模块
-                spec = importlib.util.spec_from_file_location("module.name", py_file_path)
-                module = importlib.util.module_from_spec(spec)
-                spec.loader.exec_module(module)
-
-                # 获取 FunctionModule 类
-                function_module = getattr(module, 'FunctionModule', None)
-                if function_module is None or not function_module.is_active:
-                    continue  # 如果模块中没有 FunctionModule 类，则跳过该文件
-                print(file)
-                # 实例化 FunctionModule 类
-                function_module_instance = function_module()
-
-                # 调用 get_command_sign 方法获取返回值
-                command_sign = function_module_instance.get_command_sign()
-
-                # 调用 get_simple_description 方法获取简单介绍
-                description = function_module_instance.get_simple_description()
-
-                # 根据返回值更新字典
-                if isinstance(command_sign, list):
-                    for sign in command_sign:
-                        command_module_dict[sign] = function_module_instance
-                    # 使用第一个命令作为键，保存简单介绍
-                    if command_sign:
-                        description_dict[command_sign[0]] = description
-                else:
-                    command_module_dict[command_sign] = function_module_instance
-                    description_dict[command_sign] = description
-
-    # 确保 data 文件夹存在
-    data_dir = './data'
-    if not os.path.exists(data_dir):
-        os.makedirs(data_dir)
-
-    # 将描述信息保存为 JSON 格式
-    description_file_path = os.path.join(data_dir, 'description.json')
-    with open(description_file_path, 'w', encoding='utf-8') as f:
-        json.dump(description_dict, f, ensure_ascii=False, indent=4)
-
-    return command_module_dict
+"""
+扫描模块
+"""
+import collections
+import os
+import hashlib
+import importlib.util
+import itertools
+import json
+import logging
+import sys
+import threading
+import time
+from utils.metrics import METRICS
+
+# 模块清单的格式版本，格式变化时旧清单全部作废
+MANIFEST_VERSION = 3
+
+MODULE_SCAN_SECONDS = METRICS.gauge('wechatbot_module_scan_seconds', '启动时扫描功能模块的耗时')
+MODULE_LOAD_SECONDS = METRICS.histogram('wechatbot_module_load_seconds', '功能模块第一次使用时导入和初始化的耗时',
+                                        ('module',))
+MODULE_RELOADS = METRICS.counter('wechatbot_module_reloads_total', '功能模块热重载的次数', ('module', 'result'))
+
+# 每次导入使用不同的模块名，重载后新旧两个版本可以同时存在
+_import_generations = itertools.count(1)
+
+# 重新扫描时被替换的模块：文件路径、已经加载的旧实例（没有加载过时为 None）、新实例（文件被删除时为 None）
+ModuleChange = collections.namedtuple('ModuleChange', ['path', 'old_instance', 'new_instance'])
+
+
+def load_function_module(py_file_path):
+    """
+    导入一个 .py 文件，返回其中的 FunctionModule 类，没有时返回 None
+
+    模块以 wechatbot_modules.<文件名>_<序号> 的唯一名称注册到 sys.modules，
+    同一个文件每次导入都是一个新的模块对象，类和单例实例都不会与之前的版本共用。
+    """
+    stem = os.path.splitext(os.path.basename(py_file_path))[0]
+    module_name = f'wechatbot_modules.{stem}_{next(_import_generations)}'
+    spec = importlib.util.spec_from_file_location(module_name, py_file_path)
+    module = importlib.util.module_from_spec(spec)
+    sys.modules[module_name] = module
+    try:
+        spec.loader.exec_module(module)
+    except BaseException:
+        del sys.modules[module_name]
+        raise
+    return getattr(module, 'FunctionModule', None)
+
+
+def unload_function_module(instance):
+    """
+    从 sys.modules 中移除实例所属的模块，模块在不再被引用后释放
+    """
+    sys.modules.pop(type(instance).__module__, None)
+
+
+def hand_off_state(old_instance, new_instance):
+    """
+    重载模块时把旧实例的状态交给新实例，并让旧实例释放它注册的资源。
+
+    模块可以实现以下钩子：
+        export_state(): 旧实例返回需要保留的状态。
+        import_state(state): 新实例接收旧实例导出的状态。
+        on_unload(): 旧实例被替换或删除时调用，用于取消注册的回调等，不应关闭共享的资源。
+
+    两个实例都没有实现 export_state / import_state 时，直接把旧实例的 user_states 交给新实例，
+    新旧实例共用同一个字典，交接期间旧实例上仍在进行的对局也不会丢失。
+    """
+    if hasattr(old_instance, 'export_state') and hasattr(new_instance, 'import_state'):
+        new_instance.import_state(old_instance.export_state())
+    elif hasattr(old_instance, 'user_states') and hasattr(new_instance, 'user_states'):
+        new_instance.user_states = old_instance.user_states
+    if hasattr(old_instance, 'on_unload'):
+        old_instance.on_unload()
+
+
+def finish_reload(changes):
+    """
+    新的命令字典生效后，把被替换模块的状态交给新版本，并卸载旧版本。
+
+    旧实例的 on_unload 可能要等待进行中的请求结束，需要在新版本已经开始接收消息之后、
+    且不持有扫描器的锁时调用。
+
+    Args:
+        changes (list of ModuleChange): ModuleScanner.scan 返回的变化。
+    """
+    for change in changes:
+        name = os.path.basename(change.path)
+        old_instance = change.old_instance
+        try:
+            if old_instance is not None:
+                if change.new_instance is not None:
+                    hand_off_state(old_instance, change.new_instance)
+                elif hasattr(old_instance, 'on_unload'):
+                    old_instance.on_unload()
+                unload_function_module(old_instance)
+        except Exception as exception:
+            MODULE_RELOADS.inc(module=name, result='error')
+            logging.error("卸载功能模块 %s 的旧版本时发生异常：%s", name, exception)
+            continue
+        MODULE_RELOADS.inc(module=name, result='removed' if change.new_instance is None else 'ok')
+        logging.info("功能模块 %s 已%s", name, '移除' if change.new_instance is None else '重新加载')
+
+
+def describe_module(py_file_path):
+    """
+    导入并实例化模块，读取清单中需要保存的信息
+
+    Returns:
+        tuple: (清单条目, FunctionModule 实例)，模块没有 FunctionModule 或未激活时实例为 None。
+    """
+    function_module = load_function_module(py_file_path)
+    if function_module is None or not function_module.is_active:
+        return {'active': False}, None
+    print(os.path.basename(py_file_path))
+    instance = function_module()
+    command_sign = instance.get_command_sign()
+    entry = {
+        'active': True,
+        'command_sign': command_sign if isinstance(command_sign, list) else [command_sign],
+        'description': instance.get_simple_description(),
+        # 路由时需要读取的属性，读取它们不应导致模块被导入
+        'is_blocking': getattr(instance, 'is_blocking', False),
+        'accept_args': getattr(instance, 'accept_args', False),
+        # 提供 submit_messages 的模块在自己的事件循环中处理消息，调用方不需要等待
+        'is_async': hasattr(instance, 'submit_messages'),
+        # 执行方式、期限和超时回复，见 utils.module_executor
+        'execution_policy': getattr(instance, 'execution_policy', 'inline'),
+        'timeout': getattr(instance, 'timeout', None),
+        'fallback_reply': getattr(instance, 'fallback_reply', None),
+    }
+    return entry, instance
+
+
+class LazyModule:
+    """
+    功能模块的代理，路由需要的命令和属性来自模块清单，第一次处理消息时才导入模块并创建实例，
+    其它属性和方法都转发给实例。
+    """
+
+    def __init__(self, py_file_path, entry, instance=None):
+        """
+        Args:
+            py_file_path (str): 模块文件路径。
+            entry (dict): 模块清单中的条目。
+            instance: 扫描时已经创建的实例，为 None 时在第一次使用时创建。
+        """
+        self.py_file_path = py_file_path
+        self.is_blocking = entry['is_blocking']
+        self.accept_args = entry['accept_args']
+        self.is_async = entry['is_async']
+        self.execution_policy = entry['execution_policy']
+        # 模块没有声明时不设置，由 ModuleExecutor 使用默认值
+        for name in ('timeout', 'fallback_reply'):
+            if entry[name] is not None:
+                setattr(self, name, entry[name])
+        self._command_sign = entry['command_sign']
+        self._description = entry['description']
+        self._instance = instance
+        self._lock = threading.Lock()
+
+    @property
+    def loaded(self):
+        """
+        模块是否已经导入
+        """
+        return self._instance is not None
+
+    @property
+    def instance(self):
+        """
+        返回 FunctionModule 实例，第一次访问时导入模块
+        """
+        if self._instance is None:
+            with self._lock:
+                if self._instance is None:
+                    start = time.perf_counter()
+                    name = os.path.basename(self.py_file_path)
+                    print(name)
+                    self._instance = load_function_module(self.py_file_path)()
+                    elapsed = time.perf_counter() - start
+                    MODULE_LOAD_SECONDS.observe(elapsed, module=name)
+                    logging.info("功能模块 %s 已加载，耗时 %.1fms", name, elapsed * 1000)
+        return self._instance
+
+    def get_command_sign(self):
+        return self._command_sign
+
+    def get_simple_description(self):
+        return self._description
+
+    def __getattr__(self, name):
+        # 只有代理本身没有的属性才会走到这里；初始化完成前（如复制对象时）不转发，避免无限递归
+        if name.startswith('__') or name in ('_instance', '_lock'):
+            raise AttributeError(name)
+        return getattr(self.instance, name)
+
+
+def _read_json(path):
+    try:
+        with open(path, 'r', encoding='utf-8') as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+
+def _write_json_if_changed(path, data):
+    """
+    内容有变化时才写入文件，写入临时文件后替换，避免中途退出留下不完整的文件
+    """
+    if _read_json(path) == data:
+        return False
+    temp_path = path + '.tmp'
+    with open(temp_path, 'w', encoding='utf-8') as f:
+        json.dump(data, f, ensure_ascii=False, indent=4)
+    os.replace(temp_path, path)
+    return True
+
+
+class ModuleScanner:
+    """
+    扫描功能模块目录，维护模块清单和每个文件对应的 LazyModule。
+
+    模块的命令、简单介绍和路由需要的属性保存在 data 文件夹下的模块清单中，以文件路径为键，
+    修改时间和大小都没有变化时直接使用清单；有变化时比较文件内容的哈希，内容也变化了才导入模块。
+    使用清单的模块在第一次处理消息时才导入（见 LazyModule），启动耗时与模块数量基本无关。
+
+    再次扫描时只重新导入内容变化的文件，返回被替换的模块，调用方让新的命令字典生效后，
+    用 finish_reload 把旧版本的状态交给新版本并卸载旧版本；新版本导入失败时继续使用旧版本。
+    """
+
+    def __init__(self, modules_path='./module', data_dir='./data'):
+        """
+        Args:
+            modules_path (str): 要扫描的目录路径。
+            data_dir (str): 保存模块清单和简单介绍的目录。
+        """
+        self.modules_path = modules_path
+        self.data_dir = data_dir
+        self.manifest_path = os.path.join(data_dir, 'module_manifest.json')
+        # 文件路径 -> 清单条目，第一次扫描前从模块清单读取
+        self._entries = None
+        # 文件路径 -> LazyModule
+        self._proxies = {}
+        # 导入失败的文件路径 -> (修改时间, 大小)，文件再次变化前不重新导入
+        self._failed = {}
+        self._lock = threading.Lock()
+
+    def _load_manifest(self):
+        manifest = _read_json(self.manifest_path)
+        if not isinstance(manifest, dict) or manifest.get('version') != MANIFEST_VERSION:
+            return {}
+        return manifest['modules']
+
+    def _list_files(self):
+        """
+        返回目录下所有 .py 文件的路径
+        """
+        paths = []
+        for root, _, files in os.walk(self.modules_path):
+            for file in files:
+                if file.endswith('.py'):
+                    paths.append(os.path.join(root, file).replace("\\", "/"))
+        return paths
+
+    def scan(self):
+        """
+        扫描一次模块目录
+
+        Returns:
+            tuple: (命令 -> LazyModule 的字典, 本次新增、修改或删除的模块 ModuleChange 列表)。
+                第一次扫描时变化列表为空；列表不为空时，调用方使用新的命令字典后需要调用 finish_reload。
+        """
+        with self._lock:
+            start = time.perf_counter()
+            first_scan = self._entries is None
+            if first_scan:
+                # 确保 data 文件夹存在
+                if not os.path.exists(self.data_dir):
+                    os.makedirs(self.data_dir)
+                self._entries = self._load_manifest()
+            entries = {}
+            changed = []
+            imported = 0
+
+            paths = self._list_files()
+            for py_file_path in paths:
+                try:
+                    stat = os.stat(py_file_path)
+                except OSError:
+                    # 扫描期间被删除
+                    continue
+                entry = self._entries.get(py_file_path)
+                if entry is not None and entry['mtime_ns'] == stat.st_mtime_ns and entry['size'] == stat.st_size:
+                    entries[py_file_path] = entry
+                    continue
+                if self._failed.get(py_file_path) == (stat.st_mtime_ns, stat.st_size):
+                    if entry is not None:
+                        entries[py_file_path] = entry
+                    continue
+                with open(py_file_path, 'rb') as f:
+                    digest = hashlib.sha256(f.read()).hexdigest()
+                if entry is not None and entry['hash'] == digest:
+                    # 只有修改时间变化（如重新检出），内容不变
+                    entry = dict(entry, mtime_ns=stat.st_mtime_ns, size=stat.st_size)
+                    entries[py_file_path] = entry
+                    continue
+                # 新增或修改过的模块，导入后更新清单
+                imported += 1
+                try:
+                    new_entry, instance = describe_module(py_file_path)
+                except Exception as exception:
+                    if first_scan:
+                        raise
+                    MODULE_RELOADS.inc(module=os.path.basename(py_file_path), result='error')
+                    logging.error("重新导入功能模块 %s 失败，继续使用旧版本：%s", py_file_path, exception)
+                    self._failed[py_file_path] = (stat.st_mtime_ns, stat.st_size)
+                    if entry is not None:
+                        entries[py_file_path] = entry
+                    continue
+                self._failed.pop(py_file_path, None)
+                new_entry.update(hash=digest, mtime_ns=stat.st_mtime_ns, size=stat.st_size)
+                entries[py_file_path] = new_entry
+                change = self._replace(py_file_path, new_entry, instance)
+                if not first_scan:
+                    changed.append(change)
+
+            for py_file_path in set(self._failed) - set(paths):
+                del self._failed[py_file_path]
+            for py_file_path in set(self._proxies) - set(entries):
+                # 文件被删除
+                changed.append(self._replace(py_file_path, None, None))
+            if first_scan:
+                # 使用清单的模块还没有代理
+                for py_file_path, entry in entries.items():
+                    if entry['active'] and py_file_path not in self._proxies:
+                        self._proxies[py_file_path] = LazyModule(py_file_path, entry)
+            self._entries = entries
+
+            command_module_dict = {}
+            # 用于存储模块的简单介绍
+            description_dict = {}
+            for py_file_path, entry in entries.items():
+                if not entry['active']:
+                    continue
+                for sign in entry['command_sign']:
+                    command_module_dict[sign] = self._proxies[py_file_path]
+                # 使用第一个命令作为键，保存简单介绍
+                if entry['command_sign']:
+                    description_dict[entry['command_sign'][0]] = entry['description']
+
+            if first_scan or changed:
+                _write_json_if_changed(self.manifest_path, {'version': MANIFEST_VERSION, 'modules': entries})
+                # 将描述信息保存为 JSON 格式
+                _write_json_if_changed(os.path.join(self.data_dir, 'description.json'), description_dict)
+
+            elapsed = time.perf_counter() - start
+            if first_scan:
+                MODULE_SCAN_SECONDS.set(elapsed)
+                logging.info("扫描功能模块 %d 个，使用清单 %d 个，导入 %d 个，耗时 %.1fms",
+                             len(entries), len(entries) - imported, imported, elapsed * 1000)
+            return command_module_dict, changed
+
+    def _replace(self, py_file_path, entry, instance):
+        """
+        用新导入的版本替换文件对应的代理，entry 为 None 表示文件被删除。
+        只替换代理，旧版本由调用方在新的命令字典生效后用 finish_reload 卸载。
+
+        Returns:
+            ModuleChange: 被替换的模块。
+        """
+        old_proxy = self._proxies.pop(py_file_path, None)
+        if entry is not None and entry['active']:
+            self._proxies[py_file_path] = LazyModule(py_file_path, entry, instance)
+        old_instance = old_proxy.instance if old_proxy is not None and old_proxy.loaded else None
+        return ModuleChange(py_file_path, old_instance, instance)
+
+
+class ModuleWatcher:
+    """
+    定期检查模块目录，有模块新增、修改或删除时，把新的命令字典交给 on_change。
+
+    检查只读取文件的修改时间和大小，内容变化的文件在后台线程中导入，不影响消息处理。
+    on_change 返回（新的命令字典已经生效）后才交接状态并卸载旧版本。
+    """
+
+    def __init__(self, scanner, on_change, interval=1.0):
+        """
+        Args:
+            scanner (ModuleScanner): 已经完成第一次扫描的扫描器。
+            on_change (callable): 参数为新的 命令 -> 功能模块对象 字典。
+            interval (float): 检查间隔（秒）。
+        """
+        self.scanner = scanner
+        self.on_change = on_change
+        self.interval = interval
+        self._stop_event = threading.Event()
+        self._thread = threading.Thread(target=self._run, name='ModuleWatcher')
+        self._thread.daemon = True
+
+    def start(self):
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._stop_event.set()
+        self._thread.join()
+
+    def _run(self):
+        while not self._stop_event.wait(self.interval):
+            try:
+                command_module_dict, changed = self.scanner.scan()
+                if changed:
+                    self.on_change(command_module_dict)
+                    finish_reload(changed)
+            except Exception as exception:
+                logging.error("检查功能模块时发生异常：%s", exception)
+
+
+def get_command_module_dict(modules_path='./module', data_dir='./data'):
+    """
+    扫描指定目录下的所有 .py 文件，构建一个字典，以对应命令值为键，功能模块对象为值。
+
+    模块的命令和简单介绍缓存在模块清单中，见 ModuleScanner。
+    同时，将所有模块的简单介绍以 JSON 格式保存在 data 文件夹下，内容有变化时才写入。
+
+    参数：
+        modules_path (str): 要扫描的目录路径。默认值为 './module'。
+        data_dir (str): 保存模块清单和简单介绍的目录。默认值为 './data'。
+
+    返回：
+        dict: 包含 command_sign 和对应功能模块对象（LazyModule）的字典。
+    """
+    command_module_dict, _ = ModuleScanner(modules_path, data_dir).scan()
+    return command_module_dict
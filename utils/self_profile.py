@@ -0,0 +1,43 @@
+"""
+机器人自身账号信息的缓存
+"""
+import re
+import threading
+
+
+class SelfProfile:
+    """
+    缓存机器人自己的昵称，并预编译用于去除 @ 信息的正则。
+
+    登录或重新登录后调用 refresh 更新，处理群消息时不再需要每次调用 itchat.search_friends()。
+    """
+
+    def __init__(self):
+        self.user_name = None
+        self.nickname = None
+        self._mention_pattern = None
+        self._lock = threading.Lock()
+
+    def refresh(self, profile):
+        """
+        根据账号信息更新缓存
+
+        Args:
+            profile (dict): itchat.search_friends() 返回的自己的账号信息。
+        """
+        nickname = profile['NickName']
+        # 微信在 @昵称 后面会加一个四分之一空格（\u2005），也可能是普通空格
+        pattern = re.compile('@' + re.escape(nickname) + r'[\u2005\s]?')
+        with self._lock:
+            self.user_name = profile.get('UserName')
+            self.nickname = nickname
+            self._mention_pattern = pattern
+
+    def strip_mention(self, content):
+        """
+        去除消息中 @自己 的部分，返回实际内容
+        """
+        pattern = self._mention_pattern
+        if pattern is None:
+            return content.strip()
+        return pattern.sub('', content).strip()
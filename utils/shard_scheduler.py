@@ -0,0 +1,329 @@
+"""
+按发送者分片的消息调度器
+
+发送者用 (会话, 成员) 表示：私聊时会话是对方，成员为 None；群聊时会话是群，成员是群内发言的人。
+同一成员的消息按顺序处理，同一个群里不同成员的消息可以并行处理。
+"""
+import collections
+import threading
+import time
+from utils.metrics import METRICS
+
+# 优先级通道：本地的快速命令走高优先级，聊天等慢请求走低优先级
+LANE_HIGH = 0
+LANE_LOW = 1
+LANES = (LANE_HIGH, LANE_LOW)
+LANE_NAMES = ('high', 'low')
+
+# 队列满时的丢弃策略
+# reject：丢弃新到达的消息
+# drop_low：新消息是高优先级时，丢弃一条排队中的低优先级消息为它腾出位置，否则丢弃新消息
+SHED_POLICIES = ('reject', 'drop_low')
+
+SHED_MESSAGES = METRICS.counter('wechatbot_shed_total', '队列已满被丢弃的消息数', ('lane',))
+COLLAPSED_MESSAGES = METRICS.counter('wechatbot_collapsed_total', '同一发送者重复的消息被合并的次数')
+
+# 工作线程取到的一条消息：所在分片、发送者、消息内容、排队等待时间
+Ticket = collections.namedtuple('Ticket', ['shard', 'sender_key', 'item', 'wait_time'])
+
+
+class QueuedMessage:
+    """
+    信箱中的一条消息
+    """
+    __slots__ = ('enqueue_time', 'item', 'lane', 'dedupe_key')
+
+    def __init__(self, item, lane, dedupe_key):
+        self.enqueue_time = time.monotonic()
+        self.item = item
+        self.lane = lane
+        self.dedupe_key = dedupe_key
+
+
+class Mailbox:
+    """
+    单个发送者的待处理消息
+    """
+    __slots__ = ('messages', 'in_flight')
+
+    def __init__(self):
+        # 元素为 QueuedMessage
+        self.messages = collections.deque()
+        # 是否有工作线程正在处理该发送者的消息
+        self.in_flight = False
+
+
+class Conversation:
+    """
+    一个会话（私聊或群）中可以处理的成员，以及本轮剩余的配额
+    """
+    __slots__ = ('ready', 'credit')
+
+    def __init__(self, credit):
+        self.ready = collections.deque()
+        self.credit = credit
+
+
+class Shard:
+    """
+    一个分片，保存哈希到该分片的所有发送者的信箱
+    """
+
+    def __init__(self, index):
+        self.index = index
+        self.lock = threading.Lock()
+        # 发送者 -> Mailbox，信箱为空且没有在处理时立即移除
+        self.mailboxes = {}
+        # 每个通道：会话 -> Conversation，只保存有可处理成员的会话
+        self.conversations = tuple({} for _ in LANES)
+        # 每个通道中有可处理成员的会话，按加权轮询的顺序排列
+        self.ready = tuple(collections.deque() for _ in LANES)
+        self.pending = 0
+        # 排队等待时间统计
+        self.wait_count = 0
+        self.wait_total = 0.0
+        self.wait_max = 0.0
+
+
+class ShardScheduler:
+    """
+    把每个会话哈希到固定分片，会话内每个发送者有自己的信箱，同一发送者同一时间只会被一个工作线程处理，
+    从而在不使用发送者锁的情况下保证消息顺序。
+
+    发送者按信箱中第一条消息的优先级进入高或低优先级通道，工作线程优先处理高优先级通道，
+    每处理 low_lane_interval 条消息会先看一次低优先级通道，避免低优先级消息一直得不到处理。
+
+    通道内的会话按加权轮询调度，一个会话每轮最多处理“权重”条消息后让给下一个会话，
+    避免一个非常活跃的群占满所有工作线程。
+
+    每个分片最多排队 max_pending / 分片数 条消息，超出时按 shed_policy 丢弃；
+    同一发送者排队中已有相同内容的消息时，新消息直接合并掉。
+
+    每个工作线程优先处理自己的分片，空闲时从其它分片窃取任务；
+    发送者的消息处理完后立即移除其状态，不会随发送者数量无限增长。
+    """
+
+    def __init__(self, num_shards, default_weight=1, max_pending=10000, shed_policy='drop_low',
+                 low_lane_interval=4):
+        """
+        Args:
+            num_shards (int): 分片数量，一般与工作线程数相同。
+            default_weight (int): 会话默认的轮询权重。
+            max_pending (int): 所有分片最多排队的消息数。
+            shed_policy (str): 队列满时的丢弃策略，见 SHED_POLICIES。
+            low_lane_interval (int): 每处理多少条消息优先看一次低优先级通道。
+        """
+        if shed_policy not in SHED_POLICIES:
+            raise ValueError(f"未知的丢弃策略：{shed_policy}")
+        self.shards = [Shard(i) for i in range(num_shards)]
+        self.default_weight = default_weight
+        self.shard_capacity = max(1, max_pending // num_shards)
+        self.shed_policy = shed_policy
+        self.low_lane_interval = low_lane_interval
+        # 会话 -> 轮询权重，未设置的会话使用默认权重
+        self.weights = {}
+        self.condition = threading.Condition()
+        # 每次有新任务可取时递增，避免工作线程错过唤醒
+        self._version = 0
+        self._take_count = 0
+
+    def set_weight(self, conversation, weight):
+        """
+        设置会话的轮询权重，权重越大每轮能连续处理的消息越多
+        """
+        self.weights[conversation] = max(1, int(weight))
+
+    def get_shard(self, sender_key):
+        """
+        返回发送者所属的分片，同一会话的发送者在同一个分片
+        """
+        return self.shards[hash(sender_key[0]) % len(self.shards)]
+
+    def put(self, sender_key, item, lane=LANE_LOW, dedupe_key=None):
+        """
+        把一条消息放入发送者所在分片的信箱
+
+        Args:
+            sender_key (tuple): (会话, 成员)。
+            item: 消息内容。
+            lane (int): 优先级通道，LANE_HIGH 或 LANE_LOW。
+            dedupe_key: 用于判断重复消息的值，为 None 时不合并。
+
+        Returns:
+            list: 因为队列已满被丢弃的消息（可能是新消息，也可能是排队中的低优先级消息）。
+        """
+        shard = self.get_shard(sender_key)
+        with shard.lock:
+            mailbox = shard.mailboxes.get(sender_key)
+            if mailbox is not None and dedupe_key is not None and any(
+                    queued.dedupe_key == dedupe_key for queued in mailbox.messages):
+                COLLAPSED_MESSAGES.inc()
+                return []
+            shed = []
+            if shard.pending >= self.shard_capacity:
+                evicted = self._evict_low(shard) if self.shed_policy == 'drop_low' and lane == LANE_HIGH else None
+                if evicted is None:
+                    SHED_MESSAGES.inc(lane=LANE_NAMES[lane])
+                    return [item]
+                SHED_MESSAGES.inc(lane=LANE_NAMES[LANE_LOW])
+                shed.append(evicted)
+                mailbox = shard.mailboxes.get(sender_key)
+            if mailbox is None:
+                mailbox = Mailbox()
+                shard.mailboxes[sender_key] = mailbox
+            mailbox.messages.append(QueuedMessage(item, lane, dedupe_key))
+            shard.pending += 1
+            if len(mailbox.messages) == 1 and not mailbox.in_flight:
+                self._make_ready(shard, sender_key)
+        self._notify()
+        return shed
+
+    @staticmethod
+    def _evict_low(shard):
+        """
+        丢弃分片中一条排队的低优先级消息，只丢弃信箱末尾的消息以保证剩余消息的顺序，调用时需持有分片锁
+
+        Returns:
+            被丢弃的消息内容，没有可丢弃的消息时返回 None。
+        """
+        for sender_key, mailbox in shard.mailboxes.items():
+            if not mailbox.messages or mailbox.messages[-1].lane != LANE_LOW:
+                continue
+            if len(mailbox.messages) == 1 and not mailbox.in_flight:
+                # 信箱将变空，需要同时从可处理队列中移除
+                conversations = shard.conversations[LANE_LOW]
+                conversation = conversations[sender_key[0]]
+                conversation.ready.remove(sender_key)
+                if not conversation.ready:
+                    del conversations[sender_key[0]]
+                    shard.ready[LANE_LOW].remove(sender_key[0])
+            evicted = mailbox.messages.pop()
+            shard.pending -= 1
+            if not mailbox.messages and not mailbox.in_flight:
+                del shard.mailboxes[sender_key]
+            return evicted.item
+        return None
+
+    def get(self, worker_index, timeout=None):
+        """
+        取出一条可以处理的消息，优先从自己的分片取，没有时从其它分片窃取。
+
+        Args:
+            worker_index (int): 工作线程序号，用于确定自己的分片。
+            timeout (float): 没有消息时最多等待的秒数。
+
+        Returns:
+            Ticket: 取到的消息，超时返回 None。处理完后必须调用 task_done。
+        """
+        num_shards = len(self.shards)
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while True:
+            with self.condition:
+                version = self._version
+                self._take_count += 1
+                lanes = LANES if self._take_count % self.low_lane_interval else LANES[::-1]
+            for lane in lanes:
+                for offset in range(num_shards):
+                    ticket = self._take(self.shards[(worker_index + offset) % num_shards], lane)
+                    if ticket is not None:
+                        return ticket
+            with self.condition:
+                if self._version != version:
+                    continue
+                if deadline is None:
+                    self.condition.wait()
+                else:
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        return None
+                    self.condition.wait(remaining)
+
+    def _make_ready(self, shard, sender_key):
+        """
+        按信箱第一条消息的优先级，把发送者放入对应通道中其会话的可处理队列，调用时需持有分片锁
+        """
+        lane = shard.mailboxes[sender_key].messages[0].lane
+        conversation_key = sender_key[0]
+        conversations = shard.conversations[lane]
+        conversation = conversations.get(conversation_key)
+        if conversation is None:
+            conversation = Conversation(self.weights.get(conversation_key, self.default_weight))
+            conversations[conversation_key] = conversation
+            shard.ready[lane].append(conversation_key)
+        conversation.ready.append(sender_key)
+
+    def _take(self, shard, lane):
+        with shard.lock:
+            ready = shard.ready[lane]
+            if not ready:
+                return None
+            conversations = shard.conversations[lane]
+            conversation_key = ready[0]
+            conversation = conversations[conversation_key]
+            sender_key = conversation.ready.popleft()
+            conversation.credit -= 1
+            if not conversation.ready:
+                # 会话没有可处理的成员了，移出轮询
+                ready.popleft()
+                del conversations[conversation_key]
+            elif conversation.credit <= 0:
+                # 本轮配额用完，排到队尾
+                ready.rotate(-1)
+                conversation.credit = self.weights.get(conversation_key, self.default_weight)
+            mailbox = shard.mailboxes[sender_key]
+            queued = mailbox.messages.popleft()
+            mailbox.in_flight = True
+            shard.pending -= 1
+            wait_time = time.monotonic() - queued.enqueue_time
+            shard.wait_count += 1
+            shard.wait_total += wait_time
+            shard.wait_max = max(shard.wait_max, wait_time)
+        return Ticket(shard, sender_key, queued.item, wait_time)
+
+    def task_done(self, ticket):
+        """
+        标记消息处理完成，该发送者后续的消息可以被处理
+        """
+        shard = ticket.shard
+        with shard.lock:
+            mailbox = shard.mailboxes[ticket.sender_key]
+            mailbox.in_flight = False
+            if mailbox.messages:
+                self._make_ready(shard, ticket.sender_key)
+            else:
+                # 发送者已空闲，移除其状态
+                del shard.mailboxes[ticket.sender_key]
+                return
+        self._notify()
+
+    def _notify(self):
+        with self.condition:
+            self._version += 1
+            self.condition.notify()
+
+    def qsize(self):
+        """
+        返回所有分片中等待处理的消息总数
+        """
+        return sum(shard.pending for shard in self.shards)
+
+    def get_stats(self):
+        """
+        返回每个分片的统计信息
+
+        Returns:
+            list of dict: 每个分片的待处理数、活跃发送者数和排队等待时间。
+        """
+        stats = []
+        for shard in self.shards:
+            with shard.lock:
+                stats.append({
+                    'shard': shard.index,
+                    'pending': shard.pending,
+                    'senders': len(shard.mailboxes),
+                    'conversations': sum(len(conversations) for conversations in shard.conversations),
+                    'wait_count': shard.wait_count,
+                    'wait_avg': shard.wait_total / shard.wait_count if shard.wait_count else 0.0,
+                    'wait_max': shard.wait_max,
+                })
+        return stats
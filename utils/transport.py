@@ -0,0 +1,81 @@
+"""
+消息收发层，机器人通过它登录、接收消息和发送回复
+"""
+
+
+class SendError(Exception):
+    """
+    发送消息失败，如被微信限流
+    """
+
+
+class Transport:
+    """
+    消息收发接口，具体实现有 itchat 和离线模拟器（utils/wechat_simulator.py）
+    """
+    # 发送队列的限速参数，见 utils/outbound_sender.OutboundSender
+    rate_limits = {}
+
+    def login(self, hot_reload=False):
+        """
+        登录账号
+        """
+        raise NotImplementedError
+
+    def get_self_profile(self):
+        """
+        返回自己的账号信息，至少包含 NickName 和 UserName
+        """
+        raise NotImplementedError
+
+    def register_handlers(self, private_handler, group_handler):
+        """
+        注册私聊和群聊文本消息的处理函数，处理函数的参数为 itchat 格式的消息字典
+        """
+        raise NotImplementedError
+
+    def send(self, message, to_user_name):
+        """
+        发送一条文本消息，失败时抛出 SendError
+        """
+        raise NotImplementedError
+
+    def run(self):
+        """
+        阻塞运行，直到停止接收消息
+        """
+        raise NotImplementedError
+
+
+class ItchatTransport(Transport):
+    """
+    使用 itchat 登录网页微信收发消息
+    """
+    # 网页微信发送过快容易被限流，保守设置
+    rate_limits = {'global_rate': 5.0, 'global_burst': 10, 'chat_rate': 1.0, 'chat_burst': 3}
+
+    def __init__(self):
+        # 在这里导入，使用模拟器时不需要安装 itchat
+        import itchat
+        from itchat.content import TEXT
+        self.itchat = itchat
+        self.text_type = TEXT
+
+    def login(self, hot_reload=False):
+        self.itchat.auto_login(hotReload=hot_reload)
+
+    def get_self_profile(self):
+        return self.itchat.search_friends()
+
+    def register_handlers(self, private_handler, group_handler):
+        self.itchat.msg_register(self.text_type, isFriendChat=True)(private_handler)
+        self.itchat.msg_register(self.text_type, isGroupChat=True)(group_handler)
+
+    def send(self, message, to_user_name):
+        result = self.itchat.send(message, toUserName=to_user_name)
+        # itchat 的返回值在 BaseResponse.Ret 不为 0 时为假
+        if not result:
+            raise SendError(result)
+
+    def run(self):
+        self.itchat.run(blockThread=True)
@@ -0,0 +1,195 @@
+"""
+离线模拟微信的消息收发层，用于在没有微信账号的情况下压测机器人
+"""
+import collections
+import logging
+import random
+import threading
+import time
+from utils.transport import Transport
+from utils.outbound_sender import COALESCE_SEPARATOR
+
+# 默认的命令组合，值为权重。聊天会调用真实的接口，默认不包含
+DEFAULT_COMMAND_MIX = {
+    '查豆子': 30,
+    '排行榜': 10,
+    '随机数': 30,
+    '领豆子': 5,
+    '21点 押100': 5,
+    '要牌': 5,
+    '停牌': 5,
+    '百家乐 介绍': 10,
+}
+
+
+def percentile(sorted_values, percent):
+    """
+    返回已排序列表的百分位数
+    """
+    if not sorted_values:
+        return 0.0
+    index = min(len(sorted_values) - 1, int(round(percent / 100 * (len(sorted_values) - 1))))
+    return sorted_values[index]
+
+
+class SimulatedTransport(Transport):
+    """
+    在进程内模拟大量好友和群，按设定的速率和命令组合发送消息，
+    记录机器人发出的每条回复，并统计吞吐量和端到端延迟。
+    """
+    # 模拟器不限流，只保留合并窗口
+    rate_limits = {'global_rate': 1e6, 'global_burst': 1e6, 'chat_rate': 1e6, 'chat_burst': 1e6}
+
+    def __init__(self, num_friends=1000, num_groups=100, members_per_group=50, group_ratio=0.5,
+                 rate=200, duration=10, command_mix=None, drain_timeout=30, seed=None):
+        """
+        Args:
+            num_friends (int): 虚拟好友数量。
+            num_groups (int): 虚拟群数量。
+            members_per_group (int): 每个群的成员数量。
+            group_ratio (float): 群消息占所有消息的比例。
+            rate (float): 每秒发送的消息数。
+            duration (float): 发送消息的时长（秒）。
+            command_mix (dict): 消息内容 -> 权重。
+            drain_timeout (float): 发送结束后等待回复的最长时间（秒）。
+            seed (int): 随机数种子。
+        """
+        self.num_friends = num_friends
+        self.num_groups = num_groups
+        self.members_per_group = members_per_group
+        self.group_ratio = group_ratio
+        self.rate = rate
+        self.duration = duration
+        self.command_mix = command_mix or DEFAULT_COMMAND_MIX
+        self.drain_timeout = drain_timeout
+        self.random = random.Random(seed)
+        self.profile = {'NickName': '豆子机器人', 'UserName': '@simulated_bot'}
+        self.private_handler = None
+        self.group_handler = None
+
+        # 发出的消息，key 为等待回复的对象，value 为发送时间的队列
+        self._pending = collections.defaultdict(collections.deque)
+        self._lock = threading.Lock()
+        self.sent_count = 0
+        self.replies = []
+        self.latencies = []
+        # 消息内容 -> 该命令的端到端延迟
+        self.command_latencies = collections.defaultdict(list)
+        self.start_time = None
+        self.end_time = None
+
+    def login(self, hot_reload=False):
+        logging.info("模拟器登录：%d 个好友，%d 个群", self.num_friends, self.num_groups)
+
+    def get_self_profile(self):
+        return dict(self.profile)
+
+    def register_handlers(self, private_handler, group_handler):
+        self.private_handler = private_handler
+        self.group_handler = group_handler
+
+    def send(self, message, to_user_name):
+        now = time.perf_counter()
+        with self._lock:
+            self.replies.append((to_user_name, message))
+            # 发送队列可能把多条回复合并成一条消息
+            for reply in message.split(COALESCE_SEPARATOR):
+                if to_user_name.startswith('@@'):
+                    # 群回复以 @昵称 开头
+                    key = (to_user_name, reply[1:].split(' ', 1)[0])
+                else:
+                    key = to_user_name
+                pending = self._pending.get(key)
+                if pending:
+                    sent_time, content = pending.popleft()
+                    self.latencies.append(now - sent_time)
+                    self.command_latencies[content].append(now - sent_time)
+                    if not pending:
+                        del self._pending[key]
+            self.end_time = now
+
+    def _make_message(self):
+        """
+        随机生成一条 itchat 格式的私聊或群消息
+
+        Returns:
+            tuple: (消息类型, 等待回复的对象, 消息内容, 消息)。
+        """
+        content = self.random.choices(list(self.command_mix), weights=list(self.command_mix.values()))[0]
+        if self.num_groups and self.random.random() < self.group_ratio:
+            group = self.random.randrange(self.num_groups)
+            member = self.random.randrange(self.members_per_group)
+            group_user_name = f'@@group_{group}'
+            nickname = f'群{group}成员{member}'
+            msg = {
+                'FromUserName': group_user_name,
+                'IsAt': True,
+                'User': {'NickName': f'群{group}', 'UserName': group_user_name},
+                'ActualNickName': nickname,
+                'ActualUserName': f'@member_{group}_{member}',
+                'Content': f"@{self.profile['NickName']} {content}",
+            }
+            return 'group', (group_user_name, nickname), content, msg
+        friend = self.random.randrange(self.num_friends)
+        user_name = f'@friend_{friend}'
+        msg = {
+            'FromUserName': user_name,
+            'User': {'NickName': f'好友{friend}', 'UserName': user_name},
+            'Text': content,
+        }
+        return 'private', user_name, content, msg
+
+    def run(self):
+        """
+        按设定的速率发送消息，发送结束后等待回复，然后返回
+        """
+        total = int(self.rate * self.duration)
+        interval = 1.0 / self.rate
+        self.start_time = time.perf_counter()
+        for index in range(total):
+            # 按计划时间发送，落后时不补睡眠
+            delay = self.start_time + index * interval - time.perf_counter()
+            if delay > 0:
+                time.sleep(delay)
+            msg_type, key, content, msg = self._make_message()
+            with self._lock:
+                self._pending[key].append((time.perf_counter(), content))
+                self.sent_count += 1
+            if msg_type == 'group':
+                self.group_handler(msg)
+            else:
+                self.private_handler(msg)
+
+        deadline = time.perf_counter() + self.drain_timeout
+        while time.perf_counter() < deadline:
+            with self._lock:
+                if not self._pending:
+                    break
+            time.sleep(0.05)
+
+    def report(self):
+        """
+        返回压测结果
+
+        Returns:
+            dict: 发送数、回复数、吞吐量（条/秒）和端到端延迟的百分位数（毫秒），commands 为每个命令的延迟。
+        """
+        with self._lock:
+            latencies = sorted(self.latencies)
+            commands = {}
+            for content, values in self.command_latencies.items():
+                values = sorted(values)
+                commands[content] = {'replied': len(values), 'p50_ms': percentile(values, 50) * 1000,
+                                     'p99_ms': percentile(values, 99) * 1000}
+            unanswered = sum(len(pending) for pending in self._pending.values())
+            elapsed = (self.end_time or self.start_time) - self.start_time if self.start_time else 0.0
+        return {
+            'sent': self.sent_count,
+            'replied': len(latencies),
+            'unanswered': unanswered,
+            'throughput': len(latencies) / elapsed if elapsed > 0 else 0.0,
+            'p50_ms': percentile(latencies, 50) * 1000,
+            'p95_ms': percentile(latencies, 95) * 1000,
+            'p99_ms': percentile(latencies, 99) * 1000,
+            'commands': commands,
+        }